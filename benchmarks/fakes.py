@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import re
+import time
+import types
+import typing
+
+__all__ = [
+    "FakeCursor",
+    "FakeGeminiClient",
+    "CANNED_AI_ANSWER",
+]
+
+
+class FakeCursor:
+    """
+    In-process stand-in for a mysql-connector cursor: accepts every statement,
+    counts round trips and rows, and optionally sleeps to mimic network latency
+    """
+
+    def __init__(self, round_trip_s: float = 0.0):
+        self.round_trip_s = round_trip_s
+        self.round_trips = 0
+        self.rows = 0
+        self.rowcount = 0
+        self._result: list[tuple] = []
+
+    def _round_trip(self) -> None:
+        self.round_trips += 1
+        if self.round_trip_s:
+            time.sleep(self.round_trip_s)
+        return None
+
+    def execute(self, sql: str, params: typing.Any = None) -> None:
+        self._round_trip()
+        self.rows += 1
+        self.rowcount = 1
+        self._result = []
+        return None
+
+    def executemany(self, sql: str, seq_params: typing.Sequence[typing.Any]) -> None:
+        self._round_trip()
+        self.rows += len(seq_params)
+        self.rowcount = len(seq_params)
+        self._result = []
+        return None
+
+    def fetchall(self) -> list[tuple]:
+        return self._result
+
+    def fetchone(self) -> tuple | None:
+        return self._result[0] if self._result else None
+
+    def close(self) -> None:
+        return None
+
+
+CANNED_AI_ANSWER = {
+    "allowed_with_pets": True,
+    "availability_date": "od zaraz",
+    "bedroom_number": 2,
+    "kitchen_combined_with_living_room": False,
+    "occasional_lease": True,
+    "deposit": 6000,
+    "has_ac": False,
+    "street": "Marszałkowska",
+    "street_number": "10",
+}
+
+LISTING_ID_RE = re.compile(r"^Listing ID: (\S+)$", re.MULTILINE)
+CHARS_PER_TOKEN = 4
+
+
+class _Models:
+    def __init__(self, client: FakeGeminiClient):
+        self.client = client
+
+    def generate_content(self, model: str, contents: str, config: dict) -> typing.Any:
+        client = self.client
+        client.calls += 1
+        if client.latency_s:
+            time.sleep(client.latency_s)
+        schema = config["response_schema"]
+        if typing.get_origin(schema) is list:
+            (item_schema,) = typing.get_args(schema)
+            parsed = [
+                item_schema.model_validate(
+                    {**client.answer_for(item_schema), "listing_id": listing_id}
+                )
+                for listing_id in LISTING_ID_RE.findall(contents)
+            ]
+        else:
+            parsed = schema.model_validate(client.answer_for(schema))
+        usage = types.SimpleNamespace(
+            prompt_token_count=len(contents) // CHARS_PER_TOKEN,
+            candidates_token_count=40 * (len(parsed) if isinstance(parsed, list) else 1),
+        )
+        return types.SimpleNamespace(parsed=parsed, usage_metadata=usage)
+
+
+class FakeGeminiClient:
+    """
+    Canned responder with the shape of google.genai.Client: returns the same
+    answer for every listing, in the structure the response_schema asks for
+    """
+
+    def __init__(self, latency_s: float = 0.0, answer: dict | None = None):
+        self.latency_s = latency_s
+        self.answer = CANNED_AI_ANSWER if answer is None else answer
+        self.calls = 0
+        self.models = _Models(self)
+
+    def answer_for(self, schema: typing.Any) -> dict:
+        return {k: v for k, v in self.answer.items() if k in schema.model_fields}
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import random
+
+__all__ = [
+    "otodom_search_data",
+    "otodom_search_page",
+    "otodom_ad_data",
+    "otodom_ad_page",
+    "html_page",
+    "olx_item",
+    "olx_search_body",
+    "olx_search_response",
+    "load_corpus",
+    "FIXTURES_DIR",
+]
+
+
+# Recorded pages dropped here (one file per page) replace the synthetic ones:
+# otodom_search/*.html, otodom_ad/*.html, olx_search/*.json
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+BUILD_ID = "bench"
+
+STREETS = ["Marszałkowska", "Puławska", "Grójecka", "Mokotowska", "Hoża", "Wilcza"]
+DISTRICTS = ["Mokotów", "Śródmieście", "Wola", "Ochota", "Praga-Południe"]
+ROOMS = ["ONE", "TWO", "THREE", "FOUR", "FIVE"]
+EXTRAS = ["balcony", "lift", "air_conditioning", "garage", "basement"]
+WORDS = (
+    "mieszkanie przestronne jasne ciche blisko metra po remoncie w pełni "
+    "umeblowane z balkonem widok na park kuchnia aneks sypialnia łazienka"
+).split()
+
+# Real pages carry a lot of markup and scripts before __NEXT_DATA__, the last script
+PAGE_SHELL = """<!DOCTYPE html><html lang="pl"><head><meta charset="utf-8">
+<title>Otodom</title>{head_scripts}</head><body><div id="__next">{body}</div>
+{tail_scripts}
+<script id="__NEXT_DATA__" type="application/json">{next_data}</script>
+</body></html>"""
+
+
+def _text(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def _number(rng: random.Random, value: int) -> int | float | str:
+    return rng.choice([value, float(value), str(value)])
+
+
+def html_page(rng: random.Random, next_data: dict) -> str:
+    head_scripts = "".join(
+        f'<script src="/_next/static/chunks/{rng.getrandbits(64):x}.js" defer></script>'
+        for _ in range(40)
+    )
+    body = "".join(
+        f'<div class="css-{rng.getrandbits(32):x}"><span>{_text(rng, 12)}</span></div>'
+        for _ in range(300)
+    )
+    tail_scripts = "".join(
+        f"<script>self.__next_f.push([1,{json.dumps(_text(rng, 60))}])</script>"
+        for _ in range(30)
+    )
+    res = PAGE_SHELL.format(
+        head_scripts=head_scripts,
+        body=body,
+        next_data=json.dumps(next_data, ensure_ascii=False),
+        tail_scripts=tail_scripts,
+    )
+    return res
+
+
+def _otodom_search_item(rng: random.Random, listing_id: int) -> dict:
+    created = datetime.datetime(2026, 10, 1) + datetime.timedelta(
+        minutes=rng.randrange(60 * 24 * 17)
+    )
+    district = rng.choice(DISTRICTS)
+    res = {
+        "id": listing_id,
+        "title": _text(rng, 8),
+        "slug": f"mieszkanie-{listing_id}-ID{listing_id:x}",
+        "estate": "FLAT",
+        "transaction": "RENT",
+        "totalPrice": {"value": rng.randrange(3000, 12000), "currency": "PLN"},
+        "rentPrice": {"value": rng.randrange(300, 1200), "currency": "PLN"},
+        "areaInSquareMeters": round(rng.uniform(30, 140), 1),
+        "roomsNumber": rng.choice(ROOMS),
+        "dateCreatedFirst": created.strftime("%Y-%m-%d %H:%M:%S"),
+        "shortDescription": _text(rng, 40),
+        "images": [
+            {
+                "medium": f"https://ireland.apollo.olxcdn.com/v1/files/{rng.getrandbits(64):x}/image;s=655x491",
+                "large": f"https://ireland.apollo.olxcdn.com/v1/files/{rng.getrandbits(64):x}/image;s=1280x1024",
+            }
+            for _ in range(8)
+        ],
+        "location": {
+            "address": {
+                "street": {
+                    "name": rng.choice(STREETS),
+                    "number": str(rng.randrange(1, 200)),
+                },
+                "city": {"name": "Warszawa"},
+            },
+            "reverseGeocoding": {
+                "locations": [
+                    {"fullName": "mazowieckie"},
+                    {"fullName": "Warszawa, mazowieckie"},
+                    {"fullName": f"{district}, Warszawa, mazowieckie"},
+                    {"fullName": f"{district} Górny, {district}, Warszawa"},
+                ]
+            },
+        },
+    }
+    return res
+
+
+def otodom_search_data(n_items: int = 36, seed: int = 0) -> dict:
+    """
+    The __NEXT_DATA__ of a search page
+    """
+    rng = random.Random(seed)
+    items = [
+        _otodom_search_item(rng, 60_000_000 + seed * 1000 + i) for i in range(n_items)
+    ]
+    # ListingItemOtodom.from_text drops the last item (a promoted one on real pages)
+    items.append(_otodom_search_item(rng, 1))
+    res = {
+        "props": {"pageProps": {"data": {"searchAds": {"items": items}}}},
+        "page": "/pl/wyniki/[[...searchingCriteria]]",
+        "buildId": BUILD_ID,
+    }
+    return res
+
+
+def otodom_search_page(n_items: int = 36, seed: int = 0) -> str:
+    return html_page(random.Random(seed), otodom_search_data(n_items, seed))
+
+
+def otodom_ad_page(listing_id: int = 60_000_000, seed: int = 0) -> str:
+    return html_page(random.Random(seed), otodom_ad_data(listing_id, seed))
+
+
+def otodom_ad_data(listing_id: int = 60_000_000, seed: int = 0) -> dict:
+    """
+    The __NEXT_DATA__ of an ad page
+    """
+    rng = random.Random(seed)
+    paragraphs = "".join(f"<p>{_text(rng, 50)}</p>" for _ in range(6))
+    ad = {
+        "id": str(listing_id),
+        "title": _text(rng, 8),
+        "description": f"<div>{paragraphs}<ul><li>{_text(rng, 10)}</li></ul></div>",
+        "target": {
+            "Floor_no": [rng.choice(["ground_floor", "floor_2", "floor_5", "cellar"])],
+            # The site is not consistent about numbers in strings, nor are these
+            "Building_floors_num": _number(rng, rng.randrange(2, 12)),
+            "Extras_types": rng.sample(EXTRAS, 3),
+            "Windows_type": ["plastic"],
+            "Deposit": _number(rng, rng.randrange(3000, 12000)),
+        },
+        "topInformation": [
+            {"label": "free_from", "values": ["2026-11-01"]},
+            {"label": "rent", "values": [str(rng.randrange(300, 1200))]},
+        ],
+        "location": {
+            "coordinates": {
+                "latitude": 52.23 + rng.uniform(-0.08, 0.08),
+                "longitude": 21.01 + rng.uniform(-0.12, 0.12),
+            }
+        },
+        "images": [
+            {"large": f"https://ireland.apollo.olxcdn.com/v1/files/{rng.getrandbits(64):x}/image"}
+            for _ in range(15)
+        ],
+    }
+    res = {
+        "props": {"pageProps": {"ad": ad}},
+        "page": "/pl/oferta/[slug]",
+        "buildId": BUILD_ID,
+    }
+    return res
+
+
+def olx_item(rng: random.Random, listing_id: int, price: int | None = None) -> dict:
+    price = rng.randrange(3000, 12000) if price is None else price
+    res = {
+        "id": listing_id,
+        "title": _text(rng, 8),
+        "url": f"https://www.olx.pl/d/oferta/mieszkanie-{listing_id}-CID3-ID{listing_id:x}.html",
+        "created_time": "2026-10-17T12:00:00+02:00",
+        "description": _text(rng, 200),
+        "external_url": None,
+        "location": {"district": {"name": rng.choice(DISTRICTS)}},
+        "map": {
+            "lat": 52.23 + rng.uniform(-0.08, 0.08),
+            "lon": 21.01 + rng.uniform(-0.12, 0.12),
+        },
+        "params": [
+            {"key": "price", "value": {"value": _number(rng, price)}},
+            {"key": "rooms", "value": {"key": "three", "label": "3 pokoje"}},
+            {"key": "m", "value": {"key": "64", "label": "64 m²"}},
+            {"key": "rent", "value": {"key": "700", "label": "700 zł"}},
+            {"key": "floor_select", "value": {"key": "floor_3", "label": "3"}},
+            {"key": "pets", "value": {"key": "Tak", "label": "Tak"}},
+            {"key": "winda", "value": {"key": "Nie", "label": "Nie"}},
+        ],
+    }
+    return res
+
+
+def olx_search_response(n_items: int = 40, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    items = [olx_item(rng, 900_000_000 + seed * 1000 + i) for i in range(n_items)]
+    return olx_search_body(items, total_elements=1000)
+
+
+def olx_search_body(items: list[dict], total_elements: int) -> str:
+    body = {
+        "data": {
+            "clientCompatibleListings": {
+                "__typename": "ListingSuccess",
+                "data": items,
+                "metadata": {"total_elements": total_elements},
+            }
+        }
+    }
+    return json.dumps(body, ensure_ascii=False)
+
+
+SYNTHETIC = {
+    "otodom_search": lambda seed: otodom_search_page(seed=seed),
+    "otodom_ad": lambda seed: otodom_ad_page(60_000_000 + seed, seed=seed),
+    "olx_search": lambda seed: olx_search_response(seed=seed),
+}
+
+
+def load_corpus(kind: str, n_pages: int) -> list[str]:
+    """
+    Recorded pages of `kind` if there are any, synthetic ones otherwise
+    """
+    directory = os.path.join(FIXTURES_DIR, kind)
+    if os.path.isdir(directory):
+        names = sorted(os.listdir(directory))
+        if names:
+            res = []
+            for name in names[:n_pages]:
+                with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                    res.append(f.read())
+            return res
+    res = [SYNTHETIC[kind](seed) for seed in range(n_pages)]
+    return res
@@ -0,0 +1,119 @@
+"""
+Import-time budget of the runners.
+
+    python -m benchmarks.imports            # check every runner against its budget
+    python -m benchmarks.imports --repeat 5
+
+Each runner module is imported in a fresh interpreter with -X importtime.
+Exits with 1 when one takes longer than its budget, or when it pulls in a
+module it should only load on first use (Gemini SDK, BeautifulSoup, ...).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+
+import pydantic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by the code paths that need them, never at import time
+DEFERRED_MODULES = (
+    "google.genai",
+    "ua_generator",
+    "bs4",
+    "numpy",
+    "zstandard",
+)
+
+
+class ImportBudget(pydantic.BaseModel):
+    module: str
+    budget_ms: float
+    # Modules on top of DEFERRED_MODULES that must not be imported
+    deferred: tuple[str, ...] = ()
+
+
+BUDGETS = [
+    ImportBudget(
+        module="runners.liveness_checker",
+        budget_ms=500,
+        deferred=("helpers.models_otodom", "helpers.models_olx"),
+    ),
+    ImportBudget(module="runners.updater", budget_ms=600),
+    ImportBudget(module="runners.reparse", budget_ms=600),
+    ImportBudget(module="runners.scheduler", budget_ms=600),
+]
+
+
+class ImportResult(pydantic.BaseModel):
+    module: str
+    ms: float
+    loaded_deferred: list[str]
+
+
+PROBE = """
+import sys
+import {module}
+print(",".join(m for m in {deferred!r} if m in sys.modules))
+"""
+
+
+def measure(budget: ImportBudget, repeat: int) -> ImportResult:
+    deferred = DEFERRED_MODULES + budget.deferred
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    env.setdefault("CITY", "Warsaw")
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                PROBE.format(module=budget.module, deferred=deferred),
+            ],
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+            env=env,
+            check=True,
+        )
+        # "import time: self [us] | cumulative | imported package"
+        for line in proc.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == budget.module:
+                timings.append(int(parts[1]) / 1000)
+        loaded = [x for x in proc.stdout.strip().split(",") if x]
+    res = ImportResult(module=budget.module, ms=min(timings), loaded_deferred=loaded)
+    return res
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    failures = []
+    for budget in BUDGETS:
+        result = measure(budget, args.repeat)
+        print(
+            f"{result.module:<28}{result.ms:>9.1f} ms  (budget {budget.budget_ms:.0f} ms)"
+        )
+        if result.ms > budget.budget_ms:
+            failures.append(f"{result.module} took {result.ms:.1f} ms")
+        if result.loaded_deferred:
+            failures.append(
+                f"{result.module} imports {', '.join(result.loaded_deferred)}"
+            )
+    for line in failures:
+        print(f"OVER BUDGET {line}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
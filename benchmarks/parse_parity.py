@@ -0,0 +1,129 @@
+"""
+Check that the parsers build the models validation would have built.
+
+    python -m benchmarks.parse_parity
+    python -m benchmarks.parse_parity --pages 20
+    python -m benchmarks.parse_parity --archive      # real pages of the page archive
+
+Parses a corpus with parse_models in this process and again through a
+process-mode ParseExecutor, and validates every built model in pydantic's
+strict mode. Exits with 1 when the two paths differ in type or in any field
+value (excluded fields included), or when a parser hands Saveable.build a
+value of the wrong type, which strict validation would have rejected.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+os.environ.setdefault("CITY", "Warsaw")
+os.environ["AI_CACHE_PATH"] = ""
+os.environ["METRICS_DIR"] = ""
+
+import pydantic
+
+from benchmarks.fixtures import load_corpus
+from helpers.page_archive import PageKind, get_page_archive
+from helpers.parse_executor import ParseExecutor, ParseMode, parse_models
+from helpers.services import Service
+
+# (corpus, service, page kind)
+CORPORA = [
+    ("otodom_search", Service.Otodom, PageKind.Search),
+    ("otodom_ad", Service.Otodom, PageKind.Ad),
+    ("olx_search", Service.OLX, PageKind.Search),
+]
+
+Page = tuple[str | None, str | None]
+
+
+def fixture_pages(corpus: str, kind: str, n_pages: int) -> list[Page]:
+    res = [
+        (text, str(60_000_000 + i) if kind == PageKind.Ad else None)
+        for i, text in enumerate(load_corpus(corpus, n_pages))
+    ]
+    return res
+
+
+def archived_pages(service: Service, kind: str, n_pages: int) -> list[Page]:
+    """
+    The latest n_pages pages of the archive, as the crawl fetched them
+    """
+    archive = get_page_archive()
+    if archive is None:
+        return []
+    entries = list(archive.pages(service.value, kind))[-n_pages:]
+    res = [(archive.read(x.sha256), x.listing_id) for x in entries]
+    return res
+
+
+def strict_errors(label: str, model: pydantic.BaseModel) -> list[str]:
+    try:
+        type(model).model_validate(model.__dict__, strict=True)
+    except pydantic.ValidationError as e:
+        return [
+            f"{label} {'.'.join(map(str, x['loc']))}: {x['input']!r} ({x['msg']})"
+            for x in e.errors()
+        ]
+    return []
+
+
+def compare(
+    corpus: str, service: Service, kind: str, pages: list[Page], city: str
+) -> list[str]:
+    inline = [parse_models(service, kind, text, city, lid) for text, lid in pages]
+    executor = ParseExecutor(mode=ParseMode.Process, workers=2)
+    try:
+        process = list(executor.map(service, kind, pages, city))
+    finally:
+        executor.shutdown()
+
+    failures = []
+    for i, (expected, got) in enumerate(zip(inline, process)):
+        if len(expected) != len(got):
+            failures.append(f"{corpus} page {i}: {len(expected)} != {len(got)} models")
+            continue
+        for a, b in zip(expected, got):
+            failures.extend(strict_errors(f"{corpus} page {i}", a))
+            if type(a) is not type(b):
+                failures.append(f"{corpus} page {i}: {type(a)} != {type(b)}")
+                continue
+            for field in type(a).model_fields:
+                if getattr(a, field) != getattr(b, field):
+                    failures.append(
+                        f"{corpus} page {i} {field}: "
+                        f"{getattr(a, field)!r} != {getattr(b, field)!r}"
+                    )
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="check the latest pages of PAGE_ARCHIVE_DIR instead of the fixtures",
+    )
+    parser.add_argument("--city", default=os.environ["CITY"])
+    args = parser.parse_args(argv)
+
+    failures = []
+    for corpus, service, kind in CORPORA:
+        if args.archive:
+            pages = archived_pages(service, kind, args.pages)
+        else:
+            pages = fixture_pages(corpus, kind, args.pages)
+        res = compare(corpus, service, kind, pages, args.city)
+        status = "ok" if not res else f"{len(res)} differences"
+        print(f"{corpus:<16}{len(pages):>5} pages  {status}")
+        failures.extend(res)
+    for line in failures[:50]:
+        print(f"MISMATCH {line}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Stand-in for otodom.pl, olx.pl and api.telegram.org.
+
+    python -m benchmarks.replay_server --port 8800 --recordings data/recordings \\
+        --latency-ms 80 --jitter-ms 40 --error-rate 0.01 \\
+        --burst-every-s 120 --burst-length-s 10 --scale 5
+
+Point the runners at it with HTTP_REPLAY_URL=http://127.0.0.1:8800; record
+real traffic for it with HTTP_RECORD_DIR=data/recordings (all but Telegram,
+whose URLs carry the bot token). Recorded responses win; everything else is
+synthesized from benchmarks.fixtures, with the search corpus `--scale` times
+the size of the default one. Gemini is not served here, it goes through its
+SDK (see benchmarks.fakes.FakeGeminiClient).
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+import pydantic
+
+from benchmarks import fixtures
+from helpers.http_replay import (
+    REPLAY_HOST_HEADER,
+    REPLAY_SCHEME_HEADER,
+    normalize_body,
+    recording_key,
+)
+
+__all__ = [
+    "ReplayServerConfig",
+    "ReplayServer",
+]
+
+
+OTODOM_PAGE_SIZE = 36
+OLX_PAGE_SIZE = 40
+OLX_MAX_OFFSET = 1000
+AD_SLUG_ID_RE = re.compile(r"-(\d+)-ID")
+OLX_AD_ID_RE = re.compile(r"-(\d+)-CID")
+
+
+class ReplayServerConfig(pydantic.BaseModel):
+    recordings: str | None = None
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # Share of requests answered with a 503
+    error_rate: float = 0.0
+    # Every `burst_every_s` seconds a host answers 429 for `burst_length_s`
+    burst_every_s: float = 0.0
+    burst_length_s: float = 0.0
+    retry_after_s: float = 5.0
+    # Size of the synthetic corpora relative to the default one
+    scale: int = 1
+    # Share of ads whose pages are gone (for liveness checks)
+    dead_rate: float = 0.0
+    seed: int = 0
+
+    @property
+    def otodom_pages(self) -> int:
+        return 25 * self.scale
+
+    @property
+    def olx_listings(self) -> int:
+        return 1000 * self.scale
+
+
+class Recordings:
+    def __init__(self, directory: str | None):
+        self.entries: dict[str, dict] = {}
+        if not directory or not os.path.isdir(directory):
+            return
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith(".json"):
+                    with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                    key = recording_key(
+                        entry["method"], entry["url"], entry["request_body"]
+                    )
+                    self.entries[key] = entry
+
+    def find(self, method: str, url: str, body: str) -> dict | None:
+        return self.entries.get(recording_key(method, url, body))
+
+
+class Response(pydantic.BaseModel):
+    status: int = 200
+    body: str = ""
+    content_type: str = "text/html; charset=utf-8"
+    headers: dict[str, str] = pydantic.Field(default_factory=dict)
+
+
+def json_response(body: dict | str, status: int = 200) -> Response:
+    text = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)
+    return Response(status=status, body=text, content_type="application/json")
+
+
+class Synthesizer:
+    """
+    Answers requests nothing was recorded for, shaped like the real sites
+    """
+
+    def __init__(self, config: ReplayServerConfig):
+        self.config = config
+        # Prices of the OLX listings of the scaled corpus, by listing index
+        rng = random.Random(config.seed)
+        self.olx_prices = [
+            rng.randrange(1500, 20000) for _ in range(config.olx_listings)
+        ]
+
+    def is_dead(self, path: str) -> bool:
+        if not self.config.dead_rate:
+            return False
+        rng = random.Random(f"{self.config.seed}:{path}")
+        return rng.random() < self.config.dead_rate
+
+    def otodom(self, method: str, path: str, query: dict) -> Response:
+        if path.startswith("/_next/data/"):
+            _, _, _, build_id, rest = path.split("/", 4)
+            if build_id != fixtures.BUILD_ID:
+                return Response(status=404, body="Not found")
+            next_data = self.otodom_next_data("/" + rest.removesuffix(".json"), query)
+            if next_data is None:
+                return Response(status=404, body="Not found")
+            return json_response({"pageProps": next_data["props"]["pageProps"]})
+        if method == "HEAD":
+            return Response(status=404 if self.is_dead(path) else 200)
+        next_data = self.otodom_next_data(path, query)
+        if next_data is None:
+            return Response(status=404, body="Not found")
+        return Response(body=fixtures.html_page(random.Random(path), next_data))
+
+    def otodom_next_data(self, path: str, query: dict) -> dict | None:
+        if path.startswith("/pl/wyniki/"):
+            page = int(query.get("page", ["1"])[0])
+            n_items = OTODOM_PAGE_SIZE if page <= self.config.otodom_pages else 0
+            return fixtures.otodom_search_data(n_items=n_items, seed=page - 1)
+        if path.startswith("/pl/oferta/"):
+            if self.is_dead(path):
+                # Removed ads redirect to the search; the HTML parser knows this page
+                return {
+                    "props": {"pageProps": {}},
+                    "page": "/pl/wyniki/[[...searchingCriteria]]",
+                }
+            match = AD_SLUG_ID_RE.search(path)
+            listing_id = int(match.group(1)) if match else 60_000_000
+            return fixtures.otodom_ad_data(listing_id, seed=listing_id)
+        return None
+
+    def olx(self, method: str, path: str, body: str) -> Response:
+        if path.startswith("/apigateway/graphql") and method == "POST":
+            return json_response(self.olx_search(body))
+        if self.is_dead(path):
+            return Response(status=404, body="Not found")
+        match = OLX_AD_ID_RE.search(path)
+        title = match.group(1) if match else "ogłoszenie"
+        return Response(body=f"<html><body><h1>{title}</h1></body></html>")
+
+    def olx_search(self, body: str) -> str:
+        variables = json.loads(body or "{}").get("variables", {})
+        params = {
+            x["key"]: x["value"] for x in variables.get("searchParameters", [])
+        }
+        low = float(params.get("filter_float_price:from", 0))
+        high = float(params.get("filter_float_price:to", float("inf")))
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", OLX_PAGE_SIZE))
+        matching = [
+            (i, price)
+            for i, price in enumerate(self.olx_prices)
+            if low <= price <= high
+        ]
+        page = matching[offset : offset + limit] if offset <= OLX_MAX_OFFSET else []
+        items = [
+            fixtures.olx_item(random.Random(i), 900_000_000 + i, price=price)
+            for i, price in page
+        ]
+        return fixtures.olx_search_body(items, total_elements=len(matching))
+
+    @staticmethod
+    def telegram() -> Response:
+        res = json_response(
+            {
+                "ok": True,
+                "result": {"message_id": int(time.time() * 1000) % 1_000_000},
+            }
+        )
+        return res
+
+    def answer(
+        self, method: str, host: str, path: str, query: dict, body: str
+    ) -> Response:
+        if host.endswith("otodom.pl"):
+            return self.otodom(method, path, query)
+        if host.endswith("olx.pl"):
+            return self.olx(method, path, body)
+        if host == "api.telegram.org":
+            return self.telegram()
+        return Response(status=404, body=f"Nothing to replay for {host}")
+
+
+class ReplayServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: ReplayServerConfig):
+        super().__init__(address, ReplayHandler)
+        self.config = config
+        self.recordings = Recordings(config.recordings)
+        self.synthesizer = Synthesizer(config)
+        self.started = time.monotonic()
+        self.request_counts: collections.Counter[tuple[str, int]] = (
+            collections.Counter()
+        )
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def rng(self) -> random.Random:
+        # Reproducible for a given request order, whatever thread serves it
+        with self._lock:
+            self._counter += 1
+            n = self._counter
+        return random.Random(f"{self.config.seed}:{n}")
+
+    def in_burst(self, host: str) -> bool:
+        if not self.config.burst_every_s:
+            return False
+        # Hosts burst out of phase, like independent sites would
+        offset = zlib.crc32(host.encode("utf-8")) % 997
+        phase = (time.monotonic() - self.started + offset) % self.config.burst_every_s
+        return phase < self.config.burst_length_s
+
+    def respond(
+        self, method: str, host: str, scheme: str, target: str, raw_body: bytes
+    ) -> Response:
+        config = self.config
+        rng = self.rng()
+        delay_ms = max(0.0, config.latency_ms + rng.uniform(-1, 1) * config.jitter_ms)
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        if self.in_burst(host):
+            return Response(
+                status=429,
+                body="Too Many Requests",
+                headers={"Retry-After": str(int(config.retry_after_s))},
+            )
+        if rng.random() < config.error_rate:
+            return Response(status=503, body="Service Unavailable")
+
+        body = normalize_body(raw_body)
+        parsed = urlparse(target)
+        recorded = self.recordings.find(method, f"{scheme}://{host}{target}", body)
+        if recorded is not None:
+            headers = dict(recorded["headers"])
+            content_type = headers.pop("Content-Type", "text/html; charset=utf-8")
+            return Response(
+                status=recorded["status"],
+                body=recorded["body"],
+                content_type=content_type,
+                headers=headers,
+            )
+        return self.synthesizer.answer(
+            method, host, parsed.path, parse_qs(parsed.query), body
+        )
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: ReplayServer
+
+    def log_message(self, format, *args):
+        return None
+
+    def _handle(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        host = self.headers.get(REPLAY_HOST_HEADER) or self.headers.get("Host", "")
+        scheme = self.headers.get(REPLAY_SCHEME_HEADER, "https")
+        response = self.server.respond(method, host, scheme, self.path, raw_body)
+        self.server.request_counts[(host, response.status)] += 1
+
+        payload = response.body.encode("utf-8")
+        self.send_response(response.status)
+        self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in response.headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(payload)
+        return None
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_HEAD(self):
+        self._handle("HEAD")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    for name, field in ReplayServerConfig.model_fields.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=type(field.default) if field.default is not None else str,
+            default=field.default,
+        )
+    args = vars(parser.parse_args(argv))
+    host, port = args.pop("host"), args.pop("port")
+    config = ReplayServerConfig(**args)
+    server = ReplayServer((host, port), config)
+    print(f"Replaying on http://{host}:{server.server_port} with {config}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(dict(server.request_counts))
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Offline benchmarks of the parsing and persistence paths.
+
+    python -m benchmarks.run                      # run, compare with baseline.json
+    python -m benchmarks.run --update-baseline    # run, store results as the baseline
+    python -m benchmarks.run --only otodom_ad_parse olx_search_parse
+
+Exits with 1 when a benchmark got slower (p50) or hungrier (peak memory)
+than the baseline by more than --tolerance.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import typing
+
+# Everything runs offline: no AI cache on disk, no metrics files
+os.environ.setdefault("CITY", "Warsaw")
+os.environ["AI_CACHE_PATH"] = ""
+os.environ["METRICS_DIR"] = ""
+
+import pydantic
+
+from benchmarks.fakes import FakeCursor, FakeGeminiClient
+from benchmarks.fixtures import load_corpus
+from helpers.city import get_city
+from helpers.extractor import extract_ai_info, query_ai_batch
+from helpers.helper_functions import dist_from_root
+from helpers.models_olx import ListingItemOLX
+from helpers.models_otodom import ListingAdditionalInfoOtodom, ListingItemOtodom
+from helpers.notifier import COLUMN_NAMES, format_msg
+from helpers.rate_limiter import BucketConfig, GEMINI_BUDGET, get_scheduler
+from helpers.services import Service
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Benchmark(pydantic.BaseModel):
+    name: str
+    # Called once per input, returns how many items it processed
+    func: typing.Callable[[typing.Any], int]
+    inputs: list[typing.Any]
+
+
+class BenchmarkResult(pydantic.BaseModel):
+    name: str
+    calls: int
+    items: int
+    items_per_s: float
+    p50_ms: float
+    p99_ms: float
+    peak_memory_kb: float
+
+
+def percentile(values: list[float], q: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def measure(bench: Benchmark, repeat: int) -> BenchmarkResult:
+    for x in bench.inputs[:2]:
+        bench.func(x)  # warm-up: imports, caches, schema builds
+
+    durations = []
+    items = 0
+    gc.collect()
+    for _ in range(repeat):
+        for x in bench.inputs:
+            start = time.perf_counter()
+            items += bench.func(x)
+            durations.append(time.perf_counter() - start)
+
+    # Separate pass, tracemalloc slows everything down
+    tracemalloc.start()
+    for x in bench.inputs:
+        bench.func(x)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    res = BenchmarkResult(
+        name=bench.name,
+        calls=len(durations),
+        items=items,
+        items_per_s=items / sum(durations),
+        p50_ms=percentile(durations, 50) * 1000,
+        p99_ms=percentile(durations, 99) * 1000,
+        peak_memory_kb=peak / 1024,
+    )
+    return res
+
+
+def build_benchmarks(n_pages: int) -> list[Benchmark]:
+    otodom_search = load_corpus("otodom_search", n_pages)
+    otodom_ads = load_corpus("otodom_ad", n_pages)
+    olx_search = load_corpus("olx_search", n_pages)
+
+    otodom_items = [ListingItemOtodom.from_text(x, "Warsaw") for x in otodom_search]
+    ad_infos = [
+        ListingAdditionalInfoOtodom.from_text(x, listing_id=str(i), city="Warsaw")
+        for i, x in enumerate(otodom_ads)
+    ]
+    coordinates = [
+        (float(x.latitude), float(x.longitude))
+        for x in ad_infos
+        if isinstance(x, ListingAdditionalInfoOtodom)
+    ]
+    notification_rows = [
+        {
+            **{column: None for column in COLUMN_NAMES},
+            **item.model_dump(),
+            "total_rent_price": item.rent_price,
+            "distance_from_center_km": 3.2,
+            "latitude": "52.2",
+            "longitude": "21.0",
+            "url": f"https://www.otodom.pl/pl/oferta/{item.slug}",
+        }
+        for page in otodom_items
+        for item in page
+    ]
+    ai_texts = [
+        x.description_long
+        for x in ad_infos
+        if isinstance(x, ListingAdditionalInfoOtodom)
+    ]
+
+    ai_client = FakeGeminiClient()
+    # The canned responder has no quota to protect
+    get_scheduler().configs[GEMINI_BUDGET] = BucketConfig(
+        rate=1e6, min_rate=1e6, max_rate=1e6, burst=1e6, jitter_s=0
+    )
+
+    def to_db(items: list[ListingItemOtodom]) -> int:
+        cursor = FakeCursor()
+        for item in items:
+            item.to_db(cursor)
+        return len(items)
+
+    def bulk_to_db(items: list[ListingItemOtodom]) -> int:
+        ListingItemOtodom.bulk_to_db(FakeCursor(), items)
+        return len(items)
+
+    # Single calls of these are too fast to time, so they are measured in chunks
+    coordinate_chunks = [coordinates * (1000 // max(1, len(coordinates)))] * n_pages
+    notification_chunks = [
+        notification_rows[i : i + 100] for i in range(0, len(notification_rows), 100)
+    ]
+
+    def dist(coords: list[tuple[float, float]]) -> int:
+        for lat, lon in coords:
+            dist_from_root("Warsaw", lat, lon)
+        return len(coords)
+
+    def format_msgs(rows: list[dict]) -> int:
+        for row in rows:
+            format_msg(row, get_city("Warsaw"))
+        return len(rows)
+
+    def ai_single(text: str) -> int:
+        extract_ai_info("1", text, ai_client, Service.Otodom, "Warsaw")
+        return 1
+
+    def ai_batch(texts: list[str]) -> int:
+        items = [(str(i), x) for i, x in enumerate(texts)]
+        query_ai_batch(items, ai_client, Service.Otodom)
+        return len(items)
+
+    res = [
+        Benchmark(
+            name="otodom_search_parse",
+            func=lambda x: len(ListingItemOtodom.from_text(x, "Warsaw")),
+            inputs=otodom_search,
+        ),
+        Benchmark(
+            name="otodom_ad_parse",
+            func=lambda x: bool(
+                ListingAdditionalInfoOtodom.from_text(x, listing_id="1", city="Warsaw")
+            ),
+            inputs=otodom_ads,
+        ),
+        Benchmark(
+            name="olx_search_parse",
+            func=lambda x: len(ListingItemOLX.from_text(x, "Warsaw")),
+            inputs=olx_search,
+        ),
+        Benchmark(name="to_db", func=to_db, inputs=otodom_items),
+        Benchmark(name="bulk_to_db", func=bulk_to_db, inputs=otodom_items),
+        Benchmark(name="dist_from_root", func=dist, inputs=coordinate_chunks),
+        Benchmark(name="format_msg", func=format_msgs, inputs=notification_chunks),
+        Benchmark(name="ai_extract_single", func=ai_single, inputs=ai_texts),
+        Benchmark(name="ai_extract_batch", func=ai_batch, inputs=[ai_texts]),
+    ]
+    return res
+
+
+def compare(
+    results: list[BenchmarkResult], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        for field in ("p50_ms", "peak_memory_kb"):
+            current, before = getattr(result, field), base[field]
+            if before and current > before * (1 + tolerance):
+                regressions.append(
+                    f"{result.name}: {field} {current:.3f} vs baseline {before:.3f}"
+                )
+    return regressions
+
+
+def print_table(results: list[BenchmarkResult], baseline: dict[str, dict]) -> None:
+    header = (
+        f"{'benchmark':<22}{'items/s':>12}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'peak KiB':>11}{'p50 vs base':>13}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        base = baseline.get(r.name)
+        change = f"{r.p50_ms / base['p50_ms'] - 1:+.0%}" if base else "-"
+        print(
+            f"{r.name:<22}{r.items_per_s:>12.1f}{r.p50_ms:>10.3f}{r.p99_ms:>10.3f}"
+            f"{r.peak_memory_kb:>11.1f}{change:>13}"
+        )
+    return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--only", nargs="*", help="benchmark names to run")
+    parser.add_argument("--pages", type=int, default=20, help="corpus pages per kind")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="allowed relative slow-down / memory growth before failing",
+    )
+    args = parser.parse_args(argv)
+
+    benchmarks = build_benchmarks(args.pages)
+    if args.only:
+        benchmarks = [x for x in benchmarks if x.name in args.only]
+    results = [measure(x, args.repeat) for x in benchmarks]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.update_baseline:
+        baseline.update({x.name: x.model_dump(exclude={"name"}) for x in results})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
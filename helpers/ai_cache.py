@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import typing
+
+import pydantic
+
+from helpers.models_base import ListingAIMetadata
+
+__all__ = [
+    "AICache",
+    "AICacheStats",
+    "get_ai_cache",
+    "normalize_description",
+]
+
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "ai_cache.sqlite3",
+)
+DEFAULT_TTL_DAYS = 180
+DEFAULT_MAX_ENTRIES = 100_000
+# Expired / overflowing entries are cleaned up once per this many writes
+EVICT_EVERY_N_PUTS = 200
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_description(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+class AICacheStats(pydantic.BaseModel):
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+
+class AICache:
+    """
+    Persistent store of Gemini extractions keyed on
+    (description hash, schema class, prompt version, model).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_s: float = DEFAULT_TTL_DAYS * 24 * 3600,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.stats = AICacheStats()
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            create table if not exists ai_cache (
+                cache_key text primary key,
+                schema_name text not null,
+                model text not null,
+                payload text not null,
+                created_at real not null,
+                last_used_at real not null
+            )
+            """
+        )
+        self._conn.execute(
+            "create index if not exists ai_cache_last_used on ai_cache (last_used_at)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def cache_key(
+        description: str,
+        schema_class: typing.Type[ListingAIMetadata],
+        prompt_version: str,
+        model: str,
+    ) -> str:
+        description_hash = hashlib.sha256(
+            normalize_description(description).encode("utf-8")
+        ).hexdigest()
+        key_parts = [description_hash, schema_class.__name__, prompt_version, model]
+        res = hashlib.sha256(json.dumps(key_parts).encode("utf-8")).hexdigest()
+        return res
+
+    def get(
+        self,
+        description: str,
+        schema_class: typing.Type[ListingAIMetadata],
+        prompt_version: str,
+        models: typing.Sequence[str],
+    ) -> ListingAIMetadata | None:
+        """
+        Returns the answer of the first of `models` that has one cached
+        """
+        now = time.time()
+        row = None
+        with self._lock:
+            for model in models:
+                key = self.cache_key(description, schema_class, prompt_version, model)
+                row = self._conn.execute(
+                    "select payload, created_at from ai_cache where cache_key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl_s:
+                    break
+                row = None
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self._conn.execute(
+                "update ai_cache set last_used_at = ? where cache_key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.stats.hits += 1
+        try:
+            res = schema_class.model_validate_json(row[0])
+        except pydantic.ValidationError:
+            # Schema changed in a way the prompt version did not capture
+            return None
+        return res
+
+    def put(
+        self,
+        description: str,
+        schema_class: typing.Type[ListingAIMetadata],
+        prompt_version: str,
+        model: str,
+        value: ListingAIMetadata,
+    ) -> None:
+        key = self.cache_key(description, schema_class, prompt_version, model)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                insert or replace into ai_cache
+                (cache_key, schema_name, model, payload, created_at, last_used_at)
+                values (?, ?, ?, ?, ?, ?)
+                """,
+                (key, schema_class.__name__, model, value.model_dump_json(), now, now),
+            )
+            self._conn.commit()
+            self.stats.stores += 1
+            self._puts_since_evict += 1
+            evict_needed = self._puts_since_evict >= EVICT_EVERY_N_PUTS
+        if evict_needed:
+            self.evict()
+        return None
+
+    def evict(self) -> None:
+        with self._lock:
+            self._puts_since_evict = 0
+            expired = self._conn.execute(
+                "delete from ai_cache where created_at < ?", (time.time() - self.ttl_s,)
+            ).rowcount
+            (n_entries,) = self._conn.execute("select count(*) from ai_cache").fetchone()
+            overflow = max(0, n_entries - self.max_entries)
+            if overflow:
+                self._conn.execute(
+                    """
+                    delete from ai_cache where cache_key in (
+                        select cache_key from ai_cache order by last_used_at limit ?
+                    )
+                    """,
+                    (overflow,),
+                )
+            self._conn.commit()
+            self.stats.evictions += expired + overflow
+        return None
+
+
+_CACHE: AICache | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_ai_cache() -> AICache | None:
+    """
+    Returns the process-wide cache, or None if it is disabled with AI_CACHE_PATH=""
+    """
+    global _CACHE
+    path = os.environ.get("AI_CACHE_PATH", DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = AICache(
+                path,
+                ttl_s=float(os.environ.get("AI_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS))
+                * 24
+                * 3600,
+                max_entries=int(
+                    os.environ.get("AI_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)
+                ),
+            )
+    return _CACHE
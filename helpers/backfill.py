@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import datetime
+import json
+import sys
+import typing
+
+import mysql.connector
+import mysql.connector.cursor
+import numpy as np
+import pydantic
+import tqdm
+
+from helpers.helper_functions import ROOT_DICT, R
+from helpers.materialized import refresh_listing_info_full
+from helpers.metrics import get_metrics
+from helpers.models_base import Saveable
+
+__all__ = [
+    "Backfill",
+    "BackfillCheckpoint",
+    "haversine_array",
+    "dist_from_root_array",
+    "json_paths",
+]
+
+
+class BackfillCheckpoint(Saveable):
+    """
+    Key of the last row a backfill wrote back, saved in the same transaction
+    as the rows so a restart continues right after it
+    """
+
+    name: str
+    last_key: str
+    rows_done: int
+    updated_at: datetime.datetime
+
+    TABLE_NAME: typing.ClassVar[str] = "backfill_checkpoints"
+
+    @classmethod
+    def load(
+        cls, cursor: mysql.connector.cursor.MySQLCursor, name: str
+    ) -> BackfillCheckpoint | None:
+        sql = f"""
+        select name, last_key, rows_done, updated_at
+        from {cls.TABLE_NAME}
+        where name = %(name)s
+        """
+        try:
+            cursor.execute(sql, {"name": name})
+            res = cursor.fetchall()
+        except mysql.connector.Error as err:
+            print(f"Error during checkpoint load for {name}: {err}")
+            return None
+        if not res:
+            return None
+        columns = ["name", "last_key", "rows_done", "updated_at"]
+        inst = cls(**dict(zip(columns, res[0])))
+        return inst
+
+    @classmethod
+    def clear(cls, cursor: mysql.connector.cursor.MySQLCursor, name: str) -> None:
+        cursor.execute(
+            f"delete from {cls.TABLE_NAME} where name = %(name)s", {"name": name}
+        )
+        return None
+
+
+class Backfill(pydantic.BaseModel):
+    """
+    Recomputes columns of existing rows chunk by chunk:
+
+    - rows matching `where` are read in `key` order, `chunk_size` at a time,
+      streamed from an unbuffered (server-side) cursor
+    - `transform` gets the chunk as (key, *source_columns) tuples and returns
+      (key, *target_columns) tuples, dropping rows it cannot fill
+    - the results go to a temporary table and reach `target_table` with one
+      UPDATE ... JOIN per chunk, committed together with the checkpoint
+    """
+
+    model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
+
+    name: str
+    table: str
+    source_columns: list[str]
+    target_columns: list[str]
+    transform: typing.Callable[[list[tuple]], list[tuple]]
+    where: str = "1=1"
+    key: str = "listing_id"
+    # Where the results are written, `table` if not set
+    target_table: str | None = None
+    chunk_size: int = 5000
+    # listing_info_full rows of this service are refreshed after every chunk
+    materialized_service: str | None = None
+
+    @property
+    def tmp_table(self) -> str:
+        return f"tmp_backfill_{self.name}"
+
+    def read_chunk(self, conn, last_key: str | None) -> list[tuple]:
+        columns = ", ".join([self.key, *self.source_columns])
+        keyset = f"and {self.key} > %(last_key)s" if last_key is not None else ""
+        sql = f"""
+        select {columns}
+        from {self.table}
+        where 1=1
+        and ({self.where})
+        {keyset}
+        order by {self.key}
+        limit {self.chunk_size}
+        """
+        # Unbuffered: rows arrive while the previous ones are being collected,
+        # instead of the whole chunk being materialized in the driver first
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(sql, {"last_key": last_key})
+            res = []
+            while batch := cursor.fetchmany(1000):
+                res.extend(batch)
+        finally:
+            cursor.close()
+        return res
+
+    def create_tmp_table(self, cursor) -> None:
+        target = self.target_table or self.table
+        columns = ", ".join([self.key, *self.target_columns])
+        cursor.execute(f"drop temporary table if exists {self.tmp_table}")
+        # Same column types as the target, without copying any of its rows
+        cursor.execute(
+            f"""
+            create temporary table {self.tmp_table}
+            select {columns} from {target} where 1=0
+            """
+        )
+        cursor.execute(f"alter table {self.tmp_table} add primary key ({self.key})")
+        return None
+
+    def write_chunk(self, cursor, rows: list[tuple]) -> None:
+        target = self.target_table or self.table
+        columns = [self.key, *self.target_columns]
+        placeholders = ", ".join(["%s"] * len(columns))
+        assignments = ", ".join(f"t.{x} = s.{x}" for x in self.target_columns)
+        # DELETE rather than TRUNCATE, which would commit the open transaction
+        cursor.execute(f"delete from {self.tmp_table}")
+        cursor.executemany(
+            f"insert into {self.tmp_table} ({', '.join(columns)}) values ({placeholders})",
+            rows,
+        )
+        cursor.execute(
+            f"""
+            update {target} as t
+            inner join {self.tmp_table} as s
+            on (t.{self.key} = s.{self.key})
+            set {assignments}
+            """
+        )
+        if self.materialized_service is not None:
+            refresh_listing_info_full(
+                cursor, self.materialized_service, [x[0] for x in rows]
+            )
+        return None
+
+    def run(self, conn, restart: bool = False) -> int:
+        """
+        Runs the backfill to the end of the table, continuing from the last
+        checkpoint unless `restart`. Returns the number of rows written.
+        """
+        cursor = conn.cursor()
+        metrics = get_metrics()
+        if restart:
+            BackfillCheckpoint.clear(cursor, self.name)
+            conn.commit()
+        checkpoint = BackfillCheckpoint.load(cursor, self.name)
+        last_key = checkpoint.last_key if checkpoint is not None else None
+        rows_done = checkpoint.rows_done if checkpoint is not None else 0
+        if checkpoint is not None:
+            print(f"Backfill {self.name} resumes after {self.key} {last_key}")
+        self.create_tmp_table(cursor)
+
+        progress = tqdm.tqdm(file=sys.stdout, initial=rows_done, unit="rows")
+        while True:
+            with metrics.timer("backfill", backfill=self.name, op="read"):
+                chunk = self.read_chunk(conn, last_key)
+            if not chunk:
+                break
+            with metrics.timer("backfill", backfill=self.name, op="transform"):
+                rows = self.transform(chunk)
+            checkpoint = BackfillCheckpoint(
+                name=self.name,
+                last_key=str(chunk[-1][0]),
+                rows_done=rows_done + len(rows),
+                updated_at=datetime.datetime.utcnow(),
+            )
+            try:
+                with metrics.timer("backfill", backfill=self.name, op="write"):
+                    if rows:
+                        self.write_chunk(cursor, rows)
+                    checkpoint.to_db(cursor)
+                conn.commit()
+            except mysql.connector.Error as err:
+                conn.rollback()
+                print(f"Backfill {self.name} stopped after {self.key} {last_key}: {err}")
+                raise
+            last_key, rows_done = checkpoint.last_key, checkpoint.rows_done
+            metrics.inc("backfill_rows_total", len(rows), backfill=self.name)
+            progress.update(len(rows))
+        progress.close()
+
+        cursor.execute(f"drop temporary table if exists {self.tmp_table}")
+        cursor.close()
+        return rows_done
+
+
+def haversine_array(
+    lat1: float | np.ndarray,
+    lon1: float | np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray,
+) -> np.ndarray:
+    """
+    helper_functions.haversine over whole arrays of coordinates
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    delta_phi = np.radians(np.subtract(lat2, lat1))
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+    a = (
+        np.sin(delta_phi / 2) ** 2
+        + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    )
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def dist_from_root_array(city: str, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    helper_functions.dist_from_root over arrays; NaN and 0 coordinates fall
+    back to the city center, as None and 0 do there
+    """
+    root = ROOT_DICT[city]
+    lat = np.where(np.isnan(lat) | (lat == 0), root[0], lat)
+    lon = np.where(np.isnan(lon) | (lon == 0), root[1], lon)
+    return haversine_array(root[0], root[1], lat, lon)
+
+
+def json_paths(
+    texts: typing.Iterable[str | None], paths: typing.Sequence[typing.Sequence[str]]
+) -> list[tuple]:
+    """
+    Values at `paths` of every JSON document, None where a document is
+    missing, broken or lacks the path
+    """
+    res = []
+    for text in texts:
+        try:
+            doc = json.loads(text) if text else {}
+        except ValueError:
+            doc = {}
+        values = []
+        for path in paths:
+            value = doc
+            for step in path:
+                value = value.get(step) if isinstance(value, dict) else None
+            values.append(value)
+        res.append(tuple(values))
+    return res
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+
+import pydantic
+
+from helpers.services import Service
+
+__all__ = [
+    "City",
+    "CITIES",
+    "get_city",
+    "get_cities",
+]
+
+
+class City(pydantic.BaseModel):
+    """
+    Everything that differs between the cities a process crawls: passed down
+    explicitly, so one process can serve several cities side by side
+    """
+
+    model_config = pydantic.ConfigDict(frozen=True)
+
+    # Key of the per-city tables (SEARCH_DICT, SEARCH_PARAMS, ROOT_DICT, ...)
+    name: str
+    database: str
+    datasources: tuple[str, ...]
+
+    @property
+    def services(self) -> list[Service]:
+        return [Service(x) for x in self.datasources]
+
+    def tg_info(self) -> dict:
+        key = self.name.upper()
+        res = dict(
+            bot_token=os.environ["TG_BOT_TOKEN"],
+            chat_id=os.environ[f"TG_CHAT_ID_{key}"],
+            update_thread=os.environ[f"TG_REGULAR_THREAD_ID_{key}"],
+            update_status_thread=os.environ[f"TG_UPDATES_THREAD_ID_{key}"],
+            update_no_distance_thread=os.environ.get(
+                f"TG_NO_DISTANCE_THREAD_ID_{key}",
+                os.environ[f"TG_REGULAR_THREAD_ID_{key}"],
+            ),
+        )
+        return res
+
+
+CITIES = {
+    "Warsaw": City(name="Warsaw", database="otodom", datasources=("otodom", "olx")),
+    "Krakow": City(
+        name="Krakow", database="otodom_krakow", datasources=("otodom", "olx")
+    ),
+}
+
+
+def get_city(name: str | None = None) -> City:
+    """
+    The city called `name`, or the one in the CITY environment variable
+    """
+    name = name or os.environ["CITY"]
+    if name not in CITIES:
+        raise ValueError(f"Unknown city {name!r}, use one of {list(CITIES)}")
+    return CITIES[name]
+
+
+def get_cities() -> list[City]:
+    """
+    The cities of this process: CITIES="Warsaw,Krakow", or just CITY
+    """
+    names = [x.strip() for x in os.environ.get("CITIES", "").split(",") if x.strip()]
+    if not names:
+        return [get_city()]
+    return [get_city(x) for x in names]
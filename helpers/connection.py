@@ -1,46 +1,74 @@
 from __future__ import annotations
 
 import os
+import time
+import typing
 
 import mysql.connector
 import mysql.connector.cursor
 from dotenv import load_dotenv
-import requests
-import ua_generator
-from google import genai
+
+from helpers.http_client import get_http_client, get_http_stats, TRANSPORT_ERRORS
+
+if typing.TYPE_CHECKING:
+    from helpers.city import City
 
 __all__ = [
     "get_db_connection",
     "get_db_credentials",
+    "is_transient_error",
+    "TRANSIENT_ERRNOS",
     "query_url_as_human",
+    "get_http_client",
+    "get_http_stats",
     "get_ai_client",
-    "get_tg_info",
-    "CITY",
-    "DATABASE",
     "NOMINATIM_AGENT",
-    "CURRENT_DATASOURCES",
 ]
 
 load_dotenv()
 
+# Errors after which the same statements may simply be run again: the server
+# went away or is overloaded, or the transaction lost a lock conflict
+TRANSIENT_ERRNOS = {
+    1040,  # too many connections
+    1205,  # lock wait timeout
+    1213,  # deadlock
+    2003,  # can't connect
+    2006,  # server has gone away
+    2013,  # lost connection during query
+    2055,  # lost connection, system error
+}
+DB_CONNECT_ATTEMPTS = int(os.environ.get("DB_CONNECT_ATTEMPTS", 5))
+DB_RETRY_BACKOFF_S = float(os.environ.get("DB_RETRY_BACKOFF_S", 1.0))
 
-def get_db_connection(host, port, database, user, password):
-    """Establishes a connection to the MySQL database."""
-    try:
-        conn = mysql.connector.connect(
-            host=host, port=port, database=database, user=user, password=password
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Error connecting to database: {err}")
-        return None
+
+def is_transient_error(err: Exception) -> bool:
+    return getattr(err, "errno", None) in TRANSIENT_ERRNOS
 
 
-def get_db_credentials():
+def get_db_connection(host, port, database, user, password):
+    """
+    Establishes a connection to the MySQL database, retrying with backoff while
+    the server is unreachable; raises the last error when it stays that way
+    """
+    for attempt in range(DB_CONNECT_ATTEMPTS):
+        try:
+            conn = mysql.connector.connect(
+                host=host, port=port, database=database, user=user, password=password
+            )
+            return conn
+        except mysql.connector.Error as err:
+            print(f"Error connecting to database: {err}")
+            if not is_transient_error(err) or attempt == DB_CONNECT_ATTEMPTS - 1:
+                raise
+            time.sleep(DB_RETRY_BACKOFF_S * 2**attempt)
+
+
+def get_db_credentials(city: City):
     creds = (
         os.environ.get("DB_HOST"),
         os.environ.get("DB_PORT"),
-        DATABASE,
+        city.database,
         os.environ.get("DB_USER"),
         os.environ.get("DB_PASSWORD"),
     )
@@ -48,11 +76,16 @@ def get_db_credentials():
 
 
 def get_random_user_agent() -> str:
+    import ua_generator  # deferred, its data files take a while to load
+
     return ua_generator.generate().text
 
 
-def query_url_as_human(url, method: str = "GET", body: dict = None):
+def query_url_as_human(
+    url, method: str = "GET", body: dict = None, headers: dict | None = None
+):
     # Define headers to mimic a browser
+    extra_headers = headers or {}
     headers = {
         "User-Agent": get_random_user_agent(),  # Use a random user agent
         "Accept": "*/*",
@@ -70,40 +103,20 @@ def query_url_as_human(url, method: str = "GET", body: dict = None):
         to_pass["json"] = body
         headers["Content-Type"] = "application/json"
         headers["Accept"] = "application/json"
+    headers.update(extra_headers)
 
     try:
-        response = requests.request(**to_pass)
+        response = get_http_client().request(**to_pass)
         response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
         return response
-    except requests.exceptions.RequestException as e:
+    except TRANSPORT_ERRORS as e:
         return None
 
 
 def get_ai_client():
+    # Deferred: google.genai takes most of the start-up time and only the
+    # runners that query Gemini need it
+    from google import genai
+
     client = genai.Client(api_key=os.environ["AI_PLATFORM_API_KEY"])
     return client
-
-
-def get_tg_info():
-    res = dict(
-        bot_token=os.environ["TG_BOT_TOKEN"],
-        chat_id=os.environ[f"TG_CHAT_ID_{CITY.upper()}"],
-        update_thread=os.environ[f"TG_REGULAR_THREAD_ID_{CITY.upper()}"],
-        update_status_thread=os.environ[f"TG_UPDATES_THREAD_ID_{CITY.upper()}"],
-        update_no_distance_thread=os.environ.get(
-            f"TG_NO_DISTANCE_THREAD_ID_{CITY.upper()}",
-            os.environ[f"TG_REGULAR_THREAD_ID_{CITY.upper()}"],
-        ),
-    )
-    return res
-
-
-CITY = os.environ["CITY"]
-DB_DI = {
-    "Warsaw": "otodom",
-    "Krakow": "otodom_krakow",
-}
-DATABASE = DB_DI[CITY]
-
-CITY_DATASOURCES = {"Warsaw": ["otodom", "olx"], "Krakow": ["otodom", "olx"]}
-CURRENT_DATASOURCES = CITY_DATASOURCES[CITY]
@@ -1,41 +1,80 @@
-import time
-import random
 import sys
 
 import tqdm
 
-from helpers.models_base import ListingItem
+from helpers.city import City
+from helpers.db_pool import DbPool
+from helpers.metrics import get_metrics
+from helpers.models_base import ListingItem, CrawlWatermark
+from helpers.page_archive import PageKind, archive_page
+from helpers.parse_executor import get_parse_executor
 from helpers.services import Service
 
-__all__ = ["update_listings"]
+__all__ = ["update_listings", "resync_listings"]
 
 
 PAGES = 19
+# Rows per transaction when saving a full resync
+RESYNC_CHUNK_SIZE = 500
+# How many of the last dated items of a page must be past the watermark to stop
+WATERMARK_TAIL = 5
 
 
-def scrape_page(page_num: int, service: Service) -> list[ListingItem]:
-    text = service.get_page_function(page_num)
-    listing_items = service.listing_item_model_class.from_text(text)
+def scrape_page(page_num: int, service: Service, city: City) -> list[ListingItem]:
+    metrics = get_metrics()
+    model_class = service.listing_item_model_class
+    with metrics.timer("fetch", service=service.value, kind="search"):
+        text = service.get_page_function(page_num, city)
+    archive_page(service.value, PageKind.Search, text, city=city.name)
+    with metrics.timer("parse", model=model_class.__name__):
+        listing_items = get_parse_executor().parse(
+            service, PageKind.Search, text, city.name
+        )
+    metrics.inc("parsed_items_total", len(listing_items), model=model_class.__name__)
     return listing_items
 
 
-def save_to_db(cursor, data: list[ListingItem], conn) -> bool:
-    present = {}
-    for item in data:
-        is_present = item.is_present_in_db(cursor)
-        present[item.listing_id] = is_present
-        if not is_present:
-            item.to_db(cursor=cursor)
-    conn.commit()
-    return all(present.values())
+def save_to_db(cursor, data: list[ListingItem]) -> bool:
+    if not data:
+        return True
+    model_class = data[0].__class__
+    present = model_class.present_ids(cursor, [item.listing_id for item in data])
+    new_items = [item for item in data if str(item.listing_id) not in present]
+    if new_items:
+        model_class.bulk_to_db(cursor, new_items)
+    return not new_items
 
 
-def update_listings(cursor, conn, service: Service) -> bool:
+def update_listings(pool: DbPool, service: Service, city: City) -> bool:
     all_present = False
+    watermark = pool.run(CrawlWatermark.load, service.value)
+    newest = watermark
     for i in tqdm.tqdm(range(PAGES), file=sys.stdout):
-        li_chunk = scrape_page(i, service)
-        all_present = save_to_db(cursor, li_chunk, conn)
+        li_chunk = scrape_page(i, service, city)
+        all_present = pool.run(save_to_db, li_chunk)
+        newest = CrawlWatermark.advance(newest, li_chunk, service.value)
         if all_present:
             break
-        time.sleep(10 + random.randint(1, 1000) / 1000)
+        if watermark is not None and watermark.is_passed_by(li_chunk, WATERMARK_TAIL):
+            break
+
+    if newest is not None and newest is not watermark:
+        pool.run(newest.to_db)
+    return all_present
+
+
+def resync_listings(pool: DbPool, service: Service, city: City) -> bool:
+    """
+    Saves every listing the service currently has, not only the first pages.
+    Falls back to update_listings for services without a full crawler.
+    """
+    crawl = service.full_crawl_function
+    if crawl is None:
+        return update_listings(pool, service, city)
+    listing_items = crawl(city)
+    all_present = True
+    chunk_starts = range(0, len(listing_items), RESYNC_CHUNK_SIZE)
+    for i in tqdm.tqdm(chunk_starts, file=sys.stdout):
+        chunk = listing_items[i : i + RESYNC_CHUNK_SIZE]
+        all_present = pool.run(save_to_db, chunk) and all_present
     return all_present
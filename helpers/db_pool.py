@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+import time
+import typing
+
+import mysql.connector
+import pydantic
+
+from helpers.city import City
+from helpers.connection import (
+    DB_RETRY_BACKOFF_S,
+    get_db_connection,
+    get_db_credentials,
+    is_transient_error,
+)
+from helpers.metrics import get_metrics
+
+__all__ = [
+    "DbPoolConfig",
+    "DbPool",
+    "get_db_pool",
+    "close_db_pools",
+]
+
+T = typing.TypeVar("T")
+
+
+class DbPoolConfig(pydantic.BaseModel):
+    # Connections open at most; callers beyond that wait up to acquire_timeout_s
+    size: int = 6
+    acquire_timeout_s: float = 60.0
+    # A connection idle for longer is pinged (and reconnected) before reuse
+    ping_after_s: float = 30.0
+    # Extra attempts of a unit of work after a transient error
+    retries: int = 3
+    retry_backoff_s: float = DB_RETRY_BACKOFF_S
+
+    @classmethod
+    def from_env(cls) -> DbPoolConfig:
+        defaults = cls()
+        inst = cls(
+            size=int(os.environ.get("DB_POOL_SIZE", defaults.size)),
+            acquire_timeout_s=float(
+                os.environ.get("DB_POOL_TIMEOUT_S", defaults.acquire_timeout_s)
+            ),
+            ping_after_s=float(
+                os.environ.get("DB_POOL_PING_AFTER_S", defaults.ping_after_s)
+            ),
+            retries=int(os.environ.get("DB_RETRIES", defaults.retries)),
+        )
+        return inst
+
+
+class DbPool:
+    """
+    Pool of MySQL connections to the database of one city. Every unit of work
+    borrows a connection only for as long as it runs, so nothing sits idle
+    through a crawl or a Gemini call and times out on the server, and workers
+    of a pipeline stage can write side by side, each on its own connection.
+    """
+
+    def __init__(self, city: City, config: DbPoolConfig | None = None):
+        self.city = city
+        self.config = config or DbPoolConfig.from_env()
+        # (connection, time.monotonic() it was returned)
+        self._idle: list[tuple[typing.Any, float]] = []
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        conn = get_db_connection(*get_db_credentials(self.city))
+        get_metrics().inc("db_connections_opened_total", city=self.city.name)
+        return conn
+
+    def _healthy(self, conn, idle_s: float) -> bool:
+        if idle_s < self.config.ping_after_s:
+            return True
+        try:
+            conn.ping(reconnect=True, attempts=2, delay=self.config.retry_backoff_s)
+            return True
+        except mysql.connector.Error as err:
+            print(f"Dropping a dead connection to {self.city.database}: {err}")
+            return False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.config.acquire_timeout_s
+        with get_metrics().timer("db_pool_wait", city=self.city.name):
+            with self._cond:
+                while not self._idle and self._open >= self.config.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"No free connection to {self.city.database} "
+                            f"after {self.config.acquire_timeout_s}s, "
+                            f"DB_POOL_SIZE is {self.config.size}"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    conn, returned_at = None, 0.0
+                    self._open += 1
+        if conn is not None and self._healthy(conn, time.monotonic() - returned_at):
+            return conn
+        if conn is not None:
+            self._close(conn)
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, broken: bool = False) -> None:
+        if not broken:
+            try:
+                # Whatever the borrower left uncommitted must not leak to the next one
+                if conn.in_transaction:
+                    conn.rollback()
+            except mysql.connector.Error:
+                broken = True
+        if broken:
+            self._close(conn)
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return None
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        return None
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+        return None
+
+    @contextlib.contextmanager
+    def connection(self) -> typing.Iterator[typing.Any]:
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except mysql.connector.Error as err:
+            broken = is_transient_error(err)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def run(self, func: typing.Callable[..., T], *args, **kwargs) -> T:
+        """
+        Runs func(cursor, *args, **kwargs) as one transaction on a pooled
+        connection and commits it. After a transient error (lost connection,
+        deadlock, ...) the whole unit is run again on a fresh connection, so
+        `func` must be safe to repeat, as the upserts and reads here are.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        res = func(cursor, *args, **kwargs)
+                        conn.commit()
+                    finally:
+                        cursor.close()
+                return res
+            except mysql.connector.Error as err:
+                if not is_transient_error(err) or attempt >= self.config.retries:
+                    raise
+                print(f"Retrying after a transient database error: {err}")
+                get_metrics().inc("db_retries_total", city=self.city.name)
+                time.sleep(self.config.retry_backoff_s * 2**attempt)
+                attempt += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            res = {
+                "size": self.config.size,
+                "open": self._open,
+                "idle": len(self._idle),
+            }
+        return res
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+        return None
+
+
+_POOLS: dict[str, DbPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_db_pool(city: City) -> DbPool:
+    """
+    The process-wide pool of a city; DB_POOL_SIZE, DB_POOL_TIMEOUT_S,
+    DB_POOL_PING_AFTER_S and DB_RETRIES tune it
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(city.name)
+        if pool is None:
+            pool = _POOLS[city.name] = DbPool(city)
+    return pool
+
+
+def close_db_pools() -> None:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.close()
+    return None
@@ -1,16 +1,28 @@
+import functools
+import hashlib
 import sys
-import time
-import random
+import typing
 
+import pydantic
 import tqdm
 
-from helpers.connection import query_url_as_human, CITY
+from helpers.city import City
+from helpers.connection import query_url_as_human
+from helpers.db_pool import DbPool
 from helpers.models_base import (
     ListingAdditionalInfo,
     ListingAIInfo,
+    ListingAIMetadata,
     ListingGone,
 )
 from helpers.services import Service
+from helpers.liveness import check_urls_alive
+from helpers.ai_cache import get_ai_cache
+from helpers.pipeline import Pipeline, Stage
+from helpers.rate_limiter import get_scheduler, GEMINI_BUDGET
+from helpers.metrics import get_metrics
+from helpers.page_archive import PageKind, archive_page
+from helpers.parse_executor import available_cpus, get_parse_executor, parse_models
 
 __all__ = [
     "process_missing_metadata",
@@ -33,36 +45,99 @@ def get_html(html_file_path: str):
 
 
 def extract_info(
-    listing_id: str, html_content: str | None, service: Service
+    listing_id: str, html_content: str | None, service: Service, city: str
 ) -> ListingAdditionalInfo | ListingGone:
-    if html_content is None:
-        res = ListingGone(listing_id=listing_id, service=service.value)
-        return res
-    metadata = service.listing_metadata_model_class.from_text(
-        text=html_content,
-        listing_id=listing_id,
-        city=CITY,
-    )
+    (metadata,) = parse_models(service, PageKind.Ad, html_content, city, listing_id)
     return metadata
 
 
-def extract_ai_info(
-    listing_id: str,
-    html_content: str,
-    client,
-    service: Service,
-) -> ListingAIInfo:
+AI_MODEL = "gemini-2.5-flash"
+AI_FALLBACK_MODEL = "gemini-2.0-flash-lite"
+# Only answers of the main model are cached: a fallback answer is a one-off
+# after an error and should be asked again, not served for the whole TTL
+AI_CACHED_MODELS = (AI_MODEL,)
+# Bump when extraction results should change without the prompt text changing,
+# this invalidates the cached answers
+AI_PROMPT_VERSION = 1
 
-    message = f"""
+AI_PROMPT_TEMPLATE = """
     Based on the following description, find the following information. 
     If any of the pieces are missing  - return null for that piece.
-    {service.listing_ai_metadata_model_class.prompt}
+    {prompt}
     Description:
-    {html_content}
+    {description}
+    """
+
+
+AI_BATCH_PROMPT_TEMPLATE = """
+    Below are several listings, each one starts with a line "Listing ID: <id>".
+    Based on the description of every listing, find the following information. 
+    If any of the pieces are missing  - return null for that piece.
+    Return exactly one entry per listing and copy its listing_id unchanged.
+    {prompt}
+    Listings:
+    {descriptions}
+    """
+AI_BATCH_MODE = True
+# Rough input budget for one batched request, and the heuristic to estimate it
+AI_BATCH_TOKEN_BUDGET = 24_000
+AI_CHARS_PER_TOKEN = 4
+AI_BATCH_MAX_ITEMS = 25
+
+
+def ai_prompt_version(service: Service) -> str:
+    # Batched and single answers share the cache, so both templates are versioned
+    prompt = (
+        AI_PROMPT_TEMPLATE
+        + AI_BATCH_PROMPT_TEMPLATE
+        + service.listing_ai_metadata_model_class.prompt
+    )
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{AI_PROMPT_VERSION}-{digest}"
+
+
+def generate_content(client, ai_data: dict, kind: str) -> typing.Any:
     """
+    client.models.generate_content, recording latency, outcome and token usage
+    """
+    metrics = get_metrics()
+    labels = dict(model=ai_data["model"], kind=kind)
+    try:
+        with metrics.timer("gemini_request", **labels):
+            response = client.models.generate_content(**ai_data)
+    except Exception as e:
+        outcome = getattr(e, "status", None) or "error"
+        metrics.inc("gemini_requests_total", outcome=outcome, **labels)
+        raise
+    metrics.inc("gemini_requests_total", outcome="ok", **labels)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        for direction, field in (
+            ("prompt", "prompt_token_count"),
+            ("response", "candidates_token_count"),
+        ):
+            metrics.inc(
+                "gemini_tokens_total",
+                getattr(usage, field, None) or 0,
+                direction=direction,
+                **labels,
+            )
+    return response
+
+
+def query_ai(
+    html_content: str,
+    client,
+    service: Service,
+) -> tuple[ListingAIMetadata | None, str]:
+
+    message = AI_PROMPT_TEMPLATE.format(
+        prompt=service.listing_ai_metadata_model_class.prompt,
+        description=html_content,
+    )
 
     ai_data = dict(
-        model="gemini-2.5-flash",
+        model=AI_MODEL,
         # model="gemini-2.0-flash",
         contents=message,
         config={
@@ -71,23 +146,191 @@ def extract_ai_info(
         },
     )
 
+    scheduler = get_scheduler()
+    scheduler.acquire(GEMINI_BUDGET)
     try:
-        response = client.models.generate_content(**ai_data)
+        response = generate_content(client, ai_data, "single")
     except Exception as e:
-        if getattr(e, "status") == "RESOURCE_EXHAUSTED":
-            delay = 60
+        if getattr(e, "status", None) == "RESOURCE_EXHAUSTED":
+            scheduler.feedback(GEMINI_BUDGET, 429)
         else:
-            delay = 1
-            ai_data["model"] = "gemini-2.0-flash-lite"
-        time.sleep(delay)
-        response = client.models.generate_content(**ai_data)
-    inst = response.parsed
+            ai_data["model"] = AI_FALLBACK_MODEL
+        get_metrics().inc("gemini_retries_total", kind="single")
+        scheduler.acquire(GEMINI_BUDGET)
+        response = generate_content(client, ai_data, "single")
+    scheduler.feedback(GEMINI_BUDGET, 200)
+    return response.parsed, ai_data["model"]
+
+
+def extract_ai_info(
+    listing_id: str,
+    html_content: str,
+    client,
+    service: Service,
+    city: str,
+) -> ListingAIInfo:
+    schema_class = service.listing_ai_metadata_schema_class
+    prompt_version = ai_prompt_version(service)
+    cache = get_ai_cache()
+
+    inst = None
+    if cache is not None:
+        inst = cache.get(html_content, schema_class, prompt_version, AI_CACHED_MODELS)
+
+    if inst is None:
+        inst, model = query_ai(html_content, client, service)
+        if cache is not None and inst is not None and model in AI_CACHED_MODELS:
+            cache.put(html_content, schema_class, prompt_version, model, inst)
+
     ai_info = service.listing_ai_metadata_model_class.from_ai_metadata(
-        inst, listing_id=listing_id, city=CITY
+        inst, listing_id=listing_id, city=city
     )
     return ai_info
 
 
+@functools.cache
+def batch_item_schema(
+    schema_class: typing.Type[ListingAIMetadata],
+) -> typing.Type[ListingAIMetadata]:
+    res = pydantic.create_model(
+        f"{schema_class.__name__}Batch",
+        __base__=schema_class,
+        listing_id=(str, ...),
+    )
+    return res
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // AI_CHARS_PER_TOKEN + 1
+
+
+class BatchSizer:
+    """
+    Packs descriptions into batches that fit the token budget, and shrinks the
+    batches while Gemini keeps returning partial answers.
+    """
+
+    def __init__(self, token_budget: int, max_items: int):
+        self.token_budget = token_budget
+        self.max_items_cap = max_items
+        self.max_items = max_items
+
+    def next_batch(self, items: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        batch, tokens = [], 0
+        for item in items:
+            item_tokens = estimate_tokens(item[1])
+            if batch and (
+                len(batch) >= self.max_items or tokens + item_tokens > self.token_budget
+            ):
+                break
+            batch.append(item)
+            tokens += item_tokens
+        return batch
+
+    def report(self, n_requested: int, n_answered: int) -> None:
+        if n_answered < n_requested:
+            self.max_items = max(1, self.max_items // 2)
+        else:
+            self.max_items = min(self.max_items_cap, self.max_items + 1)
+        return None
+
+
+def query_ai_batch(
+    items: list[tuple[str, str]],
+    client,
+    service: Service,
+) -> tuple[dict[str, ListingAIMetadata], str]:
+    schema_class = service.listing_ai_metadata_schema_class
+    descriptions = "\n".join(
+        f"Listing ID: {listing_id}\n{text}\n" for listing_id, text in items
+    )
+    message = AI_BATCH_PROMPT_TEMPLATE.format(
+        prompt=service.listing_ai_metadata_model_class.prompt,
+        descriptions=descriptions,
+    )
+    ai_data = dict(
+        model=AI_MODEL,
+        contents=message,
+        config={
+            "response_mime_type": "application/json",
+            "response_schema": list[batch_item_schema(schema_class)],
+        },
+    )
+
+    scheduler = get_scheduler()
+    scheduler.acquire(GEMINI_BUDGET)
+    try:
+        response = generate_content(client, ai_data, "batch")
+    except Exception as e:
+        if getattr(e, "status", None) != "RESOURCE_EXHAUSTED":
+            print(f"Batch of {len(items)} failed: {e}")
+            return {}, ai_data["model"]
+        scheduler.feedback(GEMINI_BUDGET, 429)
+        get_metrics().inc("gemini_retries_total", kind="batch")
+        scheduler.acquire(GEMINI_BUDGET)
+        try:
+            response = generate_content(client, ai_data, "batch")
+        except Exception as e:
+            print(f"Batch of {len(items)} failed after a retry: {e}")
+            return {}, ai_data["model"]
+    scheduler.feedback(GEMINI_BUDGET, 200)
+
+    requested = {listing_id for listing_id, _ in items}
+    res = {}
+    for entry in response.parsed or []:
+        listing_id = str(entry.listing_id)
+        if listing_id in requested:
+            res[listing_id] = schema_class.model_validate(
+                entry.model_dump(exclude={"listing_id"})
+            )
+    return res, ai_data["model"]
+
+
+def extract_ai_info_batch(
+    items: list[tuple[str, str]],
+    client,
+    service: Service,
+    sizer: BatchSizer,
+) -> dict[str, ListingAIMetadata]:
+    """
+    Sends the batch, then splits whatever was not answered in halves and
+    retries them, down to single-listing prompts.
+    """
+    schema_class = service.listing_ai_metadata_schema_class
+    prompt_version = ai_prompt_version(service)
+    cache = get_ai_cache()
+
+    if len(items) == 1:
+        listing_id, text = items[0]
+        try:
+            inst, model = query_ai(text, client, service)
+        except Exception as e:
+            # One listing Gemini keeps failing on must not cost the rest of the run
+            print(f"Skipping listing {listing_id}, Gemini failed on it: {e}")
+            get_metrics().inc("gemini_skipped_listings_total", service=service.value)
+            return {}
+        if inst is None:
+            return {}
+        if cache is not None and model in AI_CACHED_MODELS:
+            cache.put(text, schema_class, prompt_version, model, inst)
+        return {listing_id: inst}
+
+    answered, model = query_ai_batch(items, client, service)
+    sizer.report(len(items), len(answered))
+    texts = dict(items)
+    for listing_id, inst in answered.items():
+        if cache is not None and model in AI_CACHED_MODELS:
+            cache.put(texts[listing_id], schema_class, prompt_version, model, inst)
+
+    missing = [x for x in items if x[0] not in answered]
+    if missing:
+        half = (len(missing) + 1) // 2
+        for part in (missing[:half], missing[half:]):
+            if part:
+                answered.update(extract_ai_info_batch(part, client, service, sizer))
+    return answered
+
+
 def get_slugs(cursor, service: Service) -> list[tuple[str, str]]:
     query = f"""
     select listing_id, min(url) as url 
@@ -153,50 +396,171 @@ def get_html_url(url: str) -> str | None:
     return data
 
 
+# Worker counts of the process_missing_metadata stages; every DB worker writes
+# on a pooled connection of its own
+PIPELINE_WORKERS = {
+    "fetch": 2,
+    "parse": available_cpus(),
+    "db": 2,
+    "ai": 2,
+    "ai_db": 2,
+}
+
+
 def process_missing_metadata(
-    cursor, conn, ai_client, service: Service
+    pool: DbPool, ai_client, service: Service, city: City
 ) -> list[tuple[str, str]]:
-    urls = get_slugs(cursor, service)
-    for listing_id, url in tqdm.tqdm(urls, file=sys.stdout):
-        body = get_html_url(url)
-        metadata = extract_info(listing_id, body, service)
-        metadata.to_db(cursor)
-        conn.commit()
-        if not isinstance(metadata, ListingGone):
-            text_for_ai = getattr(metadata, service.info_for_ai.select_columns)
-            ai_info = extract_ai_info(listing_id, text_for_ai, ai_client, service)
-            ai_info.to_db(conn.cursor())
-            conn.commit()
-        time.sleep(random.randint(0, 1000) / 1000)
+    """
+    Runs fetch -> parse -> DB write -> AI enrich -> DB write as a pipeline
+    of bounded queues, so network fetches, parsing and Gemini calls overlap.
+    """
+    urls = pool.run(get_slugs, service)
+    progress = tqdm.tqdm(total=len(urls), file=sys.stdout)
+    metadata_model_name = service.listing_metadata_model_class.__name__
+
+    def fetch(item: tuple[str, str]) -> tuple[str, str | None]:
+        listing_id, url = item
+        with get_metrics().timer("fetch", service=service.value, kind="ad"):
+            body = service.get_ad_page_function(url)
+        archive_page(
+            service.value,
+            PageKind.Ad,
+            body,
+            url=url,
+            listing_id=listing_id,
+            city=city.name,
+        )
+        return listing_id, body
+
+    def parse(
+        item: tuple[str, str | None],
+    ) -> tuple[str, ListingAdditionalInfo | ListingGone]:
+        listing_id, body = item
+        # Includes the hand-over to the parse processes, which is small next to parsing
+        with get_metrics().timer("parse", model=metadata_model_name):
+            (metadata,) = parse_executor.parse(
+                service, PageKind.Ad, body, city.name, listing_id
+            )
+        return listing_id, metadata
+
+    def write_metadata(
+        item: tuple[str, ListingAdditionalInfo | ListingGone],
+    ) -> tuple[str, str] | None:
+        listing_id, metadata = item
+        pool.run(metadata.to_db)
+        progress.update(1)
+        if isinstance(metadata, ListingGone):
+            return None
+        text_for_ai = getattr(metadata, service.info_for_ai.text_instance_attribute)
+        return listing_id, text_for_ai
+
+    def enrich(item: tuple[str, str]) -> ListingAIInfo:
+        listing_id, text_for_ai = item
+        ai_info = extract_ai_info(
+            listing_id, text_for_ai, ai_client, service, city.name
+        )
+        return ai_info
+
+    def write_ai_info(ai_info: ListingAIInfo) -> None:
+        pool.run(ai_info.to_db)
+        return None
+
+    parse_executor = get_parse_executor()
+    pipeline = Pipeline(
+        [
+            Stage("fetch", fetch, PIPELINE_WORKERS["fetch"]),
+            Stage("parse", parse, PIPELINE_WORKERS["parse"]),
+            Stage("db", write_metadata, PIPELINE_WORKERS["db"]),
+            Stage("ai", enrich, PIPELINE_WORKERS["ai"]),
+            Stage("ai_db", write_ai_info, PIPELINE_WORKERS["ai_db"]),
+        ]
+    )
+    pipeline.run(urls)
+    progress.close()
 
     return urls
 
 
+def process_missing_ai_metadata_batched(
+    pool: DbPool,
+    ai_client,
+    service: Service,
+    urls: list[tuple[str, str, str]],
+    city: City,
+) -> None:
+    """
+    Answers are saved after every batch, so a Gemini outage midway only loses
+    the batch in flight, not the answers already paid for
+    """
+    schema_class = service.listing_ai_metadata_schema_class
+    prompt_version = ai_prompt_version(service)
+    cache = get_ai_cache()
+    ai_info_class = service.listing_ai_metadata_model_class
+
+    def save(results: dict[str, ListingAIMetadata]) -> None:
+        if not results:
+            return None
+        ai_infos = [
+            ai_info_class.from_ai_metadata(inst, listing_id=listing_id, city=city.name)
+            for listing_id, inst in results.items()
+        ]
+        pool.run(ai_info_class.bulk_to_db, ai_infos)
+        return None
+
+    cached: dict[str, ListingAIMetadata] = {}
+    pending = []
+    for listing_id, _, text in urls:
+        inst = None
+        if cache is not None:
+            inst = cache.get(text, schema_class, prompt_version, AI_CACHED_MODELS)
+        if inst is None:
+            pending.append((listing_id, text))
+        else:
+            cached[listing_id] = inst
+    save(cached)
+
+    sizer = BatchSizer(AI_BATCH_TOKEN_BUDGET, AI_BATCH_MAX_ITEMS)
+    progress = tqdm.tqdm(total=len(pending), file=sys.stdout)
+    while pending:
+        batch = sizer.next_batch(pending)
+        pending = pending[len(batch) :]
+        save(extract_ai_info_batch(batch, ai_client, service, sizer))
+        progress.update(len(batch))
+    progress.close()
+    return None
+
+
 def process_missing_ai_metadata(
-    cursor, conn, ai_client, service: Service
+    pool: DbPool,
+    ai_client,
+    service: Service,
+    city: City,
+    batch_mode: bool = AI_BATCH_MODE,
 ) -> list[tuple[str, str]]:
-    urls = get_slugs_no_ai(cursor, service)
-    for listing_id, url, raw_info in tqdm.tqdm(urls, file=sys.stdout):
-        ai_info = extract_ai_info(listing_id, raw_info, ai_client, service)
-        ai_info.to_db(conn.cursor())
-        conn.commit()
-        time.sleep(random.randint(0, 1000) / 1000)
+    urls = pool.run(get_slugs_no_ai, service)
+    if batch_mode:
+        process_missing_ai_metadata_batched(pool, ai_client, service, urls, city)
+    else:
+        for listing_id, url, raw_info in tqdm.tqdm(urls, file=sys.stdout):
+            ai_info = extract_ai_info(
+                listing_id, raw_info, ai_client, service, city.name
+            )
+            pool.run(ai_info.to_db)
     urls_fixed = [x[:2] for x in urls]
     # noinspection PyTypeChecker
     return urls_fixed
 
 
-def check_alive(cursor, conn, service: Service) -> tuple[list[str], list[str]]:
-    urls = get_slugs_alive(cursor, service)
-    alive, dead = [], []
-    for listing_id, url in tqdm.tqdm(urls, file=sys.stdout):
-        body = get_html_url(url)
-        if body is None:
-            metadata = ListingGone(listing_id=listing_id, service=service.value)
-            metadata.to_db(cursor)
-            conn.commit()
-            dead.append(listing_id)
-        else:
-            alive.append(listing_id)
-        time.sleep(random.randint(0, 3000) / 1000)
+def check_alive(pool: DbPool, service: Service) -> tuple[list[str], list[str]]:
+    urls = pool.run(get_slugs_alive, service)
+
+    def write_dead(listing_ids: list[str]) -> None:
+        gone = [
+            ListingGone(listing_id=listing_id, service=service.value)
+            for listing_id in listing_ids
+        ]
+        pool.run(ListingGone.bulk_to_db, gone)
+        return None
+
+    alive, dead = check_urls_alive(urls, write_dead)
     return alive, dead
@@ -3,6 +3,9 @@ import math
 __all__ = [
     "haversine",
     "dist_from_root",
+    "to_int",
+    "to_float",
+    "to_str",
 ]
 
 
@@ -40,3 +43,31 @@ def dist_from_root(city: str, lat: float | None, lon: float | None):
     lat = lat or root[0]
     lon = lon or root[1]
     return haversine(*root, lat, lon)
+
+
+# The parsers build models without validation (Saveable.build), so the values
+# of the site's JSON are converted here, whatever type the site sent them in
+
+
+def to_int(value) -> int | None:
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(value) -> float | None:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_str(value) -> str | None:
+    if value is None:
+        return None
+    return str(value)
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import bisect
+import importlib.util
+import os
+import threading
+import time
+import typing
+from urllib.parse import urlparse
+
+import pydantic
+import requests
+import requests.adapters
+
+from helpers.http_replay import get_recorder, get_replay_config
+from helpers.rate_limiter import get_scheduler
+
+__all__ = [
+    "HttpClientConfig",
+    "HostStats",
+    "HttpClient",
+    "get_http_client",
+    "get_http_stats",
+    "TRANSPORT_ERRORS",
+]
+
+
+# Upper bounds (seconds) of the latency histogram buckets, the last one is +Inf
+LATENCY_BUCKETS_S = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class HttpClientConfig(pydantic.BaseModel):
+    pool_maxsize: int = 8
+    pool_block: bool = True
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls) -> HttpClientConfig:
+        defaults = cls()
+        inst = cls(
+            pool_maxsize=int(os.environ.get("HTTP_POOL_MAXSIZE", defaults.pool_maxsize)),
+            connect_timeout=float(
+                os.environ.get("HTTP_CONNECT_TIMEOUT", defaults.connect_timeout)
+            ),
+            read_timeout=float(
+                os.environ.get("HTTP_READ_TIMEOUT", defaults.read_timeout)
+            ),
+            http2=os.environ.get("HTTP2", "0").lower() in ("1", "true", "yes"),
+        )
+        return inst
+
+
+class HostStats(pydantic.BaseModel):
+    host: str
+    requests: int = 0
+    errors: int = 0
+    # None when the transport does not expose connection counts (HTTP/2 mode)
+    handshakes: int | None = None
+    bytes_received: int = 0
+    latency_sum_s: float = 0.0
+    latency_buckets: list[int] = pydantic.Field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS_S) + 1)
+    )
+
+    @property
+    def reuse_ratio(self) -> float | None:
+        if self.handshakes is None or not self.requests:
+            return None
+        return max(0.0, 1 - self.handshakes / self.requests)
+
+    def observe(self, latency_s: float, n_bytes: int, error: bool) -> None:
+        self.requests += 1
+        self.errors += int(error)
+        self.bytes_received += n_bytes
+        self.latency_sum_s += latency_s
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS_S, latency_s)] += 1
+        return None
+
+
+def _http2_available() -> bool:
+    return (
+        importlib.util.find_spec("httpx") is not None
+        and importlib.util.find_spec("h2") is not None
+    )
+
+
+class HttpClient:
+    """
+    Keeps one keep-alive session per host, so repeated queries to otodom.pl,
+    olx.pl and api.telegram.org reuse their TCP+TLS connections.
+    """
+
+    def __init__(self, config: HttpClientConfig | None = None):
+        self.config = config or HttpClientConfig.from_env()
+        if self.config.http2 and not _http2_available():
+            print("HTTP/2 requested, but httpx[http2] is not installed; using HTTP/1.1")
+            self.config = self.config.model_copy(update={"http2": False})
+        self._sessions: dict[str, typing.Any] = {}
+        self._stats: dict[str, HostStats] = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self) -> typing.Any:
+        if self.config.http2:
+            import httpx
+
+            session = httpx.Client(
+                http2=True,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.config.pool_maxsize,
+                    max_keepalive_connections=self.config.pool_maxsize,
+                ),
+                timeout=httpx.Timeout(
+                    self.config.read_timeout, connect=self.config.connect_timeout
+                ),
+            )
+            return session
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.config.pool_maxsize,
+            pool_block=self.config.pool_block,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, host: str) -> typing.Any:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._new_session()
+                self._sessions[host] = session
+                self._stats[host] = HostStats(host=host)
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> typing.Any:
+        # Stats and rate limits stay keyed on the real site when replaying
+        host = urlparse(url).netloc
+        session = self.session_for(host)
+        original_url = url
+        url, headers = get_replay_config().rewrite(url, kwargs.get("headers"))
+        if headers is not None:
+            kwargs["headers"] = headers
+        if not self.config.http2:
+            kwargs.setdefault(
+                "timeout", (self.config.connect_timeout, self.config.read_timeout)
+            )
+
+        scheduler = get_scheduler()
+        scheduler.acquire(host)
+
+        start = time.perf_counter()
+        response = None
+        try:
+            response = session.request(method, url, **kwargs)
+            return response
+        finally:
+            latency = time.perf_counter() - start
+            n_bytes = len(response.content) if response is not None else 0
+            error = response is None or response.status_code >= 400
+            with self._lock:
+                self._stats[host].observe(latency, n_bytes, error)
+            if response is not None:
+                scheduler.feedback(
+                    host, response.status_code, response.headers.get("Retry-After")
+                )
+                recorder = get_recorder()
+                if recorder is not None:
+                    recorder.record(method, original_url, kwargs, response)
+
+    def _handshakes(self, host: str) -> int | None:
+        session = self._sessions.get(host)
+        if session is None or self.config.http2:
+            return None
+        # Both http:// and https:// are mounted to the same adapter
+        adapters = {id(x): x for x in session.adapters.values()}
+        total = 0
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    total += pool.num_connections
+        return total
+
+    def stats(self) -> dict[str, HostStats]:
+        with self._lock:
+            res = {}
+            for host, stats in self._stats.items():
+                snapshot = stats.model_copy(deep=True)
+                snapshot.handshakes = self._handshakes(host)
+                res[host] = snapshot
+        return res
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+        return None
+
+
+TRANSPORT_ERRORS: tuple[type[Exception], ...] = (requests.exceptions.RequestException,)
+if _http2_available():
+    import httpx
+
+    TRANSPORT_ERRORS = TRANSPORT_ERRORS + (httpx.HTTPError,)
+
+
+_CLIENT: HttpClient | None = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = HttpClient()
+    return _CLIENT
+
+
+def get_http_stats() -> dict[str, HostStats]:
+    return get_http_client().stats()
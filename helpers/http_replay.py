@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import typing
+from urllib.parse import urlencode, urlparse, urlunparse
+
+__all__ = [
+    "ReplayConfig",
+    "Recorder",
+    "get_replay_config",
+    "get_recorder",
+    "recording_key",
+    "normalize_body",
+    "REPLAY_HOST_HEADER",
+    "REPLAY_SCHEME_HEADER",
+]
+
+
+# The stand-in server learns from these which site a redirected request was for
+REPLAY_HOST_HEADER = "X-Replay-Host"
+REPLAY_SCHEME_HEADER = "X-Replay-Scheme"
+
+# Response headers worth keeping in a recording
+RECORDED_HEADERS = ("Content-Type", "Retry-After", "Location")
+# Never written to disk: Telegram URLs carry the bot token and the bodies the
+# chat and thread ids, and the stand-in server synthesizes its answers anyway
+UNRECORDED_HOSTS = ("api.telegram.org",)
+
+
+def normalize_body(body: bytes | str | dict | None) -> str:
+    """
+    Request body in a form that is equal for the recorder and the server, no
+    matter how the client serialized it (key order, json= vs data=)
+    """
+    if body is None or body == b"" or body == "":
+        return ""
+    if isinstance(body, dict):
+        return json.dumps(body, sort_keys=True, ensure_ascii=False)
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        res = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        res = body
+    return res
+
+
+def recording_key(method: str, url: str, body: str) -> str:
+    res = hashlib.sha256(
+        json.dumps([method.upper(), url, body]).encode("utf-8")
+    ).hexdigest()
+    return res
+
+
+def request_body(kwargs: dict) -> str:
+    if kwargs.get("json") is not None:
+        return normalize_body(kwargs["json"])
+    data = kwargs.get("data")
+    if isinstance(data, dict):
+        return normalize_body(urlencode(data))
+    return normalize_body(data)
+
+
+class ReplayConfig:
+    """
+    HTTP_REPLAY_URL sends every outgoing request to a stand-in server (see
+    benchmarks/replay_server.py), keeping the original site in a header
+    """
+
+    def __init__(self, replay_url: str | None):
+        self.replay_url = replay_url.rstrip("/") if replay_url else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.replay_url is not None
+
+    def rewrite(self, url: str, headers: dict | None) -> tuple[str, dict | None]:
+        if not self.enabled:
+            return url, headers
+        parsed = urlparse(url)
+        target = urlparse(self.replay_url)
+        res = urlunparse(
+            (target.scheme, target.netloc, parsed.path, "", parsed.query, "")
+        )
+        headers = dict(headers or {})
+        headers[REPLAY_HOST_HEADER] = parsed.netloc
+        headers[REPLAY_SCHEME_HEADER] = parsed.scheme
+        return res, headers
+
+
+class Recorder:
+    """
+    Saves the responses the HTTP client gets, one JSON file per distinct
+    request under <directory>/<host>/, for the stand-in server to serve back;
+    hosts in UNRECORDED_HOSTS are skipped
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def record(
+        self, method: str, url: str, kwargs: dict, response: typing.Any
+    ) -> None:
+        host = urlparse(url).netloc
+        if host in UNRECORDED_HOSTS:
+            return None
+        body = request_body(kwargs)
+        key = recording_key(method, url, body)
+        entry = {
+            "method": method.upper(),
+            "url": url,
+            "request_body": body,
+            "status": response.status_code,
+            "headers": {
+                k: response.headers[k]
+                for k in RECORDED_HEADERS
+                if k in response.headers
+            },
+            "body": response.text,
+        }
+        host_dir = os.path.join(self.directory, host)
+        path = os.path.join(host_dir, f"{key}.json")
+        with self._lock:
+            os.makedirs(host_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+        return None
+
+
+_CONFIG: ReplayConfig | None = None
+_RECORDER: Recorder | None = None
+_LOCK = threading.Lock()
+
+
+def get_replay_config() -> ReplayConfig:
+    global _CONFIG
+    with _LOCK:
+        if _CONFIG is None:
+            _CONFIG = ReplayConfig(os.environ.get("HTTP_REPLAY_URL") or None)
+    return _CONFIG
+
+
+def get_recorder() -> Recorder | None:
+    """
+    The recorder writing to HTTP_RECORD_DIR, None when recording is off
+    """
+    global _RECORDER
+    directory = os.environ.get("HTTP_RECORD_DIR")
+    if not directory:
+        return None
+    with _LOCK:
+        if _RECORDER is None:
+            _RECORDER = Recorder(directory)
+    return _RECORDER
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import typing
+from urllib.parse import urlparse
+
+import httpx
+import tqdm
+
+from helpers.connection import get_random_user_agent
+from helpers.http_client import HttpClientConfig
+from helpers.http_replay import get_replay_config
+from helpers.metrics import get_metrics
+from helpers.rate_limiter import get_scheduler
+
+__all__ = [
+    "check_urls_alive",
+]
+
+
+# Max simultaneous probes per host, the request rate is up to the scheduler
+HOST_CONCURRENCY = {
+    "www.otodom.pl": 4,
+    "www.olx.pl": 4,
+}
+DEFAULT_CONCURRENCY = 2
+
+# HEAD answers that do not tell anything about the ad, retried with a ranged GET
+HEAD_UNSUPPORTED_STATUSES = {403, 405, 501}
+# Only a 429 is a throttle here: the crawl treats 403 as one too, but a 403 left
+# after the ranged GET is the answer for a removed ad, as it always was
+THROTTLED_STATUSES = {429}
+MAX_THROTTLED_RETRIES = 3
+
+WRITE_BATCH_SIZE = 50
+
+
+async def probe_status(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    headers = {
+        "User-Agent": get_random_user_agent(),
+        "Accept": "*/*",
+    }
+    url, headers = get_replay_config().rewrite(url, headers)
+    response = await client.head(url, headers=headers)
+    if response.status_code not in HEAD_UNSUPPORTED_STATUSES:
+        return response
+
+    # Ask for a single byte and never read the body: only the final status matters
+    headers["Range"] = "bytes=0-0"
+    async with client.stream("GET", url, headers=headers) as response:
+        return response
+
+
+async def probe(
+    client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str
+) -> bool:
+    host = urlparse(url).netloc
+    scheduler = get_scheduler()
+    async with semaphore:
+        for _ in range(MAX_THROTTLED_RETRIES + 1):
+            await scheduler.acquire_async(host)
+            try:
+                with get_metrics().timer("liveness_probe", host=host):
+                    response = await probe_status(client, url)
+            except httpx.HTTPError:
+                get_metrics().inc("liveness_probes_total", host=host, status="error")
+                return False
+            status = response.status_code
+            get_metrics().inc("liveness_probes_total", host=host, status=status)
+            if status in THROTTLED_STATUSES:
+                scheduler.feedback(host, status, response.headers.get("Retry-After"))
+                continue
+            if status < 400:
+                scheduler.feedback(host, status)
+            # 416 means the page exists but did not like the byte range
+            return status < 400 or status == 416
+    # Still throttled: we know nothing about the ad, so do not declare it dead
+    return True
+
+
+async def check_urls_alive_async(
+    urls: list[tuple[str, str]],
+    write_dead: typing.Callable[[list[str]], None],
+) -> tuple[list[str], list[str]]:
+    semaphores: dict[str, asyncio.Semaphore] = {}
+    for _, url in urls:
+        host = urlparse(url).netloc
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(
+                HOST_CONCURRENCY.get(host, DEFAULT_CONCURRENCY)
+            )
+
+    config = HttpClientConfig.from_env()
+    limits = httpx.Limits(
+        max_connections=sum(
+            HOST_CONCURRENCY.get(host, DEFAULT_CONCURRENCY) for host in semaphores
+        )
+        or None,
+    )
+    timeout = httpx.Timeout(config.read_timeout, connect=config.connect_timeout)
+
+    results: dict[str, bool] = {}
+    pending_dead: list[str] = []
+    async with httpx.AsyncClient(
+        follow_redirects=True, limits=limits, timeout=timeout
+    ) as client:
+
+        async def run_one(listing_id: str, url: str) -> tuple[str, bool]:
+            is_alive = await probe(client, semaphores[urlparse(url).netloc], url)
+            return listing_id, is_alive
+
+        tasks = [run_one(listing_id, url) for listing_id, url in urls]
+        for next_done in tqdm.tqdm(
+            asyncio.as_completed(tasks), total=len(tasks), file=sys.stdout
+        ):
+            listing_id, is_alive = await next_done
+            results[listing_id] = is_alive
+            if not is_alive:
+                pending_dead.append(listing_id)
+            if len(pending_dead) >= WRITE_BATCH_SIZE:
+                write_dead(pending_dead)
+                pending_dead = []
+
+    if pending_dead:
+        write_dead(pending_dead)
+
+    alive = [listing_id for listing_id, _ in urls if results[listing_id]]
+    dead = [listing_id for listing_id, _ in urls if not results[listing_id]]
+    return alive, dead
+
+
+def check_urls_alive(
+    urls: list[tuple[str, str]],
+    write_dead: typing.Callable[[list[str]], None],
+) -> tuple[list[str], list[str]]:
+    res = asyncio.run(check_urls_alive_async(urls, write_dead))
+    return res
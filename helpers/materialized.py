@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import typing
+
+import mysql.connector
+import mysql.connector.cursor
+
+from helpers.connection import is_transient_error
+from helpers.metrics import get_metrics
+
+__all__ = [
+    "refresh_listing_info_full",
+    "refresh_decisions",
+]
+
+
+TABLE_NAME = "listing_info_full"
+SOURCE_VIEW_NAME = "listing_info_full_source"
+
+
+def refresh_listing_info_full(
+    cursor: mysql.connector.cursor.MySQLCursor,
+    service: str,
+    listing_ids: typing.Iterable[str | int],
+) -> bool:
+    """
+    Recomputes the listing_info_full rows of the given listings from the source view.
+    Runs inside the caller's transaction: transient errors are raised so the
+    whole unit is retried (see DbPool.run), other errors undo just the refresh.
+    """
+    ids = sorted({str(x) for x in listing_ids})
+    if not ids:
+        return True
+    placeholders = ", ".join(["%s"] * len(ids))
+
+    delete_sql = f"""
+    delete from {TABLE_NAME}
+    where 1=1
+    and service = %s
+    and listing_id in ({placeholders})
+    """
+    insert_sql = f"""
+    insert into {TABLE_NAME}
+    select *
+    from {SOURCE_VIEW_NAME}
+    where 1=1
+    and service = %s
+    and listing_id in ({placeholders})
+    """
+    # OLX ads mirrored from Otodom are hidden once the Otodom original is known
+    delete_mirrors_sql = f"""
+    delete m
+    from {TABLE_NAME} as m
+    inner join listing_items_olx as o
+    on (m.listing_id = o.listing_id and m.service = 'olx')
+    inner join listing_items as a
+    on (o.slug_external = a.slug)
+    where a.listing_id in ({placeholders})
+    """
+
+    cursor.execute("savepoint refresh_listing_info_full")
+    try:
+        with get_metrics().timer("db", model=TABLE_NAME, op="refresh"):
+            cursor.execute(delete_sql, [service, *ids])
+            cursor.execute(insert_sql, [service, *ids])
+            if service == "otodom":
+                cursor.execute(delete_mirrors_sql, ids)
+        return True
+    except mysql.connector.Error as err:
+        if is_transient_error(err):
+            raise
+        print(f"Error during {TABLE_NAME} refresh for {service}: {err}")
+        # Keep the listings as they were rather than commit them deleted
+        cursor.execute("rollback to savepoint refresh_listing_info_full")
+        return False
+
+
+def refresh_decisions(cursor: mysql.connector.cursor.MySQLCursor) -> bool:
+    """
+    Decisions are written outside of this codebase, so they are synced in bulk,
+    touching only the rows whose decision differs
+    """
+    set_sql = f"""
+    update {TABLE_NAME} as m
+    inner join decisions as d
+    on (m.listing_id = d.listing_id and m.service = d.service)
+    set m.our_decision = d.our_decision
+    where not (m.our_decision <=> d.our_decision)
+    """
+    unset_sql = f"""
+    update {TABLE_NAME} as m
+    left join decisions as d
+    on (m.listing_id = d.listing_id and m.service = d.service)
+    set m.our_decision = null
+    where 1=1
+    and d.listing_id is null
+    and m.our_decision is not null
+    """
+    try:
+        cursor.execute(set_sql)
+        cursor.execute(unset_sql)
+        return True
+    except mysql.connector.Error as err:
+        if is_transient_error(err):
+            raise
+        print(f"Error during {TABLE_NAME} decisions refresh: {err}")
+        return False
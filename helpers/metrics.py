@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+import typing
+
+__all__ = [
+    "Metrics",
+    "get_metrics",
+    "write_run_metrics",
+    "timing_breakdown",
+]
+
+
+PREFIX = "scraper_"
+DEFAULT_METRICS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "metrics",
+)
+# Upper bounds (seconds) of the histogram buckets of every timer, the last one is +Inf
+DURATION_BUCKETS_S = (0.001, 0.005, 0.025, 0.1, 0.25, 1.0, 2.5, 10.0, 30.0, 120.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, typing.Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: dict[str, str] | None = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + inner + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: typing.Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        return None
+
+
+class Metrics:
+    """
+    In-process counters and histograms of one runner run, exported at its end
+    as a Prometheus textfile (for node_exporter) and a JSON summary.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters: dict[str, dict[LabelKey, float]] = {}
+        self.histograms: dict[str, dict[LabelKey, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        return None
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: typing.Sequence[float] = DURATION_BUCKETS_S,
+        **labels,
+    ) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(buckets)
+            hist.observe(value)
+        return None
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> typing.Iterator[None]:
+        """
+        Observes the duration of the block into the `<name>_seconds` histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def collect_sources(self) -> None:
+        """
+        Copies the figures other modules already keep (HTTP client, scheduler,
+        AI cache, page extraction paths) into counters, replacing older copies
+        """
+        from helpers.ai_cache import _CACHE
+        from helpers.http_client import LATENCY_BUCKETS_S, get_http_stats
+        from helpers.next_data import PATH_COUNTS
+        from helpers.next_data_route import ROUTE_COUNTS
+        from helpers.rate_limiter import get_scheduler
+
+        counters: dict[str, dict[LabelKey, float]] = {}
+        histograms: dict[str, dict[LabelKey, Histogram]] = {}
+
+        def put(name: str, value: float, **labels) -> None:
+            counters.setdefault(name, {})[_label_key(labels)] = value
+
+        for host, stats in get_http_stats().items():
+            put("http_requests_total", stats.requests, host=host)
+            put("http_errors_total", stats.errors, host=host)
+            put("http_received_bytes_total", stats.bytes_received, host=host)
+            if stats.handshakes is not None:
+                put("http_handshakes_total", stats.handshakes, host=host)
+            hist = Histogram(LATENCY_BUCKETS_S)
+            hist.counts = list(stats.latency_buckets)
+            hist.sum = stats.latency_sum_s
+            hist.count = stats.requests
+            histograms.setdefault("http_request_seconds", {})[
+                _label_key({"host": host})
+            ] = hist
+        for key, waited_s in get_scheduler().waited_s.items():
+            put("rate_limit_wait_seconds_total", waited_s, budget=key)
+        for path, n in PATH_COUNTS.items():
+            put("next_data_extractions_total", n, path=path.value)
+        for mode, n in ROUTE_COUNTS.items():
+            put("next_data_fetches_total", n, mode=mode.value)
+        if _CACHE is not None:
+            for field, n in _CACHE.stats.model_dump().items():
+                put(f"ai_cache_{field}_total", n)
+
+        with self._lock:
+            self.counters.update(counters)
+            for name, series in histograms.items():
+                self.histograms.setdefault(name, {}).update(series)
+        return None
+
+    def to_prometheus(self, extra_labels: dict[str, str] | None = None) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                full_name = PREFIX + name
+                kind = "counter" if name.endswith("_total") else "gauge"
+                lines.append(f"# TYPE {full_name} {kind}")
+                for key, value in sorted(series.items()):
+                    labels = _format_labels(key, extra_labels)
+                    lines.append(f"{full_name}{labels} {value}")
+            for name, series in sorted(self.histograms.items()):
+                full_name = PREFIX + name
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                        cumulative += n
+                        labels = _format_labels(
+                            key, dict(extra_labels or {}, le=str(bound))
+                        )
+                        lines.append(f"{full_name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(key, extra_labels)
+                    lines.append(f"{full_name}_sum{labels} {hist.sum}")
+                    lines.append(f"{full_name}_count{labels} {hist.count}")
+        lines.append(f"# TYPE {PREFIX}run_finished_timestamp_seconds gauge")
+        lines.append(
+            f"{PREFIX}run_finished_timestamp_seconds{_format_labels((), extra_labels)} "
+            f"{time.time()}"
+        )
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        with self._lock:
+            res = {
+                "started_at": datetime.datetime.fromtimestamp(
+                    self.started_at
+                ).isoformat(),
+                "duration_s": time.time() - self.started_at,
+                "counters": {
+                    name: {
+                        _format_labels(key) or "total": value
+                        for key, value in series.items()
+                    }
+                    for name, series in self.counters.items()
+                },
+                "timers": {
+                    name: {
+                        _format_labels(key) or "total": {
+                            "count": hist.count,
+                            "sum": hist.sum,
+                            "mean": hist.sum / hist.count if hist.count else None,
+                        }
+                        for key, hist in series.items()
+                    }
+                    for name, series in self.histograms.items()
+                },
+            }
+        return res
+
+
+def _write_atomically(path: str, text: str) -> None:
+    # node_exporter must never read a half-written file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return None
+
+
+def write_run_metrics(runner: str, city: str | None) -> tuple[str, str] | None:
+    """
+    Writes <runner>_<city>.prom and <runner>_<city>.json to METRICS_DIR
+    (METRICS_DIR="" turns the export off), returns their paths. A process
+    serving several cities passes no city and writes <runner>.prom/.json.
+    """
+    directory = os.environ.get("METRICS_DIR", DEFAULT_METRICS_DIR)
+    if not directory:
+        return None
+    metrics = get_metrics()
+    metrics.collect_sources()
+    if city is None:
+        base = os.path.join(directory, runner)
+        labels = {"runner": runner}
+    else:
+        base = os.path.join(directory, f"{runner}_{city.lower()}")
+        labels = {"runner": runner, "city": city}
+    _write_atomically(f"{base}.prom", metrics.to_prometheus(labels))
+    _write_atomically(f"{base}.json", json.dumps(metrics.summary(), indent=2))
+    return f"{base}.prom", f"{base}.json"
+
+
+def timing_breakdown(top: int = 6) -> str:
+    """
+    Compact "where did the time go" lines: the timers with the largest total
+    """
+    metrics = get_metrics()
+    metrics.collect_sources()
+    totals = []
+    with metrics._lock:
+        for name, series in metrics.histograms.items():
+            for key, hist in series.items():
+                label = ",".join(v for _, v in key)
+                title = name.removesuffix("_seconds") + (f"[{label}]" if label else "")
+                totals.append((hist.sum, hist.count, title))
+        for key, waited_s in metrics.counters.get(
+            "rate_limit_wait_seconds_total", {}
+        ).items():
+            label = ",".join(v for _, v in key)
+            totals.append((waited_s, None, f"rate_limit_wait[{label}]"))
+    totals.sort(reverse=True)
+    lines = [
+        f"{title}: {total:.1f}s" + (f" / {count}" if count is not None else "")
+        for total, count, title in totals[:top]
+    ]
+    return "\n".join(lines)
+
+
+_METRICS: Metrics | None = None
+_METRICS_LOCK = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    global _METRICS
+    with _METRICS_LOCK:
+        if _METRICS is None:
+            _METRICS = Metrics()
+    return _METRICS
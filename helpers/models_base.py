@@ -3,12 +3,18 @@ from __future__ import annotations
 import abc
 import datetime
 import enum
+import functools
+import os
 import typing
 
 import mysql.connector
 import mysql.connector.cursor
 import pydantic
 
+from helpers.connection import is_transient_error
+from helpers.materialized import refresh_listing_info_full
+from helpers.metrics import get_metrics
+
 __all__ = [
     "Saveable",
     "ListingItem",
@@ -16,35 +22,106 @@ __all__ = [
     "ListingAIMetadata",
     "ListingAIInfo",
     "ListingGone",
+    "CrawlWatermark",
     "Service",
 ]
 
 
+# MODEL_VALIDATION=strict validates parsed records in full, for debugging parsers
+STRICT_MODELS = os.environ.get("MODEL_VALIDATION", "") == "strict"
+
+
 class Service(enum.Enum):
     Otodom = "otodom"
     OLX = "olx"
 
 
+_NEEDS_FACTORY: dict[str, typing.Any] = {}
+_FIELD_DEFAULTS: dict[type, dict[str, typing.Any]] = {}
+
+
+def _field_defaults(cls: type[pydantic.BaseModel]) -> dict[str, typing.Any]:
+    """
+    Every field of a model in declaration order with its default (None for
+    required ones), _NEEDS_FACTORY if some default has to come from a factory
+    """
+    res = {}
+    for name, field in cls.model_fields.items():
+        if field.default_factory is not None:
+            return _NEEDS_FACTORY
+        res[name] = None if field.is_required() else field.default
+    return res
+
+
 class Saveable(pydantic.BaseModel):
 
     TABLE_NAME: typing.ClassVar[str]
+    # Service whose listing_info_full rows are built from this table, if any
+    MATERIALIZED_SERVICE: typing.ClassVar[str | None] = None
+
+    def materialized_service(self) -> str | None:
+        return self.__class__.MATERIALIZED_SERVICE
+
+    @staticmethod
+    def refresh_materialized(
+        cursor: mysql.connector.cursor.MySQLCursor,
+        items: typing.Sequence[Saveable],
+    ) -> None:
+        by_service: dict[str, list] = {}
+        for item in items:
+            service = item.materialized_service()
+            if service is not None:
+                by_service.setdefault(service, []).append(item.listing_id)
+        for service, listing_ids in by_service.items():
+            refresh_listing_info_full(cursor, service, listing_ids)
+        return None
 
-    def to_db(self, cursor: mysql.connector.cursor.MySQLCursor) -> bool:
-        try:
-            item_data = self.model_dump(exclude_none=True)  # Pydantic v2+
-        except AttributeError:
-            item_data = self.dict(exclude_none=True)  # Pydantic v1
+    @classmethod
+    def build(cls, data: dict[str, typing.Any]) -> typing.Self:
+        """
+        Instance from values the parser has already normalized to the field
+        types. Skips validation, unless MODEL_VALIDATION=strict, where it is
+        validated in pydantic's strict mode to catch parsers that do not.
+        Sets the fields directly: model_construct is slower than validating.
+        """
+        if STRICT_MODELS:
+            return cls.model_validate(data, strict=True)
+        defaults = _FIELD_DEFAULTS.get(cls)
+        if defaults is None:
+            defaults = _FIELD_DEFAULTS[cls] = _field_defaults(cls)
+        if defaults is _NEEDS_FACTORY:
+            return cls.model_construct(**data)
+        values = defaults.copy()
+        values.update(data)  # keeps the field order of the template
+        inst = cls.__new__(cls)
+        object.__setattr__(inst, "__dict__", values)
+        object.__setattr__(inst, "__pydantic_fields_set__", set(data))
+        object.__setattr__(inst, "__pydantic_extra__", None)
+        object.__setattr__(inst, "__pydantic_private__", None)
+        return inst
+
+    def db_row(self) -> tuple[tuple[str, ...], tuple]:
+        """
+        Non-null columns and their values, ready for execute / executemany
+        """
+        data = self.model_dump(exclude_none=True)
+        return tuple(data), tuple(data.values())
 
+    def _item_data(self) -> dict:
+        return self.model_dump(exclude_none=True)
+
+    @staticmethod
+    @functools.cache
+    def upsert_sql(table_name: str, columns: tuple[str, ...]) -> str:
         # Prepare column names and values for the INSERT part
-        columns = ", ".join(item_data.keys())
+        columns_str = ", ".join(columns)
         # Use %s as placeholders for values to prevent SQL injection
-        placeholders = ", ".join(["%s"] * len(item_data))
-        values = list(item_data.values())
+        placeholders = ", ".join(["%s"] * len(columns))
 
         # Prepare the ON DUPLICATE KEY UPDATE part
         # We update all fields except the primary key (listing_id)
         upd_fields_list = [
-            f"{col} = VALUES({col})" for col in item_data.keys() if col != "listing_id"
+            f"{col} = VALUES({col})" for col in columns if col != "listing_id"
         ]
         if upd_fields_list:
             update_fields = ", ".join(upd_fields_list)
@@ -54,19 +131,65 @@ class Saveable(pydantic.BaseModel):
 
         # Construct the full SQL query
         sql = f"""
-        INSERT INTO {self.__class__.TABLE_NAME} ({columns})
+        INSERT INTO {table_name} ({columns_str})
         VALUES ({placeholders})
         {update_stmt}
         """
+        return sql
+
+    def to_db(self, cursor: mysql.connector.cursor.MySQLCursor) -> bool:
+        columns, values = self.db_row()
+        sql = self.upsert_sql(self.__class__.TABLE_NAME, columns)
+        metrics = get_metrics()
 
         try:
-            cursor.execute(sql, values)
-            return True
+            with metrics.timer("db", model=self.__class__.__name__, op="upsert"):
+                cursor.execute(sql, values)
         except mysql.connector.Error as err:
+            # Left to the caller (DbPool.run), which runs the transaction again
+            if is_transient_error(err):
+                raise
             print(f"Error during upsert for {self}: {err}")
             return False
-        else:
-            return False
+        metrics.inc("db_rows_total", model=self.__class__.__name__, op="upsert")
+        self.refresh_materialized(cursor, [self])
+        return True
+
+    @classmethod
+    def bulk_to_db(
+        cls,
+        cursor: mysql.connector.cursor.MySQLCursor,
+        items: typing.Sequence[Saveable],
+    ) -> bool:
+        # Items with different sets of non-null columns need different
+        # statements, so group them and send one multi-row upsert per group
+        groups: dict[tuple[str, tuple[str, ...]], list[tuple]] = {}
+        group_items: dict[tuple[str, tuple[str, ...]], list[Saveable]] = {}
+        for item in items:
+            columns, values = item.db_row()
+            key = (item.__class__.TABLE_NAME, columns)
+            groups.setdefault(key, []).append(values)
+            group_items.setdefault(key, []).append(item)
+
+        success = True
+        metrics = get_metrics()
+        for (table_name, columns), rows in groups.items():
+            sql = cls.upsert_sql(table_name, columns)
+            model = group_items[(table_name, columns)][0].__class__.__name__
+            try:
+                with metrics.timer("db", model=model, op="bulk_upsert"):
+                    cursor.executemany(sql, rows)
+            except mysql.connector.Error as err:
+                if is_transient_error(err):
+                    raise
+                print(
+                    f"Error during bulk upsert of {len(rows)} rows into {table_name}: {err}"
+                )
+                success = False
+                continue
+            metrics.inc("db_rows_total", len(rows), model=model, op="bulk_upsert")
+            cls.refresh_materialized(cursor, group_items[(table_name, columns)])
+        return success
 
     def is_present_in_db(self, cursor: mysql.connector.cursor.MySQLCursor) -> bool:
 
@@ -86,6 +209,30 @@ class Saveable(pydantic.BaseModel):
         else:
             return False
 
+    @classmethod
+    def present_ids(
+        cls,
+        cursor: mysql.connector.cursor.MySQLCursor,
+        ids: typing.Sequence[str | int],
+    ) -> set[str]:
+        if not ids:
+            return set()
+
+        placeholders = ", ".join(["%s"] * len(ids))
+        sql = f"""
+        select listing_id from {cls.TABLE_NAME}
+        where listing_id in ({placeholders})
+        """
+
+        try:
+            with get_metrics().timer("db", model=cls.__name__, op="present_ids"):
+                cursor.execute(sql, [str(x) for x in ids])
+                res = cursor.fetchall()
+            return {str(x[0]) for x in res}
+        except mysql.connector.Error as err:
+            print(f"Error during bulk id check for {cls.__name__}: {err}")
+            return set()
+
     def is_present_in_db_slug_external(
         self, cursor: mysql.connector.cursor.MySQLCursor
     ) -> bool:
@@ -106,10 +253,7 @@ class Saveable(pydantic.BaseModel):
             return False
 
     def to_db_patch(self, cursor: mysql.connector.cursor.MySQLCursor) -> bool:
-        try:
-            item_data = self.model_dump(exclude_none=True)  # Pydantic v2+
-        except AttributeError:
-            item_data = self.dict(exclude_none=True)  # Pydantic v1
+        item_data = self._item_data()
 
         # Prepare the ON DUPLICATE KEY UPDATE part
         # We update all fields except the primary key (listing_id)
@@ -125,14 +269,16 @@ class Saveable(pydantic.BaseModel):
         and listing_id = %(listing_id)s
         """
 
+        metrics = get_metrics()
         try:
-            cursor.execute(sql, item_data)
-            return True
+            with metrics.timer("db", model=self.__class__.__name__, op="update"):
+                cursor.execute(sql, item_data)
         except mysql.connector.Error as err:
             print(f"Error during update for {self}: {err}")
             return False
-        else:
-            return False
+        metrics.inc("db_rows_total", model=self.__class__.__name__, op="update")
+        self.refresh_materialized(cursor, [self])
+        return True
 
 
 class ListingItem(Saveable, abc.ABC):
@@ -147,7 +293,7 @@ class ListingItem(Saveable, abc.ABC):
     TABLE_NAME: typing.ClassVar[str] = NotImplemented
 
     @classmethod
-    def from_text(cls, text: str) -> list[ListingItem]:
+    def from_text(cls, text: str, city: str) -> list[ListingItem]:
         raise NotImplementedError()
 
 
@@ -196,10 +342,13 @@ class ListingAIInfo(ListingAIMetadata, Saveable, abc.ABC):
         listing_id: str,
         city: str,
     ) -> ListingAIInfo:
-        inst = cls(
-            listing_id=listing_id,
-            **ai_metadata.model_dump(mode="python"),
-            updated_at=datetime.datetime.utcnow(),
+        # The metadata was validated when the answer was parsed
+        inst = cls.build(
+            {
+                "listing_id": listing_id,
+                **dict(ai_metadata),
+                "updated_at": datetime.datetime.utcnow(),
+            }
         )
         inst.augment(city=city)
         return inst
@@ -210,3 +359,75 @@ class ListingGone(Saveable):
     service: str
 
     TABLE_NAME: typing.ClassVar[str] = "irrelevant_listings"
+
+    def materialized_service(self) -> str | None:
+        return self.service
+
+
+class CrawlWatermark(Saveable):
+    service: str
+    last_listing_id: str
+    created_on: datetime.datetime
+    updated_at: datetime.datetime
+
+    TABLE_NAME: typing.ClassVar[str] = "crawl_watermarks"
+
+    @classmethod
+    def load(
+        cls, cursor: mysql.connector.cursor.MySQLCursor, service: str
+    ) -> CrawlWatermark | None:
+        sql = f"""
+        select service, last_listing_id, created_on, updated_at
+        from {cls.TABLE_NAME}
+        where service = %(service)s
+        """
+
+        try:
+            cursor.execute(sql, {"service": service})
+            res = cursor.fetchall()
+        except mysql.connector.Error as err:
+            print(f"Error during watermark load for {service}: {err}")
+            return None
+        if not res:
+            return None
+        columns = ["service", "last_listing_id", "created_on", "updated_at"]
+        inst = cls(**dict(zip(columns, res[0])))
+        return inst
+
+    @classmethod
+    def advance(
+        cls,
+        current: CrawlWatermark | None,
+        items: typing.Sequence[ListingItem],
+        service: str,
+    ) -> CrawlWatermark | None:
+        """
+        Returns a watermark moved to the newest of `items`, never moving it back
+        """
+        res = current
+        for item in items:
+            created_on = getattr(item, "created_on", None)
+            if created_on is None:
+                continue
+            if res is None or created_on > res.created_on:
+                res = cls(
+                    service=service,
+                    last_listing_id=str(item.listing_id),
+                    created_on=created_on,
+                    updated_at=datetime.datetime.utcnow(),
+                )
+        return res
+
+    def is_passed_by(self, items: typing.Sequence[ListingItem], tail: int) -> bool:
+        """
+        True when the last `tail` dated items of a page are not newer than the
+        watermark. Only the tail is checked: promoted and bumped old ads float
+        to the top of the page and must not end the crawl early.
+        """
+        dated = [
+            item.created_on
+            for item in items
+            if getattr(item, "created_on", None) is not None
+        ]
+        last = dated[-tail:]
+        return bool(last) and all(x <= self.created_on for x in last)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import datetime
+import os
 import typing
 import json
 
@@ -11,10 +13,12 @@ from helpers.models_base import (
     ListingAIMetadata,
     ListingAdditionalInfo,
     ListingAIInfo,
+    Service,
 )
-from helpers.helper_functions import dist_from_root
-from helpers.connection import query_url_as_human, CITY
-from helpers.olx_graphql import OLX_QUERY, SEARCH_PARAMS
+from helpers.helper_functions import dist_from_root, to_float, to_str
+from helpers.city import City
+from helpers.connection import query_url_as_human
+from helpers.olx_graphql import QUERY_PROFILES, SEARCH_PARAMS, check_query_profile
 
 __all__ = [
     "Saveable",
@@ -39,16 +43,27 @@ def int_from_text(text: str | None) -> int | None:
     if text is None:
         return None
     try:
-        res = int(text.split(" ")[0])
+        res = int(str(text).split(" ")[0])
     except ValueError:
         res = None
     return res
 
 
+def created_on_from_text(text: str | None) -> datetime.datetime | None:
+    if not text:
+        return None
+    try:
+        res = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    # Local (Polish) wall time, like Otodom's dateCreatedFirst
+    return res.replace(tzinfo=None)
+
+
 def floor_from_text(text: str | None) -> int | None:
     if text is None:
         return None
-    if text.lower() == "parter":
+    if str(text).lower() == "parter":
         return 0
     return int_from_text(text)
 
@@ -63,6 +78,8 @@ class ListingItemOLX(ListingItem):
     latitude: str | None = pydantic.Field(default=None)
     longitude: str | None = pydantic.Field(default=None)
     slug_external: str | None = pydantic.Field(default=None)
+    # Only used to track the crawl watermark, there is no such column
+    created_on: datetime.datetime | None = pydantic.Field(default=None, exclude=True)
 
     distance_from_center_km: float
 
@@ -70,43 +87,71 @@ class ListingItemOLX(ListingItem):
     raw_info: str
 
     TABLE_NAME: typing.ClassVar[str] = "listing_items_olx"
+    MATERIALIZED_SERVICE: typing.ClassVar[str | None] = Service.OLX.value
+    # Fields of the search response read by from_text / from_jo_single,
+    # every query profile has to select them
+    GRAPHQL_FIELDS: typing.ClassVar[tuple[str, ...]] = tuple(
+        f"clientCompatibleListings.data.{x}"
+        for x in (
+            "id",
+            "title",
+            "url",
+            "created_time",
+            "description",
+            "external_url",
+            "location.district.name",
+            "map.lat",
+            "map.lon",
+            "params.key",
+            "params.value.key",
+            "params.value.label",
+            "params.value.value",
+        )
+    )
 
     @classmethod
-    def from_jo_single(cls, obj: dict) -> ListingItemOLX:
+    def from_jo_single(cls, obj: dict, city: str) -> ListingItemOLX:
         params = obj["params"]
         lat, lon = obj.get("map", {}).get("lat"), obj.get("map", {}).get("lon")
-        inst = ListingItemOLX(
-            listing_id=str(obj["id"]),
-            title=obj["title"],
-            slug=obj["url"].split("/")[-1].split(".")[0],
-            rent_price=get_by_key(params, "price", "value"),
-            allowed_with_pets=str_to_bool(get_by_key(params, "pets", "key")),
-            n_rooms=int_from_text(get_by_key(params, "rooms", "label")),
-            administrative_price=int_from_text(get_by_key(params, "rent", "key")),
-            area_m2=int_from_text(get_by_key(params, "m", "key")),
-            floor=floor_from_text(get_by_key(params, "floor_select", "label")),
-            description_long=obj["description"],
-            raw_info=obj["description"],
-            district=(obj.get("location", {}).get("district", {}) or {}).get("name"),
-            has_lift=str_to_bool(get_by_key(params, "winda", "key")),
-            latitude=str(lat),
-            longitude=str(lon),
-            distance_from_center_km=dist_from_root(CITY, lat, lon),
-            slug_external=(
-                obj["external_url"].split("/")[-1].split(".")[0]
-                if obj.get("external_url")
-                else None
-            ),
+        inst = ListingItemOLX.build(
+            {
+                "listing_id": str(obj["id"]),
+                "title": str(obj["title"]),
+                "slug": obj["url"].split("/")[-1].split(".")[0],
+                "rent_price": to_float(get_by_key(params, "price", "value")),
+                "allowed_with_pets": str_to_bool(get_by_key(params, "pets", "key")),
+                "n_rooms": int_from_text(get_by_key(params, "rooms", "label")),
+                "administrative_price": int_from_text(
+                    get_by_key(params, "rent", "key")
+                ),
+                "area_m2": int_from_text(get_by_key(params, "m", "key")),
+                "floor": floor_from_text(get_by_key(params, "floor_select", "label")),
+                "description_long": obj["description"],
+                "raw_info": obj["description"],
+                "district": to_str(
+                    (obj.get("location", {}).get("district", {}) or {}).get("name")
+                ),
+                "has_lift": str_to_bool(get_by_key(params, "winda", "key")),
+                "latitude": str(lat),
+                "longitude": str(lon),
+                "distance_from_center_km": dist_from_root(city, lat, lon),
+                "slug_external": (
+                    obj["external_url"].split("/")[-1].split(".")[0]
+                    if obj.get("external_url")
+                    else None
+                ),
+                "created_on": created_on_from_text(obj.get("created_time")),
+            }
         )
         return inst
 
     @classmethod
-    def from_text(cls, text: str) -> list[ListingItemOLX]:
+    def from_text(cls, text: str, city: str) -> list[ListingItemOLX]:
         listing_items = []
         jo = json.loads(text)
         res = jo["data"]["clientCompatibleListings"].get("data", [])
         for offer in res:
-            inst = cls.from_jo_single(offer)
+            inst = cls.from_jo_single(offer, city)
             listing_items.append(inst)
 
         return listing_items
@@ -132,6 +177,7 @@ def str_to_bool(s: str | None) -> bool | None:
 
 class ListingAdditionalInfoOLX(ListingAdditionalInfo):
     TABLE_NAME: typing.ClassVar[str] = "listing_metadata_olx"
+    MATERIALIZED_SERVICE: typing.ClassVar[str | None] = Service.OLX.value
 
 
 class ListingAIMetadataOLX(ListingAIMetadata):
@@ -168,27 +214,54 @@ CITY_TO_LOCAL_NAME = {
 
 class ListingAIInfoOLX(ListingAIInfo, ListingAIMetadataOLX, Saveable):
     TABLE_NAME: typing.ClassVar[str] = "listing_ai_metadata_olx"
+    MATERIALIZED_SERVICE: typing.ClassVar[str | None] = Service.OLX.value
 
 
 BASE_URL = "https://www.olx.pl/apigateway/graphql"
 
 LIMIT = 40
 
+OLX_QUERY_PROFILE = os.environ.get("OLX_QUERY_PROFILE", "crawl")
+if OLX_QUERY_PROFILE not in QUERY_PROFILES:
+    raise ValueError(
+        f"Unknown OLX_QUERY_PROFILE {OLX_QUERY_PROFILE!r}, use one of {list(QUERY_PROFILES)}"
+    )
+for _profile in QUERY_PROFILES:
+    check_query_profile(_profile, ListingItemOLX.GRAPHQL_FIELDS)
+
 
-def get_page(page_num: int) -> str:
-    offset = page_num * LIMIT
-    search_params_current = SEARCH_PARAMS[CITY].copy()
+# OLX refuses offsets beyond this, see helpers.olx_partition for deeper crawls
+MAX_OFFSET = 1000
+
+
+def query_search(
+    search_params: list[dict], offset: int, profile: str = OLX_QUERY_PROFILE
+) -> str | None:
+    search_params_current = search_params.copy()
     search_params_current.append({"key": "limit", "value": str(LIMIT)})
     search_params_current.append({"key": "offset", "value": str(offset)})
     params = {
-        "query": OLX_QUERY,
+        "query": QUERY_PROFILES[profile],
         "variables": {
             "searchParameters": search_params_current,
         },
     }
-    if offset > 1000:
-        return "{}"
-
     res = query_url_as_human(url=BASE_URL, method="POST", body=params)
-    text = res.text
+    if res is None:
+        return None
+    return res.text
+
+
+def get_page(page_num: int, city: City, profile: str = OLX_QUERY_PROFILE) -> str:
+    offset = page_num * LIMIT
+    if offset > MAX_OFFSET:
+        return "{}"
+    text = query_search(SEARCH_PARAMS[city.name], offset, profile)
     return text
+
+
+def get_ad_page(url: str) -> str | None:
+    res = query_url_as_human(url)
+    if res is None:
+        return None
+    return res.text
@@ -4,7 +4,6 @@ import datetime
 import typing
 import json
 
-from bs4 import BeautifulSoup
 import pydantic
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
@@ -15,9 +14,12 @@ from helpers.models_base import (
     ListingAIInfo,
     ListingGone,
     ListingAIMetadata,
+    Service,
 )
-from helpers.helper_functions import dist_from_root
-from helpers.connection import query_url_as_human, CITY
+from helpers.helper_functions import dist_from_root, to_float, to_int, to_str
+from helpers.next_data import extract_next_data, html_to_text
+from helpers.next_data_route import get_next_data_route
+from helpers.city import City
 
 __all__ = [
     "ListingItemOtodom",
@@ -44,6 +46,7 @@ class ListingItemOtodom(ListingItem):
     created_on: datetime.datetime | None = pydantic.Field(default=None)
 
     TABLE_NAME: typing.ClassVar[str] = "listing_items"
+    MATERIALIZED_SERVICE: typing.ClassVar[str | None] = Service.Otodom.value
 
     @classmethod
     def from_otodom_data(cls, item: dict) -> ListingItem:
@@ -56,28 +59,26 @@ class ListingItemOtodom(ListingItem):
             created_on = datetime.datetime.strptime(created_on, "%Y-%m-%d %H:%M:%S")
 
         data = dict(
-            listing_id=item["id"],
-            title=item["title"],
-            slug=item["slug"],
-            rent_price=(item.get("totalPrice") or {}).get("value"),
-            administrative_price=(item.get("rentPrice") or {}).get("value"),
-            area_m2=item.get("areaInSquareMeters"),
+            listing_id=int(item["id"]),
+            title=str(item["title"]),
+            slug=str(item["slug"]),
+            rent_price=to_float((item.get("totalPrice") or {}).get("value")),
+            administrative_price=to_float((item.get("rentPrice") or {}).get("value")),
+            area_m2=to_float(item.get("areaInSquareMeters")),
             n_rooms=get_rooms_number(item.get("roomsNumber")),
-            street=street_info.get("name"),
-            street_number=street_info.get("number"),
+            street=to_str(street_info.get("name")),
+            street_number=to_str(street_info.get("number")),
             district=district,
             district_specific=district_specific,
             created_on=created_on,
         )
-        inst = cls(**data)
+        inst = cls.build(data)
         return inst
 
     @classmethod
-    def from_text(cls, text: str) -> list[ListingItemOtodom]:
+    def from_text(cls, text: str, city: str) -> list[ListingItemOtodom]:
         listing_items = []
-        soup = BeautifulSoup(text, "html.parser")
-        script = soup.find_all("script")[-1].text
-        body = json.loads(script)
+        body, _ = extract_next_data(text)
         listings = get_listings(body)
         for listing in listings[:-1]:
             inst = cls.from_otodom_data(listing)
@@ -99,16 +100,13 @@ class ListingAdditionalInfoOtodom(ListingAdditionalInfo):
     distance_from_center_km: float
 
     TABLE_NAME: typing.ClassVar[str] = "listing_metadata"
+    MATERIALIZED_SERVICE: typing.ClassVar[str | None] = Service.Otodom.value
 
     @classmethod
     def from_text(
         cls, text: str, listing_id: str, city: str
     ) -> ListingAdditionalInfoOtodom | ListingGone:
-        from services import Service
-
-        soup = BeautifulSoup(text, "html.parser")
-        script = soup.find_all("script")[-1].text
-        info = json.loads(script)
+        info, _ = extract_next_data(text)
         if info.get("page") == "/pl/wyniki/[[...searchingCriteria]]":
             res = ListingGone(listing_id=listing_id, service=Service.Otodom.value)
             return res
@@ -127,22 +125,21 @@ class ListingAdditionalInfoOtodom(ListingAdditionalInfo):
                 floor = -1
             else:
                 floor = int(floor_info.split("_")[-1])
-        floor_total = tg.get("Building_floors_num")
+        floor_total = to_int(tg.get("Building_floors_num"))
 
         extras = tg.get("Extras_types") or []
 
         window_info = tg.get("Windows_type") or []
-        windows = None if not window_info else window_info[0]
+        windows = None if not window_info else to_str(window_info[0])
 
-        soup_inner = BeautifulSoup(ad_info["description"], "html.parser")
-        description_long = soup_inner.get_text(separator=" ", strip=True)
+        description_long = html_to_text(ad_info["description"])
 
         top_info = ad_info.get("topInformation", [])
         available_from_li = [x for x in top_info if x.get("label") == "free_from"]
         if available_from_li:
             available_from_info = available_from_li[0].get("values", [None])
             if available_from_info:
-                available_from = available_from_info[0]
+                available_from = to_str(available_from_info[0])
             else:
                 available_from = None
         else:
@@ -153,20 +150,22 @@ class ListingAdditionalInfoOtodom(ListingAdditionalInfo):
 
         dist = dist_from_root(city, lat, lon)
 
-        inst = cls(
-            listing_id=ad_info["id"],
-            description_long=description_long,
-            deposit=tg.get("Deposit"),
-            floor=floor,
-            floors_total=floor_total,
-            has_ac="air_conditioning" in extras,
-            has_lift="lift" in extras,
-            windows=windows,
-            latitude=str(lat),
-            longitude=str(lon),
-            available_from=available_from,
-            raw_info=json.dumps(ad_info),
-            distance_from_center_km=dist,
+        inst = cls.build(
+            {
+                "listing_id": str(ad_info["id"]),
+                "description_long": description_long,
+                "deposit": to_int(tg.get("Deposit")),
+                "floor": floor,
+                "floors_total": floor_total,
+                "has_ac": "air_conditioning" in extras,
+                "has_lift": "lift" in extras,
+                "windows": windows,
+                "latitude": str(lat),
+                "longitude": str(lon),
+                "available_from": available_from,
+                "raw_info": json.dumps(ad_info),
+                "distance_from_center_km": dist,
+            }
         )
         return inst
 
@@ -185,6 +184,7 @@ class ListingAIMetadataOtodom(ListingAIMetadata):
 
 class ListingAIInfoOtodom(ListingAIInfo, ListingAIMetadataOtodom, Saveable):
     TABLE_NAME: typing.ClassVar[str] = "listing_ai_metadata"
+    MATERIALIZED_SERVICE: typing.ClassVar[str | None] = Service.Otodom.value
 
 
 def get_rooms_number(txt: str | None) -> int | None:
@@ -223,7 +223,6 @@ SEARCH_DICT = {
     "Warsaw": "https://www.otodom.pl/pl/wyniki/wynajem/mieszkanie/mazowieckie/warszawa/warszawa/warszawa?roomsNumber=%5BTHREE%2CFOUR%2CFIVE%2CSIX_OR_MORE%5D&extras=%5BGARAGE%5D&heating=%5BURBAN%5D&by=LATEST&direction=DESC&viewType=listing&page=2",
     "Krakow": "https://www.otodom.pl/pl/wyniki/wynajem/mieszkanie/malopolskie/krakow/krakow/krakow?heating=%5BURBAN%5D&by=LATEST&direction=DESC&viewType=listing&page=2&priceMax=2500",
 }
-SEARCH_URL = SEARCH_DICT[CITY]
 
 
 def update_and_reconstruct_url(url, param_name, new_value):
@@ -271,8 +270,16 @@ def update_and_reconstruct_url(url, param_name, new_value):
     return reconstructed_url
 
 
-def get_page(page_num: int) -> str:
-    updated_url = update_and_reconstruct_url(SEARCH_URL, "page", str(page_num + 1))
-    res = query_url_as_human(updated_url)
-    text = res.text
+def get_page(page_num: int, city: City) -> str:
+    updated_url = update_and_reconstruct_url(
+        SEARCH_DICT[city.name], "page", str(page_num + 1)
+    )
+    route = get_next_data_route(urlparse(updated_url).netloc)
+    text = route.fetch(updated_url, is_valid=lambda x: "data" in x)
+    return text
+
+
+def get_ad_page(url: str) -> str | None:
+    route = get_next_data_route(urlparse(url).netloc)
+    text = route.fetch(url, is_valid=lambda x: "ad" in x)
     return text
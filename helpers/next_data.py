@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import collections
+import enum
+import json
+import re
+from html.parser import HTMLParser
+
+__all__ = [
+    "ExtractionPath",
+    "extract_next_data",
+    "html_to_text",
+    "PATH_COUNTS",
+]
+
+
+class ExtractionPath(enum.Enum):
+    # Payload of the `_next/data` route, already JSON
+    Json = "json"
+    Fast = "fast"
+    Soup = "soup"
+
+
+# How many pages went through each path, to spot layout changes breaking the fast one
+PATH_COUNTS: collections.Counter[ExtractionPath] = collections.Counter()
+
+NEXT_DATA_SCRIPT_RE = re.compile(
+    r"""<script[^>]*\bid=["']?__NEXT_DATA__["']?[^>]*>""", re.IGNORECASE
+)
+SCRIPT_END = "</script>"
+
+
+def extract_next_data_fast(text: str) -> dict:
+    match = NEXT_DATA_SCRIPT_RE.search(text)
+    if match is None:
+        raise ValueError("No __NEXT_DATA__ script in the page")
+    end = text.find(SCRIPT_END, match.end())
+    if end == -1:
+        raise ValueError("Unterminated __NEXT_DATA__ script")
+    res = json.loads(text[match.end() : end])
+    return res
+
+
+def extract_next_data_soup(text: str) -> dict:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, "html.parser")
+    script = soup.find_all("script")[-1].text
+    res = json.loads(script)
+    return res
+
+
+def extract_next_data(text: str) -> tuple[dict, ExtractionPath]:
+    if text.lstrip()[:1] == "{":
+        res = json.loads(text)
+        PATH_COUNTS[ExtractionPath.Json] += 1
+        return res, ExtractionPath.Json
+    try:
+        res = extract_next_data_fast(text)
+        path = ExtractionPath.Fast
+    except ValueError:
+        # json.JSONDecodeError is a ValueError too
+        res = extract_next_data_soup(text)
+        path = ExtractionPath.Soup
+    PATH_COUNTS[path] += 1
+    return res, path
+
+
+class TextCollector(HTMLParser):
+    SKIPPED_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        data = data.strip()
+        if data:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """
+    Lightweight equivalent of BeautifulSoup(html).get_text(separator=" ", strip=True)
+    """
+    if "<" not in html and "&" not in html:
+        return html.strip()
+    collector = TextCollector()
+    collector.feed(html)
+    collector.close()
+    res = " ".join(collector.parts)
+    return res
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import collections
+import enum
+import json
+import os
+import threading
+import typing
+from urllib.parse import urlparse, urlunparse
+
+from helpers.connection import query_url_as_human
+from helpers.next_data import extract_next_data
+
+__all__ = [
+    "FetchMode",
+    "NextDataRoute",
+    "get_next_data_route",
+    "ROUTE_COUNTS",
+]
+
+
+class FetchMode(enum.Enum):
+    # `_next/data/<buildId>/...json` payload
+    Json = "json"
+    # Full rendered page, used on route failures and to learn the build id
+    Html = "html"
+
+
+# How many pages were served by each mode, a rising Html share means the route broke
+ROUTE_COUNTS: collections.Counter[FetchMode] = collections.Counter()
+
+NEXT_DATA_HEADERS = {
+    "Accept": "application/json",
+    # Makes Next.js answer redirects (e.g. removed ads) as JSON instead of following them
+    "x-nextjs-data": "1",
+}
+
+
+class NextDataRoute:
+    """
+    Fetches Next.js pages of one site through their JSON data route, falling back
+    to the HTML page. The build id is learned from the HTML `__NEXT_DATA__` and
+    relearned whenever the JSON route stops answering (a deploy rotated it).
+
+    Whatever route served the page, the returned text is understood by
+    `extract_next_data`: JSON payloads are wrapped as `{"props": payload, ...}`.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.build_id: str | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def data_url(page_url: str, build_id: str) -> str:
+        parsed = urlparse(page_url)
+        path = parsed.path.rstrip("/") or "/index"
+        res = urlunparse(
+            (
+                parsed.scheme,
+                parsed.netloc,
+                f"/_next/data/{build_id}{path}.json",
+                "",
+                parsed.query,
+                "",
+            )
+        )
+        return res
+
+    def remember_build_id(self, html: str) -> None:
+        try:
+            info, _ = extract_next_data(html)
+        except (ValueError, IndexError):
+            return None
+        build_id = info.get("buildId")
+        if build_id:
+            with self._lock:
+                self.build_id = build_id
+        return None
+
+    def forget_build_id(self, build_id: str) -> None:
+        with self._lock:
+            if self.build_id == build_id:
+                self.build_id = None
+        return None
+
+    def fetch_json(
+        self, url: str, is_valid: typing.Callable[[dict], bool]
+    ) -> str | None:
+        build_id = self.build_id
+        if not self.enabled or build_id is None:
+            return None
+        res = query_url_as_human(
+            self.data_url(url, build_id), headers=NEXT_DATA_HEADERS
+        )
+        if res is None:
+            # 404 once the build id rotates
+            self.forget_build_id(build_id)
+            return None
+        try:
+            payload = res.json()
+        except ValueError:
+            self.forget_build_id(build_id)
+            return None
+        page_props = payload.get("pageProps") or {}
+        if "__N_REDIRECT" in page_props or not is_valid(page_props):
+            # Let the HTML page follow the redirect, parsers already handle it
+            return None
+        ROUTE_COUNTS[FetchMode.Json] += 1
+        body = {"props": payload, "buildId": build_id}
+        return json.dumps(body)
+
+    def fetch(
+        self, url: str, is_valid: typing.Callable[[dict], bool] = lambda x: True
+    ) -> str | None:
+        """
+        Returns the page as JSON payload text or HTML, None if neither could be fetched
+
+        `is_valid` gets the `pageProps` of a JSON payload and tells if it has what
+        the parser needs, otherwise the HTML page is fetched instead.
+        """
+        text = self.fetch_json(url, is_valid)
+        if text is not None:
+            return text
+        res = query_url_as_human(url)
+        if res is None:
+            return None
+        ROUTE_COUNTS[FetchMode.Html] += 1
+        text = res.text
+        if self.enabled:
+            self.remember_build_id(text)
+        return text
+
+
+_ROUTES: dict[str, NextDataRoute] = {}
+_ROUTES_LOCK = threading.Lock()
+
+
+def get_next_data_route(host: str) -> NextDataRoute:
+    """
+    One build id cache per site; OTODOM_FETCH_MODE=html turns the JSON route off
+    """
+    with _ROUTES_LOCK:
+        res = _ROUTES.get(host)
+        if res is None:
+            enabled = os.environ.get("OTODOM_FETCH_MODE", "json").lower() != "html"
+            res = NextDataRoute(enabled=enabled)
+            _ROUTES[host] = res
+    return res
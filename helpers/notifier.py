@@ -1,8 +1,10 @@
+import os
 import textwrap
 
-import requests
-
-from helpers.connection import CITY
+from helpers.city import City
+from helpers.connection import get_http_client
+from helpers.db_pool import DbPool
+from helpers.metrics import timing_breakdown
 
 __all__ = [
     "send_updates",
@@ -77,12 +79,12 @@ CONDITIONS_DI = {
 
 
 def get_to_notify(
-    new_listing_ids: list[str], cursor, include_distance: True
+    new_listing_ids: list[str], cursor, city: City, include_distance: True
 ) -> list[dict]:
     placeholders = ",".join("%s" for _ in range(len(new_listing_ids)))
     column_names_list = ",\n".join(COLUMN_NAMES)
 
-    condition = CONDITIONS_DI.get((CITY, include_distance))
+    condition = CONDITIONS_DI.get((city.name, include_distance))
     if not condition:
         return []
     sql = f"""
@@ -111,7 +113,7 @@ def send_telegram_message(bot_token, chat_id, message, thread: str = None, **_):
     }
     if thread:
         payload["message_thread_id"] = thread
-    response = requests.post(url, data=payload)
+    response = get_http_client().request("POST", url, data=payload)
     return response.json()
 
 
@@ -125,7 +127,7 @@ DASHBOARD_DICT = {
 }
 
 
-def format_msg(di: dict) -> str:
+def format_msg(di: dict, city: City) -> str:
     res = """<a href="{url}">A new apt</a> just dropped, and it seems to be 🔥:
     Name: {title}
     Price: {total_rent_price}
@@ -138,16 +140,17 @@ def format_msg(di: dict) -> str:
     Location: <a href="https://www.google.com/maps/dir/{center}/{latitude},{longitude}">Maps</a>
     Metabase link: <a href="https://metabase.home.arpa/dashboard/{dash}?bedrooms=&decision=&listing_id={listing_id}&not_okazjonalny=&not_pets=&distance_from_center_max=&price_max=&not_separate_kitchen=&rooms=&undecided%253F=">Metabase</a>
     """.format(
-        center=CENTER_DICT[CITY], dash=DASHBOARD_DICT[CITY], **di
+        center=CENTER_DICT[city.name], dash=DASHBOARD_DICT[city.name], **di
     )
     return res
 
 
-def send_updates(info: list[tuple[str, str]], cursor, tg_info) -> None:
+def send_updates(info: list[tuple[str, str]], pool: DbPool, city: City) -> None:
     if not info:
         return None
 
     ids = [x[0] for x in info]
+    tg_info = city.tg_info()
 
     for include_distance in (True, False):
         thread = (
@@ -155,49 +158,68 @@ def send_updates(info: list[tuple[str, str]], cursor, tg_info) -> None:
             if include_distance
             else tg_info["update_no_distance_thread"]
         )
-        to_notify_dicts = get_to_notify(ids, cursor, include_distance=include_distance)
-        messages = [format_msg(di) for di in to_notify_dicts]
+        to_notify_dicts = pool.run(
+            lambda cursor: get_to_notify(
+                ids, cursor, city, include_distance=include_distance
+            )
+        )
+        messages = [format_msg(di, city) for di in to_notify_dicts]
         for msg in messages:
             send_telegram_message(**tg_info, message=msg, thread=thread)
 
     return None
 
 
-def format_status_msg(info: list[tuple[str, str]], service: Service) -> str:
+def format_status_msg(
+    info: list[tuple[str, str]], service: Service, city: City
+) -> str:
     res = textwrap.dedent(
         """\
     Done updating from {service} for {city}!
     Parsed ads: {n_ads}\
     """
-    ).format(n_ads=len(info), city=CITY, service=service.name)
+    ).format(n_ads=len(info), city=city.name, service=service.name)
     return res
 
 
-def send_status_update(info: list[tuple[str, str]], tg_info, service) -> None:
-    msg = format_status_msg(info, service)
+def send_status_update(
+    info: list[tuple[str, str]],
+    city: City,
+    service,
+    include_timings: bool | None = None,
+) -> None:
+    if include_timings is None:
+        include_timings = os.environ.get("STATUS_TIMINGS", "0") == "1"
+    tg_info = city.tg_info()
+    msg = format_status_msg(info, service, city)
+    if include_timings:
+        msg = f"{msg}\nTimings:\n{timing_breakdown()}"
     send_telegram_message(
         **tg_info, message=msg, thread=tg_info["update_status_thread"]
     )
     return None
 
 
-def format_status_msg_alive(alive: list[str], dead: list[str], service: Service) -> str:
+def format_status_msg_alive(
+    alive: list[str], dead: list[str], service: Service, city: City
+) -> str:
     res = textwrap.dedent(
         """\
     Done live-checking from {service} for {city}!
     Still alive ads: {n_alive}
     Dead ads: {n_dead}.\
     """.format(
-            n_alive=len(alive), n_dead=len(dead), city=CITY, service=service.value
+            n_alive=len(alive), n_dead=len(dead), city=city.name, service=service.value
         )
     )
     return res
 
 
 def send_status_update_alive(
-    alive: list[str], dead: list[str], tg_info, service: Service
+    alive: list[str], dead: list[str], city: City, service: Service
 ) -> None:
-    msg = format_status_msg_alive(alive, dead, service=service)
+    tg_info = city.tg_info()
+    msg = format_status_msg_alive(alive, dead, service=service, city=city)
     send_telegram_message(
         **tg_info, message=msg, thread=tg_info["update_status_thread"]
     )
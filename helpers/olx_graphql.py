@@ -1,5 +1,120 @@
+import re
+import typing
+
 OLX_QUERY = 'query ListingSearchQuery(\n  $searchParameters: [SearchParameter!] = {key: "", value: ""}\n) {\n  clientCompatibleListings(searchParameters: $searchParameters) {\n    __typename\n    ... on ListingSuccess {\n      __typename\n      data {\n        id\n        location {\n          city {\n            id\n            name\n            normalized_name\n            _nodeId\n          }\n          district {\n            id\n            name\n            normalized_name\n            _nodeId\n          }\n          region {\n            id\n            name\n            normalized_name\n            _nodeId\n          }\n        }\n        last_refresh_time\n        delivery {\n          rock {\n            active\n            mode\n            offer_id\n          }\n        }\n        created_time\n        category {\n          id\n          type\n          _nodeId\n        }\n        contact {\n          courier\n          chat\n          name\n          negotiation\n          phone\n        }\n        business\n        omnibus_pushup_time\n        photos {\n          link\n          height\n          rotation\n          width\n        }\n        promotion {\n          highlighted\n          top_ad\n          options\n          premium_ad_page\n          urgent\n          b2c_ad_page\n        }\n        protect_phone\n        shop {\n          subdomain\n        }\n        title\n        status\n        url\n        user {\n          id\n          uuid\n          _nodeId\n          about\n          b2c_business_page\n          banner_desktop\n          banner_mobile\n          company_name\n          created\n          is_online\n          last_seen\n          logo\n          logo_ad_page\n          name\n          other_ads_enabled\n          photo\n          seller_type\n          social_network_account_type\n        }\n        offer_type\n        params {\n          key\n          name\n          type\n          value {\n            __typename\n            ... on GenericParam {\n              key\n              label\n            }\n            ... on CheckboxesParam {\n              label\n              checkboxParamKey: key\n            }\n            ... on PriceParam {\n              value\n              type\n              previous_value\n              previous_label\n              negotiable\n              label\n              currency\n              converted_value\n              converted_previous_value\n              converted_currency\n              arranged\n              budget\n            }\n            ... on SalaryParam {\n              from\n              to\n              arranged\n              converted_currency\n              converted_from\n              converted_to\n              currency\n              gross\n              type\n            }\n            ... on ErrorParam {\n              message\n            }\n          }\n        }\n        _nodeId\n        description\n        external_url\n        key_params\n        partner {\n          code\n        }\n        map {\n          lat\n          lon\n          radius\n          show_detailed\n          zoom\n        }\n        safedeal {\n          allowed_quantity\n          weight_grams\n        }\n        valid_to_time\n      }\n      metadata {\n        filter_suggestions {\n          category\n          label\n          name\n          type\n          unit\n          values {\n            label\n            value\n          }\n          constraints {\n            type\n          }\n          search_label\n        }\n        x_request_id\n        search_id\n        total_elements\n        visible_total_count\n        source\n        search_suggestion {\n          url\n          type\n          changes {\n            category_id\n            city_id\n            distance\n            district_id\n            query\n            region_id\n            strategy\n            excluded_category_id\n          }\n        }\n        facets {\n          category {\n            id\n            count\n            label\n            url\n          }\n          category_id_1 {\n            count\n            id\n            label\n            url\n          }\n          category_id_2 {\n            count\n            id\n            label\n            url\n          }\n          category_without_exclusions {\n            count\n            id\n            label\n            url\n          }\n          category_id_3_without_exclusions {\n            id\n            count\n            label\n            url\n          }\n          city {\n            count\n            id\n            label\n            url\n          }\n          district {\n            count\n            id\n            label\n            url\n          }\n          owner_type {\n            count\n            id\n            label\n            url\n          }\n          region {\n            id\n            count\n            label\n            url\n          }\n          scope {\n            id\n            count\n            label\n            url\n          }\n        }\n        new\n        promoted\n      }\n      links {\n        first {\n          href\n        }\n        next {\n          href\n        }\n        previous {\n          href\n        }\n        self {\n          href\n        }\n      }\n    }\n    ... on ListingError {\n      __typename\n      error {\n        code\n        detail\n        status\n        title\n        validation {\n          detail\n          field\n          title\n        }\n      }\n    }\n  }\n}\n'
 
+# Only what ListingItemOLX.from_jo_single and the partitioned crawler read,
+# OLX_QUERY stays for archival
+OLX_CRAWL_QUERY = """query ListingSearchQuery(
+  $searchParameters: [SearchParameter!] = {key: "", value: ""}
+) {
+  clientCompatibleListings(searchParameters: $searchParameters) {
+    __typename
+    ... on ListingSuccess {
+      data {
+        id
+        title
+        url
+        created_time
+        description
+        external_url
+        location {
+          district {
+            name
+          }
+        }
+        map {
+          lat
+          lon
+        }
+        params {
+          key
+          value {
+            ... on GenericParam {
+              key
+              label
+            }
+            ... on PriceParam {
+              value
+            }
+          }
+        }
+      }
+      metadata {
+        total_elements
+      }
+    }
+    ... on ListingError {
+      error {
+        code
+        detail
+      }
+    }
+  }
+}
+"""
+
+QUERY_PROFILES = {
+    "crawl": OLX_CRAWL_QUERY,
+    "full": OLX_QUERY,
+}
+
+GRAPHQL_TOKEN_RE = re.compile(r"\.\.\.|[A-Za-z_][A-Za-z0-9_]*|[{}:]")
+GRAPHQL_ARGUMENTS_RE = re.compile(r"\([^()]*\)")
+
+
+def _parse_selection(tokens: list[str], pos: int) -> tuple[dict, int]:
+    # `pos` points right after the opening brace
+    res = {}
+    while tokens[pos] != "}":
+        if tokens[pos] == "...":
+            # Inline fragment `... on Type { ... }`: its fields land in the parent
+            fragment, pos = _parse_selection(tokens, pos + 4)
+            _merge_selection(res, fragment)
+            continue
+        name = tokens[pos]
+        pos += 1
+        if tokens[pos] == ":":
+            # `alias: field`, the response carries the alias
+            pos += 2
+        sub = {}
+        if tokens[pos] == "{":
+            sub, pos = _parse_selection(tokens, pos + 1)
+        _merge_selection(res, {name: sub})
+    return res, pos + 1
+
+
+def _merge_selection(target: dict, source: dict) -> None:
+    for key, value in source.items():
+        _merge_selection(target.setdefault(key, {}), value)
+    return None
+
+
+def selected_paths(query: str) -> set[str]:
+    """
+    Dotted paths of every field a query selects, e.g. "clientCompatibleListings.data.id"
+    """
+    tokens = GRAPHQL_TOKEN_RE.findall(GRAPHQL_ARGUMENTS_RE.sub("", query))
+    tree, _ = _parse_selection(tokens, tokens.index("{") + 1)
+    res = set()
+    stack = [("", tree)]
+    while stack:
+        prefix, node = stack.pop()
+        for key, sub in node.items():
+            path = f"{prefix}{key}"
+            res.add(path)
+            stack.append((f"{path}.", sub))
+    return res
+
+
+def check_query_profile(name: str, required_paths: typing.Iterable[str]) -> None:
+    missing = set(required_paths) - selected_paths(QUERY_PROFILES[name])
+    if missing:
+        raise ValueError(
+            f"OLX query profile {name!r} lacks fields the parser reads: {sorted(missing)}"
+        )
+    return None
+
 SEARCH_PARAMS = {
     "Warsaw": [
         {"key": "category_id", "value": "15"},
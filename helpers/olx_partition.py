@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import math
+
+import pydantic
+
+from helpers.city import City
+from helpers.models_olx import (
+    ListingItemOLX,
+    LIMIT,
+    MAX_OFFSET,
+    OLX_QUERY_PROFILE,
+    query_search,
+)
+from helpers.metrics import get_metrics
+from helpers.models_base import Service
+from helpers.page_archive import PageKind, archive_page
+from helpers.olx_graphql import SEARCH_PARAMS, QUERY_PROFILES, check_query_profile
+
+__all__ = [
+    "PriceBand",
+    "crawl_all",
+]
+
+
+PRICE_FROM_KEY = "filter_float_price:from"
+PRICE_TO_KEY = "filter_float_price:to"
+# Bands are split on price between 0 and this, anything pricier is one open band
+PRICE_CEILING = 50_000
+# The open band is split by doubling its low end up to this price
+PRICE_LIMIT = 10_000_000
+# Items a band may hold to be crawled without subdividing it
+BAND_CAPACITY = MAX_OFFSET
+# Initial bands are sized to be this full, so few of them need subdividing
+BAND_FILL = 0.7
+# Concurrent requests; the host bucket of the scheduler still sets the pace
+WORKERS = 4
+# Tries of a band page that got no answer (throttled, 5xx, transport error)
+BAND_PAGE_ATTEMPTS = 3
+
+TOTAL_ELEMENTS_FIELD = "clientCompatibleListings.metadata.total_elements"
+
+for _profile in QUERY_PROFILES:
+    check_query_profile(_profile, [TOTAL_ELEMENTS_FIELD])
+
+
+class PriceBand(pydantic.BaseModel):
+    # Both ends inclusive, as OLX treats them; None on the high end is unbounded
+    low: int
+    high: int | None
+
+    @property
+    def splittable(self) -> bool:
+        if self.high is None:
+            return self.low < PRICE_LIMIT
+        # Splitting a band of width 1 would give back the band itself
+        return self.high - self.low >= 2
+
+    def split(self) -> list[PriceBand]:
+        # Neighbours share the middle price, so fractional prices are not lost;
+        # the resulting duplicates are dropped by listing_id
+        if self.high is None:
+            middle = max(2 * self.low, 1)
+            res = [
+                PriceBand(low=self.low, high=middle),
+                PriceBand(low=middle, high=None),
+            ]
+            return res
+        middle = (self.low + self.high) // 2
+        res = [
+            PriceBand(low=self.low, high=middle),
+            PriceBand(low=middle, high=self.high),
+        ]
+        return res
+
+    def search_params(self, base: list[dict]) -> list[dict]:
+        res = [x for x in base if x["key"] not in (PRICE_FROM_KEY, PRICE_TO_KEY)]
+        res.append({"key": PRICE_FROM_KEY, "value": str(self.low)})
+        if self.high is not None:
+            res.append({"key": PRICE_TO_KEY, "value": str(self.high)})
+        return res
+
+
+def price_range(base: list[dict]) -> PriceBand:
+    """
+    The band covered by the city search itself, e.g. Krakow caps the price
+    """
+    values = {x["key"]: x["value"] for x in base}
+    low = int(float(values.get(PRICE_FROM_KEY, 0)))
+    high = values.get(PRICE_TO_KEY)
+    res = PriceBand(low=low, high=int(float(high)) if high is not None else None)
+    return res
+
+
+def initial_bands(whole: PriceBand, total: int) -> list[PriceBand]:
+    high = whole.high if whole.high is not None else PRICE_CEILING
+    n_bands = max(1, math.ceil(total / (BAND_CAPACITY * BAND_FILL)))
+    step = max(1, math.ceil((high - whole.low) / n_bands))
+    res = [
+        PriceBand(low=low, high=min(low + step, high))
+        for low in range(whole.low, high, step)
+    ]
+    if whole.high is None:
+        res.append(PriceBand(low=PRICE_CEILING, high=None))
+    return res or [whole]
+
+
+def parse_search(text: str | None, city: str) -> tuple[list[ListingItemOLX], int]:
+    if text is None:
+        return [], 0
+    jo = json.loads(text)
+    listings = jo["data"]["clientCompatibleListings"]
+    total = (listings.get("metadata") or {}).get("total_elements") or 0
+    items = [ListingItemOLX.from_jo_single(x, city) for x in listings.get("data", [])]
+    return items, total
+
+
+def fetch_band_page(
+    band: PriceBand, base: list[dict], offset: int, profile: str, city: City
+) -> tuple[PriceBand, int, list[ListingItemOLX] | None, int]:
+    """
+    One page of a band; items are None when OLX did not answer
+    """
+    text = query_search(band.search_params(base), offset, profile)
+    if text is None:
+        return band, offset, None, 0
+    archive_page(Service.OLX.value, PageKind.Search, text, city=city.name)
+    items, total = parse_search(text, city.name)
+    return band, offset, items, total
+
+
+def crawl_all(
+    city: City,
+    search_params: list[dict] | None = None,
+    profile: str = OLX_QUERY_PROFILE,
+    workers: int = WORKERS,
+) -> list[ListingItemOLX]:
+    """
+    Crawls every listing of the search, going around the offset cap of OLX by
+    splitting it into price bands small enough to be paged through completely.
+    Bands are probed and paged concurrently; listings are deduplicated by id.
+    Pages OLX does not answer are tried BAND_PAGE_ATTEMPTS times and reported
+    if they still fail; without an answer to the first probe nothing is known
+    about the search, so that raises.
+    """
+    base = SEARCH_PARAMS[city.name] if search_params is None else search_params
+    whole = price_range(base)
+    found: dict[str, ListingItemOLX] = {}
+    truncated: list[PriceBand] = []
+    # (band, offset) of the pages that never got an answer
+    failed: list[tuple[PriceBand, int]] = []
+
+    for _ in range(BAND_PAGE_ATTEMPTS):
+        _, _, items, total = fetch_band_page(whole, base, 0, profile, city)
+        if items is not None:
+            break
+    else:
+        raise ConnectionError(
+            f"OLX search of {city.name} got no answer in {BAND_PAGE_ATTEMPTS} tries"
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        attempts: dict[tuple[int, int | None, int], int] = {}
+
+        def submit(band: PriceBand, offset: int) -> concurrent.futures.Future:
+            key = (band.low, band.high, offset)
+            attempts[key] = attempts.get(key, 0) + 1
+            return pool.submit(fetch_band_page, band, base, offset, profile, city)
+
+        def follow_up(band: PriceBand, total: int) -> set[concurrent.futures.Future]:
+            # The first page of a band tells how the rest of it should be crawled
+            if total > BAND_CAPACITY and band.splittable:
+                return {submit(x, 0) for x in band.split()}
+            if total > BAND_CAPACITY:
+                truncated.append(band)
+            last_offset = min(total - 1, MAX_OFFSET)
+            return {submit(band, x) for x in range(LIMIT, last_offset + 1, LIMIT)}
+
+        found.update((x.listing_id, x) for x in items)
+        if total > BAND_CAPACITY and whole.high != whole.low:
+            pending = {submit(x, 0) for x in initial_bands(whole, total)}
+        else:
+            pending = follow_up(whole, total)
+
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                band, offset, items, total = future.result()
+                if items is None:
+                    if attempts[(band.low, band.high, offset)] < BAND_PAGE_ATTEMPTS:
+                        pending.add(submit(band, offset))
+                    else:
+                        failed.append((band, offset))
+                    continue
+                found.update((x.listing_id, x) for x in items)
+                if offset == 0:
+                    pending |= follow_up(band, total)
+
+    if truncated:
+        print(f"OLX price bands too dense to crawl completely: {truncated}")
+    if failed:
+        # A failed first page (offset 0) also loses the rest of its band
+        print(f"OLX band pages left out, no answer after retries: {failed}")
+        get_metrics().inc("olx_band_pages_failed_total", len(failed), city=city.name)
+    res = list(found.values())
+    return res
@@ -0,0 +1,442 @@
+from __future__ import annotations
+
+import datetime
+import hashlib
+import importlib.util
+import os
+import sqlite3
+import threading
+import time
+import typing
+import zlib
+
+import pydantic
+
+__all__ = [
+    "ArchivedPage",
+    "PageArchive",
+    "archive_page",
+    "get_page_archive",
+    "PageKind",
+]
+
+
+# Pages fetched longer ago are dropped, PAGE_ARCHIVE_RETENTION_DAYS overrides it
+DEFAULT_RETENTION_DAYS = 90
+# A long-running process prunes the archive at most this often
+PRUNE_EVERY_S = 24 * 3600
+# Archived pages of one (service, kind) a shared dictionary is trained on; they
+# add up across runs, a cron run stopped by the watermark fetches just a few
+DICT_TRAINING_SAMPLES = 200
+# Only the start of a page goes into the training set, the shell repeats there
+DICT_SAMPLE_BYTES = 64 * 1024
+ZSTD_DICT_SIZE = 112 * 1024
+ZSTD_LEVEL = 10
+# zlib only looks back 32 KiB, a longer preset dictionary would be wasted
+ZLIB_DICT_SIZE = 32 * 1024
+ZLIB_LEVEL = 9
+
+
+class PageKind:
+    Search = "search"
+    Ad = "ad"
+
+
+def _zstd_available() -> bool:
+    return importlib.util.find_spec("zstandard") is not None
+
+
+class ArchivedPage(pydantic.BaseModel):
+    service: str
+    kind: str
+    listing_id: str | None
+    url: str | None
+    fetched_at: datetime.datetime
+    sha256: str
+    # None for pages archived before one process served several cities
+    city: str | None = None
+
+
+class Codec:
+    """
+    zstd when `zstandard` is installed, zlib otherwise; both with a dictionary
+    trained on earlier pages of the same service and kind, as the markup and
+    JSON keys repeat from page to page
+    """
+
+    def __init__(self, name: str, dictionary: bytes | None):
+        self.name = name
+        self.dictionary = dictionary
+        self.dict_id = (
+            hashlib.sha256(dictionary).hexdigest()[:16] if dictionary else ""
+        )
+
+    @staticmethod
+    def train(name: str, samples: list[bytes]) -> bytes | None:
+        samples = [x[:DICT_SAMPLE_BYTES] for x in samples if x]
+        if not samples:
+            return None
+        if name == "zstd":
+            import zstandard
+
+            try:
+                return zstandard.train_dictionary(ZSTD_DICT_SIZE, samples).as_bytes()
+            except zstandard.ZstdError as e:
+                print(f"Could not train a page archive dictionary: {e}")
+                return None
+        # zlib has no trainer: the heads of a few pages carry the shared markup
+        picked = samples[:: max(1, len(samples) // 8)][:8]
+        res = b"".join(x[: ZLIB_DICT_SIZE // len(picked)] for x in picked)
+        return res[-ZLIB_DICT_SIZE:]
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            import zstandard
+
+            kwargs = {}
+            if self.dictionary:
+                kwargs["dict_data"] = zstandard.ZstdCompressionDict(self.dictionary)
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL, **kwargs).compress(data)
+        kwargs = {"zdict": self.dictionary} if self.dictionary else {}
+        compressor = zlib.compressobj(ZLIB_LEVEL, **kwargs)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            import zstandard
+
+            kwargs = {}
+            if self.dictionary:
+                kwargs["dict_data"] = zstandard.ZstdCompressionDict(self.dictionary)
+            return zstandard.ZstdDecompressor(**kwargs).decompress(data)
+        kwargs = {"zdict": self.dictionary} if self.dictionary else {}
+        decompressor = zlib.decompressobj(**kwargs)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class PageArchive:
+    """
+    Content-addressed store of fetched pages on local disk:
+
+    - blobs/<2 hex>/<2 hex>/<sha256>: the compressed page, stored once however
+      often it was fetched, starting with a "<codec>:<dictionary id>" line
+    - dicts/<dictionary id>: the shared dictionaries
+    - index.sqlite3: (service, kind, listing_id, url, fetched_at, city) -> sha256
+    """
+
+    def __init__(
+        self,
+        root: str,
+        codec_name: str | None = None,
+        retention_days: float | None = DEFAULT_RETENTION_DAYS,
+    ):
+        self.root = root
+        self.codec_name = codec_name or ("zstd" if _zstd_available() else "zlib")
+        self.retention_days = retention_days
+        self._codecs: dict[str, Codec] = {}
+        # (service, kind) whose dictionary could not be trained in this process
+        self._training_failed: set[tuple[str, str]] = set()
+        self._pruned_at: float | None = None
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "dicts"), exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(root, "index.sqlite3"), check_same_thread=False
+        )
+        self._conn.execute(
+            """
+            create table if not exists pages (
+                service text not null,
+                kind text not null,
+                listing_id text,
+                url text,
+                fetched_at text not null,
+                sha256 text not null,
+                city text
+            )
+            """
+        )
+        columns = [x[1] for x in self._conn.execute("pragma table_info(pages)")]
+        if "city" not in columns:
+            self._conn.execute("alter table pages add column city text")
+        self._conn.execute(
+            """
+            create index if not exists pages_listing
+            on pages (service, listing_id, fetched_at)
+            """
+        )
+        self._conn.execute(
+            """
+            create index if not exists pages_kind
+            on pages (service, kind, fetched_at)
+            """
+        )
+        self._conn.execute(
+            "create index if not exists pages_sha256 on pages (sha256)"
+        )
+        self._conn.execute(
+            """
+            create table if not exists dictionaries (
+                service text not null,
+                kind text not null,
+                codec text not null,
+                dict_id text not null,
+                primary key (service, kind, codec)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "blobs", sha256[:2], sha256[2:4], sha256)
+
+    def _dict_path(self, dict_id: str) -> str:
+        return os.path.join(self.root, "dicts", dict_id)
+
+    def _codec(self, codec_name: str, dict_id: str) -> Codec:
+        key = f"{codec_name}:{dict_id}"
+        codec = self._codecs.get(key)
+        if codec is None:
+            dictionary = None
+            if dict_id:
+                with open(self._dict_path(dict_id), "rb") as f:
+                    dictionary = f.read()
+            codec = self._codecs[key] = Codec(codec_name, dictionary)
+        return codec
+
+    def _read_blob(self, sha256: str) -> bytes:
+        with open(self._blob_path(sha256), "rb") as f:
+            header, payload = f.read().split(b"\n", 1)
+        codec_name, dict_id = header.decode("ascii").split(":")
+        return self._codec(codec_name, dict_id).decompress(payload)
+
+    def _training_samples(self, service: str, kind: str) -> list[bytes]:
+        """
+        The latest distinct pages of (service, kind) already in the archive,
+        or nothing while there are fewer than DICT_TRAINING_SAMPLES
+        """
+        rows = self._conn.execute(
+            """
+            select sha256 from pages
+            where service = ? and kind = ?
+            group by sha256
+            order by max(fetched_at) desc
+            limit ?
+            """,
+            (service, kind, DICT_TRAINING_SAMPLES),
+        ).fetchall()
+        if len(rows) < DICT_TRAINING_SAMPLES:
+            return []
+        res = []
+        for (sha256,) in rows:
+            try:
+                res.append(self._read_blob(sha256)[:DICT_SAMPLE_BYTES])
+            except Exception as e:
+                print(f"Skipping archived page {sha256} for training: {e}")
+        return res
+
+    def _write_codec(self, service: str, kind: str) -> Codec:
+        """
+        The codec new pages of (service, kind) are written with; trains the
+        dictionary once enough pages of it are archived, over however many runs
+        """
+        row = self._conn.execute(
+            "select dict_id from dictionaries where service = ? and kind = ? and codec = ?",
+            (service, kind, self.codec_name),
+        ).fetchone()
+        if row is not None:
+            return self._codec(self.codec_name, row[0])
+        if (service, kind) in self._training_failed:
+            return self._codec(self.codec_name, "")
+
+        samples = self._training_samples(service, kind)
+        if not samples:
+            return self._codec(self.codec_name, "")
+
+        dictionary = Codec.train(self.codec_name, samples)
+        if dictionary is None:
+            # Not retried on every put: that would read the samples back each time
+            self._training_failed.add((service, kind))
+            return self._codec(self.codec_name, "")
+        codec = Codec(self.codec_name, dictionary)
+        with open(self._dict_path(codec.dict_id), "wb") as f:
+            f.write(dictionary)
+        self._codecs[f"{self.codec_name}:{codec.dict_id}"] = codec
+        self._conn.execute(
+            "insert or replace into dictionaries values (?, ?, ?, ?)",
+            (service, kind, self.codec_name, codec.dict_id),
+        )
+        return codec
+
+    def put(
+        self,
+        service: str,
+        kind: str,
+        text: str,
+        url: str | None = None,
+        listing_id: str | int | None = None,
+        fetched_at: datetime.datetime | None = None,
+        city: str | None = None,
+    ) -> str:
+        data = text.encode("utf-8")
+        sha256 = hashlib.sha256(data).hexdigest()
+        fetched_at = fetched_at or datetime.datetime.now()
+        path = self._blob_path(sha256)
+        with self._lock:
+            if not os.path.exists(path):
+                codec = self._write_codec(service, kind)
+                header = f"{codec.name}:{codec.dict_id}\n".encode("ascii")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(header + codec.compress(data))
+                os.replace(tmp_path, path)
+            self._conn.execute(
+                "insert into pages values (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    service,
+                    kind,
+                    None if listing_id is None else str(listing_id),
+                    url,
+                    fetched_at.isoformat(sep=" "),
+                    sha256,
+                    city,
+                ),
+            )
+            self._conn.commit()
+            self._maybe_prune()
+        return sha256
+
+    def _maybe_prune(self) -> None:
+        if self.retention_days is None:
+            return None
+        now = time.monotonic()
+        if self._pruned_at is not None and now - self._pruned_at < PRUNE_EVERY_S:
+            return None
+        self._pruned_at = now
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.retention_days)
+        self.prune(cutoff)
+        return None
+
+    def prune(self, older_than: datetime.datetime) -> int:
+        """
+        Drops the index entries fetched before `older_than` and the blobs no
+        entry points to any more; returns the number of blobs removed. The
+        caller holds the lock.
+        """
+        cutoff = older_than.isoformat(sep=" ")
+        candidates = [
+            x[0]
+            for x in self._conn.execute(
+                "select distinct sha256 from pages where fetched_at < ?", (cutoff,)
+            ).fetchall()
+        ]
+        self._conn.execute("delete from pages where fetched_at < ?", (cutoff,))
+        self._conn.commit()
+        removed = 0
+        for sha256 in candidates:
+            referenced = self._conn.execute(
+                "select 1 from pages where sha256 = ? limit 1", (sha256,)
+            ).fetchone()
+            if referenced is not None:
+                continue
+            try:
+                os.remove(self._blob_path(sha256))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            print(f"Pruned {removed} archived pages fetched before {cutoff}")
+        return removed
+
+    def read(self, sha256: str) -> str:
+        with open(self._blob_path(sha256), "rb") as f:
+            header, payload = f.read().split(b"\n", 1)
+        codec_name, dict_id = header.decode("ascii").split(":")
+        with self._lock:
+            codec = self._codec(codec_name, dict_id)
+        return codec.decompress(payload).decode("utf-8")
+
+    def pages(
+        self,
+        service: str,
+        kind: str,
+        since: datetime.datetime | None = None,
+        latest_only: bool = True,
+        city: str | None = None,
+    ) -> typing.Iterator[ArchivedPage]:
+        """
+        Index entries of a service and kind, oldest first; with `latest_only`
+        ads are reduced to their last fetch. With `city`, pages of other cities
+        are left out, pages archived without a city are kept.
+        """
+        since_text = since.isoformat(sep=" ") if since else ""
+        city_filter = "and (city = ? or city is null)" if city is not None else ""
+        if latest_only and kind == PageKind.Ad:
+            sql = f"""
+            select service, kind, listing_id, url, max(fetched_at), sha256, city
+            from pages
+            where service = ? and kind = ? and fetched_at >= ? {city_filter}
+            group by listing_id
+            order by 5
+            """
+        else:
+            sql = f"""
+            select service, kind, listing_id, url, fetched_at, sha256, city
+            from pages
+            where service = ? and kind = ? and fetched_at >= ? {city_filter}
+            order by fetched_at
+            """
+        params = (service, kind, since_text) + ((city,) if city is not None else ())
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        fields = list(ArchivedPage.model_fields)
+        for row in rows:
+            yield ArchivedPage(**dict(zip(fields, row)))
+
+
+_ARCHIVE: PageArchive | None = None
+_ARCHIVE_LOCK = threading.Lock()
+
+
+def get_page_archive() -> PageArchive | None:
+    """
+    Returns the process-wide archive, or None unless PAGE_ARCHIVE_DIR is set
+    (e.g. to data/page_archive). PAGE_ARCHIVE_RETENTION_DAYS sets how long
+    pages are kept, 0 keeps them forever.
+    """
+    global _ARCHIVE
+    root = os.environ.get("PAGE_ARCHIVE_DIR", "")
+    if not root:
+        return None
+    with _ARCHIVE_LOCK:
+        if _ARCHIVE is None:
+            retention_days = float(
+                os.environ.get("PAGE_ARCHIVE_RETENTION_DAYS", DEFAULT_RETENTION_DAYS)
+            )
+            _ARCHIVE = PageArchive(root, retention_days=retention_days or None)
+    return _ARCHIVE
+
+
+def archive_page(
+    service: str,
+    kind: str,
+    text: str | None,
+    url: str | None = None,
+    listing_id: str | int | None = None,
+    city: str | None = None,
+) -> None:
+    """
+    Archives a fetched page if archiving is on; a full disk must not stop a crawl
+    """
+    if not text or text == "{}":
+        return None
+    archive = get_page_archive()
+    if archive is None:
+        return None
+    try:
+        archive.put(service, kind, text, url=url, listing_id=listing_id, city=city)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not archive {kind} page of {service}: {e}")
+    return None
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import atexit
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import typing
+
+from helpers.models_base import ListingGone, Saveable
+from helpers.page_archive import PageKind
+from helpers.services import Service
+
+__all__ = [
+    "ParseMode",
+    "ParseExecutor",
+    "get_parse_executor",
+    "available_cpus",
+    "make_process_pool",
+    "parse_models",
+    "parse_to_dicts",
+    "from_dicts",
+]
+
+
+class ParseMode:
+    Process = "process"
+    Inline = "inline"
+
+
+# Tags of the parsed records, telling the parent which model to rebuild
+ITEM = "item"
+GONE = "gone"
+
+ParsedRecord = tuple[str, dict]
+
+
+def available_cpus() -> int:
+    # Honours the CPU set of the container, unlike os.cpu_count
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def make_process_pool(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Pool of parser processes started from a forkserver (spawn where there is
+    none), never forked from the caller: the pool is made on first use, when
+    the pipeline, scheduler and HTTP threads already run, and a fork then can
+    leave a child stuck on a lock one of them held (tqdm, metrics, sqlite, ...)
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # Imported once in the server, so the workers start with them loaded
+        context.set_forkserver_preload(
+            ["helpers.parse_executor", "helpers.models_otodom", "helpers.models_olx"]
+        )
+    else:
+        context = multiprocessing.get_context("spawn")
+    res = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=context
+    )
+    return res
+
+
+def parse_models(
+    service: Service,
+    kind: str,
+    text: str | None,
+    city: str,
+    listing_id: str | None = None,
+) -> list[Saveable]:
+    if kind == PageKind.Search:
+        return service.listing_item_model_class.from_text(text, city)
+    if text is None:
+        return [ListingGone(listing_id=listing_id, service=service.value)]
+    metadata = service.listing_metadata_model_class.from_text(
+        text=text, listing_id=listing_id, city=city
+    )
+    return [metadata]
+
+
+def parse_to_dicts(
+    service_value: str,
+    kind: str,
+    data: bytes | None,
+    city: str,
+    listing_id: str | None = None,
+) -> list[ParsedRecord]:
+    """
+    Runs in a worker process: parses a page and returns the records as plain
+    dicts, which cross the process boundary much cheaper than models. The
+    field values are taken as they are, not through model_dump, which would
+    leave out the exclude=True fields (OLX created_on feeds the watermark).
+    """
+    text = data.decode("utf-8") if data is not None else None
+    res = [
+        (GONE if isinstance(x, ListingGone) else ITEM, x.__dict__)
+        for x in parse_models(Service(service_value), kind, text, city, listing_id)
+    ]
+    return res
+
+
+def from_dicts(
+    service: Service, kind: str, records: list[ParsedRecord]
+) -> list[Saveable]:
+    """
+    Models from the records of parse_to_dicts, built without a second
+    validation (see Saveable.build)
+    """
+    item_class = (
+        service.listing_item_model_class
+        if kind == PageKind.Search
+        else service.listing_metadata_model_class
+    )
+    res = [
+        (ListingGone if tag == GONE else item_class).build(data)
+        for tag, data in records
+    ]
+    return res
+
+
+class ParseExecutor:
+    """
+    Runs from_text off the calling thread: in a pool of processes, or inline
+    where forking does not pay off (small runs, debugging)
+    """
+
+    def __init__(self, mode: str = ParseMode.Process, workers: int | None = None):
+        self.mode = mode
+        self.workers = workers or available_cpus()
+        self._pool: concurrent.futures.ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = make_process_pool(self.workers)
+        return self._pool
+
+    def submit(
+        self,
+        service: Service,
+        kind: str,
+        text: str | None,
+        city: str,
+        listing_id: str | None = None,
+    ) -> concurrent.futures.Future[list[Saveable]]:
+        res: concurrent.futures.Future[list[Saveable]] = concurrent.futures.Future()
+        if self.mode == ParseMode.Inline:
+            try:
+                res.set_result(parse_models(service, kind, text, city, listing_id))
+            except Exception as e:
+                res.set_exception(e)
+            return res
+
+        data = text.encode("utf-8") if text is not None else None
+        inner = self._get_pool().submit(
+            parse_to_dicts, service.value, kind, data, city, listing_id
+        )
+
+        def rebuild(done: concurrent.futures.Future) -> None:
+            try:
+                res.set_result(from_dicts(service, kind, done.result()))
+            except Exception as e:
+                res.set_exception(e)
+
+        inner.add_done_callback(rebuild)
+        return res
+
+    def parse(
+        self,
+        service: Service,
+        kind: str,
+        text: str | None,
+        city: str,
+        listing_id: str | None = None,
+    ) -> list[Saveable]:
+        return self.submit(service, kind, text, city, listing_id).result()
+
+    def map(
+        self,
+        service: Service,
+        kind: str,
+        pages: typing.Iterable[tuple[str | None, str | None]],
+        city: str,
+    ) -> typing.Iterator[list[Saveable]]:
+        """
+        Parses (text, listing_id) pairs, yielding the results in input order
+        """
+        futures = [self.submit(service, kind, text, city, lid) for text, lid in pages]
+        for future in futures:
+            yield future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        return None
+
+
+_EXECUTOR: ParseExecutor | None = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_parse_executor() -> ParseExecutor:
+    """
+    PARSE_MODE picks process (default) or inline parsing, PARSE_WORKERS the
+    number of processes (all available cores by default)
+    """
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ParseExecutor(
+                mode=os.environ.get("PARSE_MODE", ParseMode.Process),
+                workers=int(os.environ.get("PARSE_WORKERS", 0)) or None,
+            )
+            atexit.register(_EXECUTOR.shutdown)
+    return _EXECUTOR
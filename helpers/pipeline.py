@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import queue
+import threading
+import traceback
+import typing
+
+__all__ = [
+    "Stage",
+    "Pipeline",
+]
+
+
+class _EndOfStream:
+    pass
+
+
+END_OF_STREAM = _EndOfStream()
+
+
+class Stage:
+    """
+    A step of the pipeline: `workers` threads take items from a bounded input
+    queue, apply `func` and put whatever it returns (None means "drop the
+    item") to the input queue of the next stage.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: typing.Callable[[typing.Any], typing.Any],
+        workers: int = 1,
+        queue_size: int | None = None,
+    ):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.input: queue.Queue = queue.Queue(maxsize=queue_size or 2 * workers)
+        self.next: Stage | None = None
+        self.errors = 0
+        self._alive = workers
+        self._lock = threading.Lock()
+
+    def _worker(self) -> None:
+        while True:
+            item = self.input.get()
+            if item is END_OF_STREAM:
+                break
+            try:
+                res = self.func(item)
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                print(f"Error in pipeline stage {self.name}:")
+                traceback.print_exc()
+                continue
+            if res is not None and self.next is not None:
+                # Blocks while the next stage is busy: this is the backpressure
+                self.next.input.put(res)
+
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and self.next is not None:
+            for _ in range(self.next.workers):
+                self.next.input.put(END_OF_STREAM)
+        return None
+
+    def start(self) -> list[threading.Thread]:
+        threads = [
+            threading.Thread(
+                target=self._worker, name=f"{self.name}-{i}", daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next = next_stage
+
+    def run(self, items: typing.Iterable[typing.Any]) -> None:
+        threads = []
+        for stage in self.stages:
+            threads.extend(stage.start())
+
+        first = self.stages[0]
+        for item in items:
+            first.input.put(item)
+        for _ in range(first.workers):
+            first.input.put(END_OF_STREAM)
+
+        for thread in threads:
+            thread.join()
+        return None
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import datetime
+import email.utils
+import random
+import threading
+import time
+
+import pydantic
+
+__all__ = [
+    "BucketConfig",
+    "TokenBucket",
+    "Scheduler",
+    "get_scheduler",
+    "parse_retry_after",
+    "GEMINI_BUDGET",
+    "THROTTLED_STATUSES",
+]
+
+
+class BucketConfig(pydantic.BaseModel):
+    # Requests per second to start with, and the bounds adaptation keeps it in
+    rate: float
+    min_rate: float
+    max_rate: float
+    burst: float = 1.0
+    # Random extra wait on top of every delayed request, seconds
+    jitter_s: float = 0.5
+    # Multiplicative slow-down on 429/403, additive speed-up on success
+    backoff_factor: float = 0.5
+    recovery_step: float = 0.02
+    default_retry_after_s: float = 30.0
+
+
+GEMINI_BUDGET = "gemini"
+
+BUCKETS = {
+    "www.otodom.pl": BucketConfig(rate=1.0, min_rate=0.05, max_rate=2.0, burst=2),
+    "www.olx.pl": BucketConfig(rate=1.0, min_rate=0.05, max_rate=2.0, burst=2),
+    "api.telegram.org": BucketConfig(
+        rate=1.0, min_rate=0.2, max_rate=1.0, burst=5, jitter_s=0.0
+    ),
+    GEMINI_BUDGET: BucketConfig(
+        rate=1.0,
+        min_rate=0.02,
+        max_rate=2.0,
+        jitter_s=0.2,
+        default_retry_after_s=60.0,
+    ),
+}
+DEFAULT_BUCKET = BucketConfig(rate=0.5, min_rate=0.05, max_rate=1.0)
+
+THROTTLED_STATUSES = {403, 429}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    delta = when - datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, delta.total_seconds())
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations: every caller takes a token right
+    away, possibly going into debt, and is told how long to wait for it.
+    """
+
+    def __init__(self, config: BucketConfig):
+        self.config = config
+        self.rate = config.rate
+        self.tokens = config.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            # `updated` is in the future while the host asked us to back off
+            if now > self.updated:
+                self.tokens = min(
+                    self.config.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+            self.tokens -= 1
+            wait = (self.updated - now) + max(0.0, -self.tokens) / self.rate
+        if wait > 0:
+            wait += random.uniform(0, self.config.jitter_s)
+        return wait
+
+    def throttle(self, retry_after_s: float | None) -> None:
+        retry_after_s = (
+            self.config.default_retry_after_s
+            if retry_after_s is None
+            else retry_after_s
+        )
+        with self._lock:
+            self.rate = max(self.config.min_rate, self.rate * self.config.backoff_factor)
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after_s)
+            self.updated = max(self.updated, self.paused_until)
+            # One request may go right after the pause, the rest queue behind it
+            self.tokens = min(self.tokens, 1.0)
+        return None
+
+    def pause_remaining(self) -> float:
+        """
+        Callers that reserved before a throttle was reported sleep this long extra
+        """
+        with self._lock:
+            return max(0.0, self.paused_until - time.monotonic())
+
+    def relax(self) -> None:
+        with self._lock:
+            self.rate = min(self.config.max_rate, self.rate + self.config.recovery_step)
+        return None
+
+
+class Scheduler:
+    """
+    Central politeness scheduler: callers ask for permission to hit a host (or
+    the Gemini API) and report back how the request went.
+    """
+
+    def __init__(
+        self,
+        configs: dict[str, BucketConfig] | None = None,
+        default: BucketConfig = DEFAULT_BUCKET,
+    ):
+        self.configs = BUCKETS if configs is None else configs
+        self.default = default
+        self.waited_s: collections.Counter[str] = collections.Counter()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            res = self._buckets.get(key)
+            if res is None:
+                res = TokenBucket(self.configs.get(key, self.default))
+                self._buckets[key] = res
+        return res
+
+    def _record_wait(self, key: str, waited_s: float) -> None:
+        with self._lock:
+            self.waited_s[key] += waited_s
+        return None
+
+    def acquire(self, key: str) -> float:
+        bucket = self.bucket(key)
+        wait = bucket.reserve()
+        total = wait
+        while wait > 0:
+            time.sleep(wait)
+            wait = bucket.pause_remaining()
+            total += wait
+        self._record_wait(key, total)
+        return total
+
+    async def acquire_async(self, key: str) -> float:
+        bucket = self.bucket(key)
+        wait = bucket.reserve()
+        total = wait
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = bucket.pause_remaining()
+            total += wait
+        self._record_wait(key, total)
+        return total
+
+    def feedback(
+        self, key: str, status: int | None, retry_after: str | float | None = None
+    ) -> None:
+        bucket = self.bucket(key)
+        if status in THROTTLED_STATUSES:
+            if not isinstance(retry_after, (int, float)):
+                retry_after = parse_retry_after(retry_after)
+            bucket.throttle(retry_after)
+        elif status is not None and status < 400:
+            bucket.relax()
+        return None
+
+
+_SCHEDULER: Scheduler | None = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = Scheduler()
+    return _SCHEDULER
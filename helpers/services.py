@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import enum
+import importlib
+import types
 import typing
 
 import pydantic
 
 import helpers.models_base as mb
-import helpers.models_otodom as mod
-import helpers.models_olx as mox
+
+if typing.TYPE_CHECKING:
+    from helpers.city import City
 
 __all__ = [
     "Service",
@@ -21,49 +24,76 @@ class AIQueryInfo(pydantic.BaseModel):
     text_instance_attribute: str
 
 
+# Modules with the models and page functions of each service. They are imported
+# on first use, so a runner only pays for the services it actually touches.
+SERVICE_MODULES = {
+    "otodom": "helpers.models_otodom",
+    "olx": "helpers.models_olx",
+}
+
+
 class Service(enum.Enum):
     Otodom = "otodom"
     OLX = "olx"
 
+    @property
+    def module(self) -> types.ModuleType:
+        return importlib.import_module(SERVICE_MODULES[self.value])
+
     @property
     def listing_item_model_class(self) -> typing.Type[mb.ListingItem]:
         di = {
-            self.Otodom: mod.ListingItemOtodom,
-            self.OLX: mox.ListingItemOLX,
+            self.Otodom: "ListingItemOtodom",
+            self.OLX: "ListingItemOLX",
         }
-        return di[self]
+        return getattr(self.module, di[self])
 
     @property
     def listing_metadata_model_class(self) -> typing.Type[mb.ListingAdditionalInfo]:
         di = {
-            self.Otodom: mod.ListingAdditionalInfoOtodom,
-            self.OLX: mox.ListingAdditionalInfoOLX,
+            self.Otodom: "ListingAdditionalInfoOtodom",
+            self.OLX: "ListingAdditionalInfoOLX",
         }
-        return di[self]
+        return getattr(self.module, di[self])
 
     @property
-    def get_page_function(self) -> typing.Callable[[int], str]:
+    def get_page_function(self) -> typing.Callable[[int, City], str]:
+        return self.module.get_page
+
+    @property
+    def full_crawl_function(
+        self,
+    ) -> typing.Callable[[City], list[mb.ListingItem]] | None:
+        """
+        Crawls every current listing regardless of page limits, None if unsupported
+        """
         di = {
-            self.Otodom: mod.get_page,
-            self.OLX: mox.get_page,
+            self.Otodom: None,
+            self.OLX: "helpers.olx_partition",
         }
-        return di[self]
+        if di[self] is None:
+            return None
+        return importlib.import_module(di[self]).crawl_all
+
+    @property
+    def get_ad_page_function(self) -> typing.Callable[[str], str | None]:
+        return self.module.get_ad_page
 
     @property
     def listing_ai_metadata_model_class(self) -> typing.Type[mb.ListingAIInfo]:
         di = {
-            self.Otodom: mod.ListingAIInfoOtodom,
-            self.OLX: mox.ListingAIInfoOLX,
+            self.Otodom: "ListingAIInfoOtodom",
+            self.OLX: "ListingAIInfoOLX",
         }
-        return di[self]
+        return getattr(self.module, di[self])
 
     @property
     def listing_ai_metadata_schema_class(self) -> typing.Type[mb.ListingAIMetadata]:
         di = {
-            self.Otodom: mod.ListingAIMetadataOtodom,
-            self.OLX: mox.ListingAIMetadataOLX,
+            self.Otodom: "ListingAIMetadataOtodom",
+            self.OLX: "ListingAIMetadataOLX",
         }
-        return di[self]
+        return getattr(self.module, di[self])
 
     @property
     def info_for_ai(self) -> AIQueryInfo:
@@ -84,6 +114,17 @@ class Service(enum.Enum):
         }
         return di[self]
 
+    @property
+    def host(self) -> str:
+        """
+        Host the crawl, the ad pages and the liveness probes of the service hit
+        """
+        di = {
+            self.Otodom: "www.otodom.pl",
+            self.OLX: "www.olx.pl",
+        }
+        return di[self]
+
     @property
     def ad_parsing_needed(self) -> bool:
         di = {
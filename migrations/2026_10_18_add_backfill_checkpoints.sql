@@ -0,0 +1,8 @@
+CREATE TABLE otodom.backfill_checkpoints (
+  `name` varchar(100) NOT NULL,
+  `last_key` varchar(100) NOT NULL,
+  `rows_done` int NOT NULL,
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+;
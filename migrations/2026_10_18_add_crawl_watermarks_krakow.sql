@@ -0,0 +1,8 @@
+CREATE TABLE otodom_krakow.crawl_watermarks (
+  `service` varchar(20) NOT NULL,
+  `last_listing_id` varchar(100) NOT NULL,
+  `created_on` datetime NOT NULL,
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`service`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+;
@@ -1,56 +1,40 @@
-import json
-
-import tqdm
-import typing
-
+from helpers.backfill import Backfill, json_paths
+from helpers.city import get_city
 from helpers.connection import get_db_connection, get_db_credentials
-from helpers.models_otodom import Saveable
-
 
-class ListingLocation(Saveable):
-    listing_id: int
-    latitude: str
-    longitude: str
+COORDINATES = (
+    ("location", "coordinates", "latitude"),
+    ("location", "coordinates", "longitude"),
+)
 
-    TABLE_NAME: typing.ClassVar[str] = "listing_metadata"
 
+def extract_locations(rows: list[tuple]) -> list[tuple]:
+    values = json_paths([raw_info for _, raw_info in rows], COORDINATES)
+    res = [
+        (listing_id, str(lat), str(lon))
+        for (listing_id, _), (lat, lon) in zip(rows, values)
+        if lat is not None and lon is not None
+    ]
+    return res
 
-def extract_info(listing_id: int, html_content: str | None) -> ListingLocation:
-    ad_info = json.loads(html_content)
-    loc = ListingLocation(
-        listing_id=listing_id,
-        latitude=str(ad_info["location"]["coordinates"]["latitude"]),
-        longitude=str(ad_info["location"]["coordinates"]["longitude"]),
-    )
-    return loc
 
-
-def get_infos(cursor) -> list[tuple[int, str]]:
-    query = """
-    select listing_id, raw_info
-    from listing_metadata
-        where 1=1
-        and latitude = ''
-    """
-
-    cursor.execute(query)
-    results = cursor.fetchall()
-    return results
+BACKFILL = Backfill(
+    name="listing_location",
+    table="listing_metadata",
+    source_columns=["raw_info"],
+    target_columns=["latitude", "longitude"],
+    transform=extract_locations,
+    where="latitude = ''",
+    materialized_service="otodom",
+)
 
 
 def main():
 
-    creds = get_db_credentials()
+    creds = get_db_credentials(get_city())
     conn = get_db_connection(*creds)
-    cursor = conn.cursor()
-
-    urls = get_infos(cursor)
-    for listing_id, body in tqdm.tqdm(
-        urls,
-    ):
-        metadata = extract_info(listing_id, body)
-        metadata.to_db_patch(cursor)
-    conn.commit()
+
+    BACKFILL.run(conn)
 
     conn.close()
     return None
@@ -1,61 +1,44 @@
-import json
-
-import tqdm
-import typing
+import numpy as np
 
+from helpers.backfill import Backfill, dist_from_root_array, json_paths
+from helpers.city import get_city
 from helpers.connection import get_db_connection, get_db_credentials
-from helpers.models_otodom import Saveable
-from helpers.extractor import haversine, ROOT
-
-
-class ListingLocation(Saveable):
-    listing_id: int
-    distance_from_center_km: float
-
-    TABLE_NAME: typing.ClassVar[str] = "listing_metadata"
+from one_off.fixup import COORDINATES
 
 
-def extract_info(listing_id: int, html_content: str | None) -> ListingLocation:
-    ad_info = json.loads(html_content)
-    lat = ad_info["location"]["coordinates"]["latitude"]
-    lon = ad_info["location"]["coordinates"]["longitude"]
-
-    dist = haversine(*ROOT, lat, lon)
-    loc = ListingLocation(
-        listing_id=listing_id,
-        distance_from_center_km=dist,
+def compute_distances(rows: list[tuple]) -> list[tuple]:
+    values = json_paths([raw_info for _, raw_info in rows], COORDINATES)
+    coordinates = np.array(values, dtype=float).reshape(-1, 2)
+    distances = dist_from_root_array(
+        get_city().name, coordinates[:, 0], coordinates[:, 1]
     )
-    return loc
-
-
-def get_infos(limit: int, cursor) -> list[tuple[int, str]]:
-    query = f"""
-    select listing_id, raw_info
-    from listing_metadata
-        where 1=1
-        and distance_from_center_km = 0
-    limit {limit}
-    """
-
-    cursor.execute(query)
-    results = cursor.fetchall()
-    return results
+    # Without coordinates the distance would be 0 again, those rows stay as they are
+    known = ~np.isnan(coordinates).any(axis=1)
+    res = [
+        (listing_id, float(dist))
+        for (listing_id, _), dist, ok in zip(rows, distances, known)
+        if ok
+    ]
+    return res
+
+
+BACKFILL = Backfill(
+    name="listing_distance",
+    table="listing_metadata",
+    source_columns=["raw_info"],
+    target_columns=["distance_from_center_km"],
+    transform=compute_distances,
+    where="distance_from_center_km = 0",
+    materialized_service="otodom",
+)
 
 
 def main():
 
-    creds = get_db_credentials()
+    creds = get_db_credentials(get_city())
     conn = get_db_connection(*creds)
-    cursor = conn.cursor()
 
-    while True:
-        urls = get_infos(limit=100, cursor=cursor)
-        if not urls:
-            break
-        for listing_id, body in tqdm.tqdm(urls):
-            metadata = extract_info(listing_id, body)
-            metadata.to_db_patch(cursor)
-        conn.commit()
+    BACKFILL.run(conn)
 
     conn.close()
     return None
@@ -2,8 +2,10 @@ from helpers.connection import (
     get_db_connection,
     get_db_credentials,
     get_ai_client,
-    get_tg_info,
 )
+from helpers.city import get_city
+from helpers.db_pool import get_db_pool
+from helpers.services import Service
 from helpers.extractor import process_missing_metadata, process_missing_ai_metadata
 from helpers.daily_updater import update_listings
 from helpers.notifier import send_updates, send_status_update
@@ -37,15 +39,15 @@ def process_missing(cursor, conn, ai_client) -> list[tuple[int, str]]:
 
 
 def main():
-    db_creds = get_db_credentials()
+    city = get_city()
+    db_creds = get_db_credentials(city)
     conn = get_db_connection(*db_creds)
     cursor = conn.cursor()
     ai_client = get_ai_client()
-    tg_info = get_tg_info()
 
     new_listing_info = process_missing(cursor, conn, ai_client)
-    send_updates(new_listing_info, cursor, tg_info)
-    send_status_update(new_listing_info, tg_info)
+    send_updates(new_listing_info, get_db_pool(city), city)
+    send_status_update(new_listing_info, city, Service.Otodom)
 
     conn.close()
 
@@ -2,7 +2,6 @@ from helpers.connection import (
     get_db_connection,
     get_db_credentials,
     get_ai_client,
-    get_tg_info,
 )
 from helpers.extractor import process_missing_metadata, process_missing_ai_metadata
 from helpers.daily_updater import update_listings
@@ -10,9 +10,8 @@ from helpers.connection import (
     get_db_connection,
     get_db_credentials,
     get_ai_client,
-    get_tg_info,
-    CURRENT_DATASOURCES,
 )
+from helpers.city import get_city
 from helpers.extractor import process_missing_metadata, process_missing_ai_metadata
 from helpers.daily_updater import update_listings
 from helpers.notifier import send_updates, send_status_update
@@ -26,7 +25,7 @@ PAGES = 20
 def update_listings(cursor, conn, service: Service) -> bool:
     for i in tqdm.tqdm(range(1), file=sys.stdout):
         ListingItemOLX.TABLE_NAME = "listing_items"
-        li_chunk = scrape_page(i, service)
+        li_chunk = scrape_page(i, service, get_city())
         for elem in li_chunk:
             if not elem.is_present_in_db_slug_external(cursor):
                 print(f"NOPE: https://otodom.pl/pl/oferta/{elem.slug_external}.html")
@@ -35,7 +34,7 @@ def update_listings(cursor, conn, service: Service) -> bool:
 
 
 def main():
-    db_creds = get_db_credentials()
+    db_creds = get_db_credentials(get_city())
     conn = get_db_connection(*db_creds)
     cursor = conn.cursor()
     update_listings(cursor, conn, service=Service.OLX)
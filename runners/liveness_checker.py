@@ -1,20 +1,26 @@
-from helpers.connection import get_db_connection, get_db_credentials, get_tg_info
+import typing
+
+from helpers.city import City, get_cities
+from helpers.db_pool import close_db_pools, get_db_pool
 from helpers.extractor import check_alive
 from helpers.notifier import send_status_update_alive
+from helpers.materialized import refresh_decisions
+from helpers.metrics import write_run_metrics
 from helpers.services import Service
 
 
-def main():
-    db_creds = get_db_credentials()
-    conn = get_db_connection(*db_creds)
-    cursor = conn.cursor()
-    tg_info = get_tg_info()
+def main(cities: typing.Iterable[City] = None):
+    cities = list(cities or get_cities())
+    for city in cities:
+        pool = get_db_pool(city)
+        pool.run(refresh_decisions)
 
-    for service in Service:
-        alive, dead = check_alive(cursor, conn, service)
-        send_status_update_alive(alive, dead, tg_info, service=service)
+        for service in Service:
+            alive, dead = check_alive(pool, service)
+            send_status_update_alive(alive, dead, city, service=service)
 
-    conn.close()
+    close_db_pools()
+    write_run_metrics("liveness_checker", cities[0].name if len(cities) == 1 else None)
 
     return None
 
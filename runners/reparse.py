@@ -0,0 +1,99 @@
+import datetime
+import functools
+import sys
+import typing
+
+import tqdm
+
+from helpers.city import City, get_city
+from helpers.db_pool import DbPool, get_db_pool
+from helpers.materialized import refresh_decisions
+from helpers.metrics import get_metrics, write_run_metrics
+from helpers.models_base import Saveable
+from helpers.page_archive import ArchivedPage, PageKind, get_page_archive
+from helpers.parse_executor import (
+    ParsedRecord,
+    available_cpus,
+    from_dicts,
+    make_process_pool,
+    parse_to_dicts,
+)
+from helpers.services import Service
+
+# Archived pages handed to the parser processes and saved per transaction
+REPARSE_CHUNK_SIZE = 500
+
+
+def parse_archived(page: ArchivedPage, city: str) -> list[ParsedRecord]:
+    """
+    Runs in a worker process: reads the page back from the archive and parses
+    it with the same from_text the crawl uses
+    """
+    data = get_page_archive().read(page.sha256).encode("utf-8")
+    return parse_to_dicts(page.service, page.kind, data, city, page.listing_id)
+
+
+def reparse(
+    pool: DbPool,
+    service: Service,
+    kind: str,
+    city: City,
+    since: datetime.datetime | None = None,
+    workers: int | None = None,
+) -> int:
+    """
+    Parses the archived pages of a service again and upserts the results,
+    without fetching anything. Returns the number of saved rows.
+    """
+    archive = get_page_archive()
+    if archive is None:
+        print("Page archive is disabled, nothing to reparse")
+        return 0
+    if kind == PageKind.Ad and not service.ad_parsing_needed:
+        return 0
+    pages = list(archive.pages(service.value, kind, since=since, city=city.name))
+    parse = functools.partial(parse_archived, city=city.name)
+    saved = 0
+    progress = tqdm.tqdm(total=len(pages), file=sys.stdout)
+    with make_process_pool(workers or available_cpus()) as executor:
+        for i in range(0, len(pages), REPARSE_CHUNK_SIZE):
+            chunk = pages[i : i + REPARSE_CHUNK_SIZE]
+            # Pages come oldest first, so a later fetch of a listing wins
+            items: dict[str, Saveable] = {}
+            for records in executor.map(parse, chunk, chunksize=16):
+                for item in from_dicts(service, kind, records):
+                    items[str(item.listing_id)] = item
+            if items:
+                pool.run(Saveable.bulk_to_db, list(items.values()))
+            saved += len(items)
+            progress.update(len(chunk))
+    progress.close()
+    get_metrics().inc("reparsed_rows_total", saved, service=service.value, kind=kind)
+    return saved
+
+
+def main(
+    services_to_reparse: typing.Iterable[Service] = None,
+    kinds: typing.Iterable[str] = (PageKind.Search, PageKind.Ad),
+    since: datetime.datetime | None = None,
+    workers: int | None = None,
+    city: City | None = None,
+):
+    city = city or get_city()
+    pool = get_db_pool(city)
+    services_to_reparse = services_to_reparse or list(Service)
+
+    for service in services_to_reparse:
+        for kind in kinds:
+            saved = reparse(pool, service, kind, city, since=since, workers=workers)
+            print(f"Reparsed {saved} {kind} rows of {service.value}")
+
+    pool.run(refresh_decisions)
+    pool.close()
+    write_run_metrics("reparse", city.name)
+
+    return None
+
+
+if __name__ == "__main__":
+    main()
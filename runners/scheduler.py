@@ -0,0 +1,302 @@
+"""
+Resident scheduler: runs the updater and the liveness checker of every city
+and service on an interval instead of as one-shot runs, keeping the DB pools,
+the HTTP sessions and the Gemini client warm between runs.
+
+    python -m runners.scheduler
+
+GET /health and GET /metrics on SCHEDULER_PORT report the job states and the
+Prometheus metrics of the process.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import datetime
+import http.server
+import json
+import os
+import random
+import signal
+import threading
+import time
+import typing
+
+import pydantic
+
+from helpers.city import City, get_cities
+from helpers.connection import get_ai_client
+from helpers.db_pool import close_db_pools, get_db_pool
+from helpers.extractor import check_alive
+from helpers.materialized import refresh_decisions
+from helpers.metrics import get_metrics, write_run_metrics
+from helpers.notifier import send_status_update_alive
+from helpers.services import Service
+from runners.updater import main_single_service
+
+# Seconds between runs of each task, plus up to SCHEDULE_JITTER_S at random so
+# the jobs drift apart instead of firing together
+DEFAULT_INTERVALS_S = {
+    "update": 3600.0,
+    "liveness": 6 * 3600.0,
+}
+DEFAULT_JITTER_S = 300.0
+# A job whose host is busy with the other task is looked at again after this long
+HOST_BUSY_RETRY_S = 30.0
+TICK_S = 1.0
+# /health turns unhealthy once a job failed this many times in a row
+MAX_CONSECUTIVE_FAILURES = 3
+DEFAULT_PORT = 8321
+
+
+class Task:
+    Update = "update"
+    Liveness = "liveness"
+
+
+class JobState(pydantic.BaseModel):
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    running: bool = False
+    last_started_at: datetime.datetime | None = None
+    last_finished_at: datetime.datetime | None = None
+    last_duration_s: float | None = None
+    last_error: str | None = None
+    next_run_at: datetime.datetime | None = None
+
+
+class Job(pydantic.BaseModel):
+    city: City
+    service: Service
+    task: str
+    interval_s: float
+    jitter_s: float
+    state: JobState = pydantic.Field(default_factory=JobState)
+    # time.monotonic() of the next run
+    due: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.city.name.lower()}/{self.service.value}/{self.task}"
+
+    def schedule(self, delay_s: float, jitter: bool = True) -> None:
+        if jitter:
+            delay_s += random.uniform(0, self.jitter_s)
+        self.due = time.monotonic() + delay_s
+        self.state.next_run_at = datetime.datetime.now() + datetime.timedelta(
+            seconds=delay_s
+        )
+        return None
+
+
+class Daemon:
+    def __init__(self, jobs: list[Job]):
+        self.jobs = jobs
+        self.stop = threading.Event()
+        # The jobs running against a host. Liveness probes and crawls of one host
+        # would split its politeness budget, so the two tasks take turns; jobs
+        # of the same task (other cities) run side by side, paced by the bucket
+        self._busy_hosts: dict[str, list[Job]] = {}
+        # The task turned away from a busy host: no new job of the other task
+        # starts there until it had its turn, so it cannot be starved
+        self._waiting_hosts: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._ai_client = None
+        cities = {job.city.name for job in jobs}
+        # Exported as the city of the metrics files when there is only one
+        self.metrics_city = cities.pop() if len(cities) == 1 else None
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(jobs)), thread_name_prefix="job"
+        )
+
+    @property
+    def ai_client(self):
+        with self._lock:
+            if self._ai_client is None:
+                self._ai_client = get_ai_client()
+        return self._ai_client
+
+    def _claim_host(self, job: Job) -> bool:
+        with self._lock:
+            host = job.service.host
+            holders = self._busy_hosts.setdefault(host, [])
+            if any(x.task != job.task for x in holders):
+                self._waiting_hosts.setdefault(host, job.task)
+                return False
+            if self._waiting_hosts.get(host, job.task) != job.task:
+                return False
+            self._waiting_hosts.pop(host, None)
+            holders.append(job)
+            job.state.running = True
+        return True
+
+    def _release_host(self, job: Job) -> None:
+        with self._lock:
+            holders = self._busy_hosts.get(job.service.host, [])
+            holders[:] = [x for x in holders if x is not job]
+            job.state.running = False
+        return None
+
+    def run_task(self, job: Job) -> None:
+        pool = get_db_pool(job.city)
+        pool.run(refresh_decisions)
+        if job.task == Task.Update:
+            main_single_service(True, False, pool, self.ai_client, job.city, job.service)
+        elif job.task == Task.Liveness:
+            alive, dead = check_alive(pool, job.service)
+            send_status_update_alive(alive, dead, job.city, service=job.service)
+        else:
+            raise ValueError(f"Unknown task {job.task}")
+        return None
+
+    def run_job(self, job: Job) -> None:
+        state = job.state
+        state.last_started_at = datetime.datetime.now()
+        labels = dict(city=job.city.name, service=job.service.value, task=job.task)
+        start = time.perf_counter()
+        try:
+            with get_metrics().timer("scheduled_job", **labels):
+                self.run_task(job)
+            state.consecutive_failures = 0
+            state.last_error = None
+            get_metrics().inc("scheduled_jobs_total", status="ok", **labels)
+        except Exception as e:
+            print(f"Job {job.name} failed: {e!r}")
+            state.failures += 1
+            state.consecutive_failures += 1
+            state.last_error = repr(e)
+            get_metrics().inc("scheduled_jobs_total", status="error", **labels)
+        finally:
+            state.runs += 1
+            state.last_finished_at = datetime.datetime.now()
+            state.last_duration_s = time.perf_counter() - start
+            job.schedule(job.interval_s)
+            self._release_host(job)
+            write_run_metrics("scheduler", self.metrics_city)
+        return None
+
+    def tick(self) -> None:
+        now = time.monotonic()
+        # Longest overdue first, so a job put off for a busy host gets it next
+        for job in sorted(self.jobs, key=lambda x: x.due):
+            if job.state.running or job.due > now:
+                continue
+            if not self._claim_host(job):
+                job.schedule(HOST_BUSY_RETRY_S, jitter=False)
+                continue
+            self._pool.submit(self.run_job, job)
+        return None
+
+    def health(self) -> tuple[bool, dict]:
+        ok = all(
+            job.state.consecutive_failures < MAX_CONSECUTIVE_FAILURES
+            for job in self.jobs
+        )
+        res = {
+            "ok": ok,
+            "jobs": {job.name: job.state.model_dump(mode="json") for job in self.jobs},
+            "db_pools": {
+                city.name: get_db_pool(city).stats()
+                for city in {job.city.name: job.city for job in self.jobs}.values()
+            },
+        }
+        return ok, res
+
+    def serve_forever(self) -> None:
+        # Spread the first runs over the jitter window rather than firing all at start
+        for job in self.jobs:
+            job.schedule(0)
+        while not self.stop.is_set():
+            self.tick()
+            self.stop.wait(TICK_S)
+        self._pool.shutdown(wait=True)
+        close_db_pools()
+        return None
+
+
+def make_handler(daemon: Daemon) -> type[http.server.BaseHTTPRequestHandler]:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                ok, res = daemon.health()
+                body = json.dumps(res, indent=2).encode("utf-8")
+                self._reply(200 if ok else 503, "application/json", body)
+            elif self.path == "/metrics":
+                metrics = get_metrics()
+                metrics.collect_sources()
+                text = metrics.to_prometheus({"runner": "scheduler"})
+                self._reply(200, "text/plain; version=0.0.4", text.encode("utf-8"))
+            else:
+                self._reply(404, "text/plain", b"not found\n")
+
+        def _reply(self, status: int, content_type: str, body: bytes) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return None
+
+    return Handler
+
+
+def build_jobs(
+    cities: typing.Iterable[City] | None = None,
+    services: typing.Iterable[Service] | None = None,
+    tasks: typing.Iterable[str] = (Task.Update, Task.Liveness),
+) -> list[Job]:
+    """
+    One job per (city, service, task), for the cities of get_cities by default;
+    SCHEDULE_<TASK>_INTERVAL_S and SCHEDULE_JITTER_S override the timings
+    """
+    cities = list(cities or get_cities())
+    jitter_s = float(os.environ.get("SCHEDULE_JITTER_S", DEFAULT_JITTER_S))
+    res = [
+        Job(
+            city=city,
+            service=service,
+            task=task,
+            interval_s=float(
+                os.environ.get(
+                    f"SCHEDULE_{task.upper()}_INTERVAL_S", DEFAULT_INTERVALS_S[task]
+                )
+            ),
+            jitter_s=jitter_s,
+        )
+        for city in cities
+        for service in (services or city.services)
+        for task in tasks
+    ]
+    return res
+
+
+def main(jobs: list[Job] | None = None):
+    daemon = Daemon(jobs or build_jobs())
+    server = http.server.ThreadingHTTPServer(
+        (
+            os.environ.get("SCHEDULER_HOST", "127.0.0.1"),
+            int(os.environ.get("SCHEDULER_PORT", DEFAULT_PORT)),
+        ),
+        make_handler(daemon),
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def shutdown(signum, frame):
+        print(f"Got signal {signum}, stopping after the running jobs")
+        daemon.stop.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    print(f"Scheduling {', '.join(job.name for job in daemon.jobs)}")
+    daemon.serve_forever()
+    server.shutdown()
+    write_run_metrics("scheduler", daemon.metrics_city)
+
+    return None
+
+
+if __name__ == "__main__":
+    main()
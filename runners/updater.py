@@ -1,68 +1,127 @@
+import concurrent.futures
+import sys
+import traceback
 import typing
 
-from helpers.connection import (
-    get_db_connection,
-    get_db_credentials,
-    get_ai_client,
-    get_tg_info,
-    CURRENT_DATASOURCES,
-)
+from helpers.city import City, get_cities
+from helpers.connection import get_ai_client
+from helpers.db_pool import DbPool, close_db_pools, get_db_pool
 from helpers.extractor import process_missing_metadata, process_missing_ai_metadata
-from helpers.daily_updater import update_listings
+from helpers.daily_updater import update_listings, resync_listings
 from helpers.notifier import send_updates, send_status_update
+from helpers.materialized import refresh_decisions
+from helpers.metrics import get_metrics, write_run_metrics
 from helpers.services import Service
 
 
 def main_single_service(
     update_listings_switch,
     metadata_update_only_ai_switch,
-    conn,
-    cursor,
+    pool: DbPool,
     ai_client,
-    tg_info,
+    city: City,
     service: Service,
+    full_resync_switch: bool = False,
 ) -> None:
-    if update_listings_switch:
-        update_listings(cursor, conn, service)
+    if full_resync_switch:
+        resync_listings(pool, service, city)
+    elif update_listings_switch:
+        update_listings(pool, service, city)
 
     md_func = (
         process_missing_ai_metadata
         if metadata_update_only_ai_switch or not service.ad_parsing_needed
         else process_missing_metadata
     )
-    new_listing_info = md_func(cursor, conn, ai_client, service)
-    send_updates(new_listing_info, cursor, tg_info)
-    send_status_update(new_listing_info, tg_info, service)
+    new_listing_info = md_func(pool, ai_client, service, city)
+    send_updates(new_listing_info, pool, city)
+    send_status_update(new_listing_info, city, service)
     return None
 
 
-def main(
-    update_listings_switch: bool = True,
-    metadata_update_only_ai_switch: bool = False,
-    services_to_update: typing.Iterable[Service] = None,
-):
-    db_creds = get_db_credentials()
-    conn = get_db_connection(*db_creds)
-    cursor = conn.cursor()
-    ai_client = get_ai_client()
-    tg_info = get_tg_info()
-    services_to_update = services_to_update or [Service(x) for x in CURRENT_DATASOURCES]
-
-    for service in services_to_update:
+def run_service(
+    update_listings_switch,
+    metadata_update_only_ai_switch,
+    ai_client,
+    city: City,
+    service: Service,
+    full_resync_switch: bool = False,
+) -> None:
+    """
+    main_single_service with timing, so services can run side by side; they
+    share the pool of their city, each write on a connection of its own
+    """
+    with get_metrics().timer("updater_service", city=city.name, service=service.value):
         main_single_service(
             update_listings_switch,
             metadata_update_only_ai_switch,
-            conn,
-            cursor,
+            get_db_pool(city),
             ai_client,
-            tg_info,
+            city,
             service,
+            full_resync_switch,
         )
+    return None
 
-    conn.close()
 
-    return None
+def main(
+    update_listings_switch: bool = True,
+    metadata_update_only_ai_switch: bool = False,
+    services_to_update: typing.Iterable[Service] = None,
+    full_resync_switch: bool = False,
+    cities: typing.Iterable[City] = None,
+) -> list[tuple[City, Service]]:
+    """
+    Updates every (city, service) in its own thread; the services hit different
+    hosts and meet only in the DB and in the shared budgets of the rate limiter.
+    A failing service does not stop the others. Returns the ones that failed.
+    """
+    cities = list(cities or get_cities())
+    services_to_update = list(services_to_update or [])
+    ai_client = get_ai_client()
+    for city in cities:
+        get_db_pool(city).run(refresh_decisions)
+
+    tasks = [
+        (city, service)
+        for city in cities
+        for service in (services_to_update or city.services)
+    ]
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(tasks), thread_name_prefix="updater"
+    ) as pool:
+        futures = {
+            pool.submit(
+                run_service,
+                update_listings_switch,
+                metadata_update_only_ai_switch,
+                ai_client,
+                city,
+                service,
+                full_resync_switch,
+            ): (city, service)
+            for city, service in tasks
+        }
+        for future in concurrent.futures.as_completed(futures):
+            city, service = futures[future]
+            try:
+                future.result()
+            except Exception:
+                print(f"Update of {service.value} for {city.name} failed:")
+                traceback.print_exc()
+                failed.append((city, service))
+                get_metrics().inc(
+                    "updater_service_failures_total",
+                    city=city.name,
+                    service=service.value,
+                )
+
+    close_db_pools()
+    write_run_metrics("updater", cities[0].name if len(cities) == 1 else None)
+
+    return failed
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(1 if main() else 0)